@@ -17,13 +17,42 @@ Key env vars (all optional, sensible defaults shown):
   GRACEFUL_TIMEOUT       – graceful quit s     (default: 30)
   ASCEND_NUM_DEVICES     – physical NPU count  (default: 4)
                            workers are round-robin assigned across this many NPUs.
+  SENTINELSHIELD_INFERENCE_REPLICAS
+                         – split mode          (default: 0 = models in workers)
+                           when > 0 the master starts this many inference
+                           server processes (one per NPU, round-robin) and the
+                           HTTP workers reach them over Unix sockets, so
+                           WEB_CONCURRENCY no longer equals the model count.
+                           Workers are only spawned once every replica has
+                           answered a readiness ping. A replica that dies is
+                           restarted; after too many restarts the master shuts
+                           down rather than serve without models.
+  SENTINELSHIELD_INFERENCE_READY_TIMEOUT_S
+                         – model load budget   (default: 600)
+  SENTINELSHIELD_INFERENCE_MAX_RESTARTS
+                         – restarts per replica within
+                           SENTINELSHIELD_INFERENCE_RESTART_WINDOW_S
+                                               (default: 5 within 300 s)
+  PROMETHEUS_MULTIPROC_DIR
+                         – metrics store       (default: /tmp/sentinelshield/metrics)
+                           workers write Prometheus samples here; /metrics on
+                           any worker aggregates all of them. Wiped at start.
 
 DO NOT use --preload-app / preload_app=True together with this file.
 The post_fork hook must run before the app modules are imported so that
 the module-level provider singletons pick up the correct device.
 """
 
+import json
 import os
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
 
 # ---------------------------------------------------------------------------
 # Server mechanics
@@ -64,3 +93,185 @@ def post_fork(server, worker):
     os.environ["SENTINELSHIELD_PROMPT_GUARD_DEVICE"] = f"npu:{npu_id}"
 
     server.log.info("Worker %s → device npu:%s", worker.age, npu_id)
+
+
+# ---------------------------------------------------------------------------
+# Prometheus multiprocess store
+# ---------------------------------------------------------------------------
+# Must be in the environment before any worker imports prometheus_client.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/sentinelshield/metrics")
+
+
+def _reset_metrics_dir():
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop the dead worker's live gauges from the shared metrics store."""
+    from sentinelshield.core.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+# ---------------------------------------------------------------------------
+# Split mode: dedicated inference server processes
+# ---------------------------------------------------------------------------
+_inference_replicas = int(os.getenv("SENTINELSHIELD_INFERENCE_REPLICAS", "0"))
+_inference_socket_dir = os.getenv("SENTINELSHIELD_INFERENCE_SOCKET_DIR", "/tmp/sentinelshield")
+_inference_ready_timeout_s = float(os.getenv("SENTINELSHIELD_INFERENCE_READY_TIMEOUT_S", "600"))
+_inference_max_restarts = int(os.getenv("SENTINELSHIELD_INFERENCE_MAX_RESTARTS", "5"))
+_inference_restart_window_s = float(os.getenv("SENTINELSHIELD_INFERENCE_RESTART_WINDOW_S", "300"))
+_inference_procs: dict = {}  # replica index -> Popen
+_inference_restarts: dict = {}  # replica index -> restart timestamps
+_inference_ready: dict = {}  # replica index -> answered the readiness ping since its last start
+_inference_started_at: dict = {}  # replica index -> monotonic start time
+_stopping = threading.Event()
+_procs_lock = threading.Lock()  # no replica may start once on_exit collected them
+
+if _inference_replicas > 0:
+    # Exported before fork so every HTTP worker builds RemoteProvider proxies
+    # instead of loading the models itself.
+    os.environ["SENTINELSHIELD_INFERENCE_SOCKETS"] = ",".join(
+        os.path.join(_inference_socket_dir, f"infer-{i}.sock") for i in range(_inference_replicas)
+    )
+
+
+def _replica_socket(i):
+    return os.path.join(_inference_socket_dir, f"infer-{i}.sock")
+
+
+def _start_replica(server, i):
+    env = dict(os.environ)
+    env.pop("SENTINELSHIELD_INFERENCE_SOCKETS", None)
+    env["SENTINELSHIELD_PROMPT_GUARD_DEVICE"] = f"npu:{i % _num_npus}"
+    sock = _replica_socket(i)
+    with _procs_lock:
+        if _stopping.is_set():
+            return None
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "sentinelshield.models.inference_server", "--socket", sock],
+            env=env,
+        )
+        _inference_procs[i] = proc
+    server.log.info("Inference replica %s (pid %s) → %s on npu:%s", i, proc.pid, sock, i % _num_npus)
+    return proc
+
+
+def _ping(sock_path, timeout=2.0):
+    """One readiness round trip in the inference server's frame format."""
+    body = json.dumps({"id": 0, "op": "ping"}).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(sock_path)
+        s.sendall(struct.pack(">I", len(body)) + body)
+        buf = b""
+        while len(buf) < 4 or len(buf) < 4 + struct.unpack(">I", buf[:4])[0]:
+            chunk = s.recv(65536)
+            if not chunk:
+                return False
+            buf += chunk
+    return bool(json.loads(buf[4:]).get("ready"))
+
+
+def _wait_ready(server, i, proc):
+    """Block until replica ``i`` answers a ping; False if it exits, times out or we are stopping."""
+    if proc is None:
+        return False
+    deadline = time.monotonic() + _inference_ready_timeout_s
+    while time.monotonic() < deadline:
+        if _stopping.is_set():
+            return False
+        if proc.poll() is not None:
+            server.log.error("Inference replica %s exited with %s while starting", i, proc.returncode)
+            return False
+        try:
+            if _ping(_replica_socket(i)):
+                server.log.info("Inference replica %s ready", i)
+                return True
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.5)
+    server.log.error("Inference replica %s not ready after %ss", i, _inference_ready_timeout_s)
+    return False
+
+
+def _check_replicas(server):
+    """One supervision pass; never blocks on a replica that is still loading.
+
+    Dead replicas are restarted and marked not ready. Replicas that are not
+    ready yet get one quick ping. A replica that stays unready past the ready
+    timeout is killed, so the next pass restarts it.
+    """
+    now = time.monotonic()
+    for i, proc in list(_inference_procs.items()):
+        if _stopping.is_set():
+            return
+        if proc.poll() is not None:
+            recent = [t for t in _inference_restarts.get(i, []) if now - t < _inference_restart_window_s]
+            if len(recent) >= _inference_max_restarts:
+                server.log.critical(
+                    "Inference replica %s died %s times in %ss; shutting down",
+                    i, len(recent) + 1, _inference_restart_window_s,
+                )
+                _stopping.set()
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            _inference_restarts[i] = recent + [now]
+            server.log.error("Inference replica %s (pid %s) exited with %s; restarting", i, proc.pid, proc.returncode)
+            if _start_replica(server, i) is not None:
+                _inference_ready[i] = False
+                _inference_started_at[i] = now
+        elif not _inference_ready.get(i, True):
+            try:
+                ready = _ping(_replica_socket(i), timeout=0.2)
+            except (OSError, ValueError):
+                ready = False
+            if ready:
+                _inference_ready[i] = True
+                server.log.info("Inference replica %s ready again", i)
+            elif now - _inference_started_at[i] > _inference_ready_timeout_s:
+                server.log.error("Inference replica %s not ready after %ss; killing it", i, _inference_ready_timeout_s)
+                proc.kill()
+
+
+def _supervise(server):
+    """Restart inference replicas that die; stop the master when one keeps dying."""
+    while not _stopping.wait(1.0):
+        _check_replicas(server)
+
+
+def _stop_replicas():
+    with _procs_lock:
+        _stopping.set()
+        procs = list(_inference_procs.values())
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=graceful_timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def on_starting(server):
+    """Start one inference server per replica, each pinned to its own NPU.
+
+    Returns only when every replica is serving, so no worker accepts traffic
+    before the models are loaded.
+    """
+    _reset_metrics_dir()
+    for i in range(_inference_replicas):
+        _start_replica(server, i)
+    for i in range(_inference_replicas):
+        if not _wait_ready(server, i, _inference_procs[i]):
+            _stop_replicas()
+            sys.exit(1)
+    if _inference_replicas > 0:
+        threading.Thread(target=_supervise, args=(server,), name="inference-supervisor", daemon=True).start()
+
+
+def on_exit(server):
+    _stop_replicas()
@@ -0,0 +1,142 @@
+"""Raw ASGI fast path for the hot moderation endpoints.
+
+FastAPI spends a noticeable share of a rule-hit request in routing, dependency
+resolution and Pydantic validation. With SENTINELSHIELD_ASGI_FAST_PATH=1 this
+middleware answers POST /v1/prompt-guard, /v1/full-prompt-guard,
+/v1/general-guard and /v1/chat-guard itself: the body is decoded with orjson
+into plain dicts/strings, checked by hand, passed to the same orchestrator /
+chat-guard code as the routers, and the response is written as pre-serialized
+bytes.
+
+The public API does not change. Anything the fast path does not accept as
+plainly valid (wrong content type, malformed JSON, missing or mistyped fields,
+empty ``messages``) is replayed to the FastAPI app, so error responses (422,
+400) stay exactly those of the routers.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Awaitable, Callable
+
+import orjson
+
+from ..core.admission import DEADLINE_HEADER, AdmissionRejected, deadline_from_headers
+from ..core.schema import ModerationResponse
+from .routers import chat_guard, full_prompt_guard, moderation, prompt_guard
+
+enabled = os.getenv("SENTINELSHIELD_ASGI_FAST_PATH", "0").lower() in {"1", "true", "yes"}
+
+_CHAT_ROLES = frozenset({"system", "user", "assistant"})
+_DEADLINE_HEADER = DEADLINE_HEADER.encode("latin-1")
+
+
+def _text_field(name: str) -> Callable[[Any], str | None]:
+    def parse(body: Any) -> str | None:
+        value = body.get(name) if type(body) is dict else None
+        return value if type(value) is str else None
+
+    return parse
+
+
+def _parse_chat(body: Any) -> list[dict[str, str]] | None:
+    """Plain-dict equivalent of ChatGuardRequest; None when FastAPI should answer."""
+    if type(body) is not dict:
+        return None
+    messages, model = body.get("messages"), body.get("model")
+    if type(messages) is not list or not messages or (model is not None and type(model) is not str):
+        return None
+    out = []
+    for msg in messages:
+        if type(msg) is not dict:
+            return None
+        role, content = msg.get("role"), msg.get("content")
+        if type(role) is not str or role not in _CHAT_ROLES or type(content) is not str:
+            return None
+        out.append({"role": role, "content": content})
+    return out
+
+
+# Handlers look the orchestrator up on the router module at call time, so both
+# paths always share the same instance.
+_ROUTES: dict[str, tuple[Callable[[Any], Any], Callable[[Any, float], Awaitable[ModerationResponse]]]] = {
+    "/v1/prompt-guard": (_text_field("prompt"), lambda v, d: prompt_guard.orc.moderate(v, deadline_s=d)),
+    "/v1/full-prompt-guard": (_text_field("prompt"), lambda v, d: full_prompt_guard.orc.moderate(v, deadline_s=d)),
+    "/v1/general-guard": (_text_field("text"), lambda v, d: moderation.orc.moderate(v, deadline_s=d)),
+    "/v1/chat-guard": (_parse_chat, chat_guard.moderate_chat),
+}
+
+
+async def _read_body(receive: Callable) -> bytes | None:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _replay(body: bytes, receive: Callable) -> Callable:
+    """A ``receive`` that hands the already-read body to the downstream app."""
+    sent = False
+
+    async def replay() -> dict:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+async def _send_json(send: Callable, status: int, body: bytes, extra: tuple[tuple[bytes, bytes], ...] = ()) -> None:
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *extra]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class FastPathMiddleware:
+    """ASGI middleware serving the hot endpoints without FastAPI routing."""
+
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        route = _ROUTES.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_type, deadline = b"", None
+        for key, value in scope["headers"]:
+            if key == b"content-type":
+                content_type = value
+            elif key == _DEADLINE_HEADER:
+                deadline = value.decode("latin-1")
+        body = await _read_body(receive)
+        if body is None:
+            return
+
+        parse, handler = route
+        value = None
+        # FastAPI decodes JSON when the content type is absent or *json.
+        if not content_type or b"json" in content_type:
+            try:
+                value = parse(orjson.loads(body))
+            except orjson.JSONDecodeError:
+                value = None
+        if value is None:
+            await self.app(scope, _replay(body, receive), send)
+            return
+
+        deadline_s = deadline_from_headers({DEADLINE_HEADER: deadline} if deadline else {})
+        try:
+            resp = await handler(value, deadline_s)
+        except AdmissionRejected as exc:
+            retry_after = (b"retry-after", str(exc.retry_after_s).encode())
+            await _send_json(send, 429, orjson.dumps(exc.body()), (retry_after,))
+            return
+        await _send_json(send, 200, resp.to_json())
@@ -4,9 +4,12 @@ import asyncio
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
+from . import fast_path, server_timing, tracing
 from .routers import moderation, admin, prompt_guard, full_prompt_guard, chat_guard
+from ..core.admission import AdmissionRejected
 from ..models.providers import get_provider
 from ..core.logger import stop_logging, logger
+from ..core.tracing import flush as flush_traces
 
 app = FastAPI(title="SentinelShield")
 app.include_router(moderation.router)
@@ -15,6 +18,22 @@ app.include_router(prompt_guard.router)
 app.include_router(full_prompt_guard.router)
 app.include_router(chat_guard.router)
 
+if fast_path.enabled:
+    app.add_middleware(fast_path.FastPathMiddleware)
+# Added last so it wraps the fast path too.
+if server_timing.enabled:
+    app.add_middleware(server_timing.ServerTimingMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+
+
+@app.exception_handler(AdmissionRejected)
+async def _admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content=exc.body(),
+        headers={"Retry-After": str(exc.retry_after_s)},
+    )
+
 
 @app.exception_handler(Exception)
 async def _unhandled_exception_handler(request: Request, exc: Exception) -> JSONResponse:
@@ -33,4 +52,5 @@ async def _shutdown() -> None:
         res = close()
         if asyncio.iscoroutine(res):
             await res
+    flush_traces()
     stop_logging()
@@ -1,10 +1,106 @@
 from __future__ import annotations
 
-from fastapi import APIRouter
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+
+from ...core import logger as log
+from ...core import metrics, profiling
+from ...core.orchestrator import orchestrators
+from ...models.providers import get_provider
 
 router = APIRouter()
 
+# Profiling endpoints exist only when a token is configured, and require it in X-Admin-Token.
+_admin_token = os.getenv("SENTINELSHIELD_ADMIN_TOKEN", "")
+
+
+def _require_admin(x_admin_token: str = Header("")) -> None:
+    if not _admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), _admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+def _caches():
+    """(name, cache) for every in-process cache: rule evaluations, rule-hit responses, provider results."""
+    for path, orc in orchestrators.items():
+        yield f"rule_eval:{path}", orc.rule_engine._eval_cache
+        yield f"rule_responses:{path}", orc._rule_responses
+        for name, provider in orc.providers:
+            cache = getattr(provider, "_cache", None)
+            if cache is not None:
+                yield f"provider:{name}", cache
+
 
 @router.get("/v1/healthz", status_code=204)
 async def healthz():
     return
+
+
+@router.get("/v1/admin/profile/cpu", dependencies=[Depends(_require_admin)])
+async def profile_cpu(
+    seconds: float = Query(5.0, gt=0, le=profiling.MAX_SECONDS),
+    format: str = Query("collapsed", pattern="^(collapsed|pstats)$"),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+):
+    """Profile this worker for ``seconds``.
+
+    ``collapsed`` samples all threads and returns flamegraph-ready stacks;
+    ``pstats`` runs cProfile on the event loop and returns a pstats dump.
+    """
+    try:
+        if format == "pstats":
+            body = await profiling.cpu_pstats(seconds)
+            return Response(
+                content=body,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="sentinelshield-{os.getpid()}.pstats"'},
+            )
+        body = await profiling.cpu_collapsed(seconds, interval_ms / 1000.0)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=body, media_type="text/plain; charset=utf-8")
+
+
+@router.get("/v1/admin/profile/memory", dependencies=[Depends(_require_admin)])
+async def profile_memory(seconds: float = Query(5.0, gt=0, le=profiling.MAX_SECONDS), top: int = Query(25, ge=1, le=500)):
+    """tracemalloc growth of this worker over ``seconds`` and the size of each cache."""
+    try:
+        out = await profiling.memory_diff(seconds, _caches(), top)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"pid": os.getpid(), **out}
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus exposition, merged across all gunicorn workers."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@router.get("/v1/cascade-stats")
+async def cascade_stats():
+    """Escalation rates of every endpoint configured in cascade mode."""
+    return {path: orc.cascade_stats() for path, orc in orchestrators.items() if orc.mode == "cascade"}
+
+
+@router.get("/v1/overload-stats")
+async def overload_stats():
+    """Degraded-mode state and time spent degraded for endpoints with overload_policy="rules_only"."""
+    return {path: orc.overload_stats() for path, orc in orchestrators.items() if orc.overload is not None}
+
+
+@router.get("/v1/qw3-guard-stats")
+async def qw3_guard_stats():
+    """Client-side state of the qw3 guard provider (concurrency limit, queue depth, breaker, upstreams)."""
+    stats = getattr(get_provider("qw3_guard"), "stats", None)
+    return stats() if callable(stats) else {}
+
+
+@router.get("/v1/logging-stats")
+async def logging_stats():
+    """Log writer queue depth, records written, dropped on a full queue and sampled out."""
+    return log.stats()
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Dict, Literal
 from pathlib import Path
 
-from ...core.orchestrator import build_orchestrator
+from ...core import admission, metrics, timing, tracing
+from ...core.orchestrator import build_orchestrator, decision_source
+from ...core.overload import DEGRADED_MODEL_VERSION
 from ...core.schema import ModerationResponse, Reason
 from ...models.providers import get_provider
-from ...core.logger import api_logger, system_logger
+from ...core.logger import api_logger, log_event, sampled, text_fingerprint
 import time
 
 
@@ -33,6 +35,10 @@ class ChatGuardRequest(BaseModel):
     model: str | None = None  # Optional, for OpenAI compatibility
 
 
+# Audit-record timing keys -> metrics stage labels (same names as the orchestrator's).
+_STAGE_NAMES = {"rule_engine_s": "rules", "qw3_guard_s": "qw3_guard"}
+
+
 def _messages_to_text(messages: List[Dict[str, str]]) -> str:
     """Convert messages list to text format for rule checking."""
     text_parts = []
@@ -44,66 +50,102 @@ def _messages_to_text(messages: List[Dict[str, str]]) -> str:
 
 
 @router.post("/v1/chat-guard")
-async def chat_guard(req: ChatGuardRequest):
+async def chat_guard(req: ChatGuardRequest, request: Request):
     """
     Moderate LLM generated answers with user prompt using qw3-guard.
     
     Uses rule engine with higher priority, then qw3-guard model for moderation.
     Accepts messages in OpenAI chat completions format and returns moderation result.
     """
-    start_time = time.time()
-    
     if not req.messages:
         raise HTTPException(status_code=400, detail="messages cannot be empty")
     
     # Convert Pydantic models to dict format
     messages_dict = [{"role": msg.role, "content": msg.content} for msg in req.messages]
+    resp = await moderate_chat(messages_dict, admission.deadline_from_headers(request.headers))
+    return resp.to_response()
+
+
+def _record_response(messages_dict: List[Dict[str, str]], text: str, resp: ModerationResponse, start_time: float, **timings: float) -> None:
+    """Metrics, then a sampled audit record: a fingerprint of the conversation, never its content."""
+    total_s = time.time() - start_time
+    metrics.STAGE_SECONDS.labels("/v1/chat-guard", "total").observe(total_s)
+    for stage, seconds in timings.items():
+        metrics.STAGE_SECONDS.labels("/v1/chat-guard", _STAGE_NAMES[stage]).observe(seconds)
+        timing.record(_STAGE_NAMES[stage], seconds)
+    metrics.REQUESTS.labels("/v1/chat-guard", resp.decision, decision_source(resp)).inc()
+    if not sampled(api_logger, "/v1/chat-guard"):
+        return
+    n, h = text_fingerprint(text)
+    log_event(
+        api_logger,
+        "moderation",
+        endpoint="/v1/chat-guard",
+        messages=len(messages_dict),
+        len=n,
+        hash=h,
+        decision=resp.decision,
+        model_version=resp.model_version,
+        total_s=round(total_s, 6),
+        **{k: round(v, 6) for k, v in timings.items()},
+    )
+
+
+async def moderate_chat(messages_dict: List[Dict[str, str]], deadline_s: float | None = None) -> ModerationResponse:
+    """Rules then qw3-guard over already validated, non-empty chat messages."""
+    start_time = time.time()
     
     # Convert messages to text for rule checking
     text_for_rules = _messages_to_text(messages_dict)
+    timing.record("normalize", time.time() - start_time)
     
     # Check rules first using orchestrator's rule engine (rules have higher priority)
     rule_start = time.time()
-    rule = orc.rule_engine.evaluate(text_for_rules)
+    with tracing.span("rules.evaluate") as rule_span:
+        rule = orc.rule_engine.evaluate(text_for_rules)
+        rule_span.set_attribute("rules.hit", rule.id if rule else "")
     rule_time = time.time() - rule_start
+    metrics.RULE_EVALUATIONS.labels("/v1/chat-guard", "hit" if rule else "miss").inc()
     
     reasons: List[Reason] = []
     
     # If rule matched, return early with rule decision
     if rule:
-        reasons.append(Reason(engine="rule", id=rule.id))
-        resp = ModerationResponse(
-            safe=rule.action == "ALLOW",
-            decision=rule.action,
-            reasons=reasons,
-            policy_version="v1",
-        )
-        total_time = time.time() - start_time
-        timings = {'total': total_time, 'rule_engine': rule_time}
-        system_logger.info(f"Chat guard moderation timings: {timings}")
-        
-        messages_preview = str(messages_dict)[:200] + "..." if len(str(messages_dict)) > 200 else str(messages_dict)
-        api_logger.info(f"/v1/chat-guard request: {messages_preview}")
-        api_logger.info(f"/v1/chat-guard response: {resp}")
-        
+        resp = orc.rule_response(rule)
+        _record_response(messages_dict, text_for_rules, resp, start_time, rule_engine_s=rule_time)
         return resp
     
     # Rules didn't match, use qw3-guard with messages
     qw3_provider = get_provider("qw3_guard")
+    estimate = getattr(qw3_provider, "estimated_wait_s", None)
+    estimated_s = estimate() if callable(estimate) else 0.0
+    if orc.overload is not None and orc.overload.should_degrade(estimated_s):
+        # Overloaded: rules already missed, answer without waiting for qw3-guard.
+        resp = ModerationResponse(safe=True, decision="ALLOW", reasons=reasons, model_version=DEGRADED_MODEL_VERSION)
+        _record_response(messages_dict, text_for_rules, resp, start_time, rule_engine_s=rule_time)
+        return resp
+    admission.check("/v1/chat-guard", estimated_s, deadline_s)
     
     # Use moderate_messages if available (preferred for chat context)
-    if hasattr(qw3_provider, "moderate_messages"):
-        qw3_start = time.time()
-        score, label = await qw3_provider.moderate_messages(messages_dict)
-        qw3_time = time.time() - qw3_start
-    else:
-        # Fallback: combine messages into text
-        qw3_start = time.time()
-        score, label = await qw3_provider.moderate(text_for_rules)
-        qw3_time = time.time() - qw3_start
+    engine, degraded = "qw3_guard", None
+    with tracing.span("provider qw3_guard", attributes={"provider": "qw3_guard"}) as provider_span:
+        if hasattr(qw3_provider, "moderate_messages_with_status"):
+            qw3_start = time.time()
+            score, label, engine, degraded = await qw3_provider.moderate_messages_with_status(messages_dict)
+            qw3_time = time.time() - qw3_start
+        elif hasattr(qw3_provider, "moderate_messages"):
+            qw3_start = time.time()
+            score, label = await qw3_provider.moderate_messages(messages_dict)
+            qw3_time = time.time() - qw3_start
+        else:
+            # Fallback: combine messages into text
+            qw3_start = time.time()
+            score, label = await qw3_provider.moderate(text_for_rules)
+            qw3_time = time.time() - qw3_start
+        provider_span.set_attribute("degraded", degraded or "")
     
-    # Build reasons (add qw3-guard result)
-    reasons.append(Reason(engine="qw3_guard", category=label, score=score))
+    # Build reasons (add qw3-guard result, or the fallback provider's when degraded)
+    reasons.append(Reason(engine=engine, category=label, score=score))
     
     # Determine safety based on score
     safe = score < 0.5
@@ -114,17 +156,10 @@ async def chat_guard(req: ChatGuardRequest):
         safe=safe,
         decision=decision,
         reasons=reasons,
-        model_version="qw3_guard",
+        # Degraded answers are marked, e.g. "qw3_guard:degraded:circuit_open".
+        model_version="qw3_guard" if degraded is None else f"qw3_guard:degraded:{degraded}",
     )
     
-    total_time = time.time() - start_time
-    timings = {'total': total_time, 'rule_engine': rule_time, 'qw3_guard': qw3_time}
-    system_logger.info(f"Chat guard moderation timings: {timings}")
-    
-    # Log request and response
-    messages_preview = str(messages_dict)[:200] + "..." if len(str(messages_dict)) > 200 else str(messages_dict)
-    api_logger.info(f"/v1/chat-guard request: {messages_preview}")
-    api_logger.info(f"/v1/chat-guard response: {resp}")
-    
+    _record_response(messages_dict, text_for_rules, resp, start_time, rule_engine_s=rule_time, qw3_guard_s=qw3_time)
     return resp
 
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 from pathlib import Path
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
 
+from ...core.admission import deadline_from_headers
 from ...core.orchestrator import build_orchestrator
 
 router = APIRouter()
@@ -23,7 +24,7 @@ class FullPromptGuardRequest(BaseModel):
 
 
 @router.post("/v1/full-prompt-guard")
-async def full_prompt_guard(req: FullPromptGuardRequest):
-    resp = await orc.moderate(req.prompt)
+async def full_prompt_guard(req: FullPromptGuardRequest, request: Request):
+    resp = await orc.moderate(req.prompt, deadline_s=deadline_from_headers(request.headers))
     return resp.to_response()
 
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 
+from ...core.admission import deadline_from_headers
 from ...core.orchestrator import build_orchestrator
 
 
@@ -15,6 +16,6 @@ class ModerationRequest(BaseModel):
 
 
 @router.post("/v1/general-guard")
-async def moderate(req: ModerationRequest):
-    resp = await orc.moderate(req.text)
+async def moderate(req: ModerationRequest, request: Request):
+    resp = await orc.moderate(req.text, deadline_s=deadline_from_headers(request.headers))
     return resp.to_response()
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
 from pathlib import Path
 
+from ...core.admission import deadline_from_headers
 from ...core.orchestrator import build_orchestrator
 from ...core.schema import ModerationResponse
 
@@ -23,6 +24,6 @@ class PromptGuardRequest(BaseModel):
 
 
 @router.post("/v1/prompt-guard")
-async def prompt_guard(req: PromptGuardRequest):
-    resp = await orc.moderate(req.prompt)
+async def prompt_guard(req: PromptGuardRequest, request: Request):
+    resp = await orc.moderate(req.prompt, deadline_s=deadline_from_headers(request.headers))
     return resp.to_response()
@@ -0,0 +1,43 @@
+"""ASGI middleware adding a ``Server-Timing`` header with per-stage durations.
+
+Every response carries e.g. ``Server-Timing: rules;dur=0.021,
+llama_prompt_guard_2;dur=41.3, total;dur=42.0`` (milliseconds), so a gateway
+can attribute latency per request. A request with ``X-Debug-Timing: 1``
+also gets the same numbers as a ``"timings"`` object in the JSON body.
+SENTINELSHIELD_SERVER_TIMING=0 removes the middleware.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable
+
+from ..core import timing
+
+enabled = os.getenv("SENTINELSHIELD_SERVER_TIMING", "1").lower() not in {"0", "false", "no"}
+
+DEBUG_HEADER = b"x-debug-timing"
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        in_body = any(k == DEBUG_HEADER and v not in (b"", b"0") for k, v in scope["headers"])
+        timings, token = timing.begin(in_body)
+
+        async def send_with_timing(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.append((b"server-timing", timings.header_value().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            timing.end(token)
@@ -0,0 +1,41 @@
+"""ASGI middleware opening a SERVER span per request (see ``core.tracing``).
+
+The incoming W3C ``traceparent`` becomes the span's parent, so the request
+joins the caller's trace. Everything the pipeline traces while handling the
+request (rules, providers, batcher enqueue, qw3 attempts) nests under it.
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+from ..core import tracing
+
+
+class TracingMiddleware:
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not tracing.enabled:
+            await self.app(scope, receive, send)
+            return
+        traceparent = next((v for k, v in scope["headers"] if k == b"traceparent"), None)
+        remote = tracing.extract({"traceparent": traceparent.decode("latin-1")}) if traceparent else None
+        remote_token = tracing.set_remote_parent(remote)
+        request_span = tracing.span(
+            f"{scope['method']} {scope['path']}",
+            kind=tracing.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        )
+
+        async def send_with_status(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                request_span.set_attribute("http.response.status_code", message["status"])
+            await send(message)
+
+        try:
+            with request_span:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            tracing.reset_remote_parent(remote_token)
@@ -0,0 +1,87 @@
+"""Admission control: reject work that cannot finish before its deadline.
+
+uvicorn's ``limit_concurrency`` counts connections, not work. Here each request
+that needs a model is checked against the predicted completion time of its
+providers (batcher queue depth x recent batch latency, or the qw3 client queue).
+When that exceeds the request deadline the request is refused with 429 and a
+``Retry-After`` header, so a gateway can retry another replica at once instead
+of waiting for a timeout.
+
+The deadline is the ``X-Request-Deadline-Ms`` header (remaining budget in ms) or
+SENTINELSHIELD_REQUEST_DEADLINE_MS. SENTINELSHIELD_ADMISSION_CONTROL=0 disables it.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+from collections import Counter
+from typing import Mapping
+
+from . import metrics
+from .logger import system_logger
+
+DEADLINE_HEADER = "x-request-deadline-ms"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        v = float(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+enabled = os.getenv("SENTINELSHIELD_ADMISSION_CONTROL", "1").lower() not in {"0", "false", "no"}
+default_deadline_s = _env_float("SENTINELSHIELD_REQUEST_DEADLINE_MS", 5000.0) / 1000.0
+
+# Rejections per API path since start (per worker).
+rejections: Counter[str] = Counter()
+
+
+class AdmissionRejected(Exception):
+    """The predicted completion time exceeds the request deadline."""
+
+    def __init__(self, api_path: str, estimated_s: float, deadline_s: float) -> None:
+        super().__init__(f"{api_path}: estimated {estimated_s:.3f}s exceeds deadline {deadline_s:.3f}s")
+        self.api_path = api_path
+        self.estimated_s = estimated_s
+        self.deadline_s = deadline_s
+        # By then the backlog that made us reject should have drained.
+        self.retry_after_s = max(1, math.ceil(estimated_s - deadline_s))
+
+    def body(self) -> dict:
+        """JSON body of the 429 response."""
+        return {"detail": "Overloaded, retry later", "estimated_wait_s": round(self.estimated_s, 3)}
+
+
+def deadline_from_headers(headers: Mapping[str, str]) -> float:
+    """Request deadline in seconds from ``X-Request-Deadline-Ms``, else the configured default."""
+    value = headers.get(DEADLINE_HEADER)
+    if value:
+        try:
+            ms = float(value)
+            if ms > 0:
+                return ms / 1000.0
+        except ValueError:
+            pass
+    return default_deadline_s
+
+
+def admits(estimated_s: float, deadline_s: float | None = None) -> bool:
+    """Whether ``estimated_s`` fits in the deadline (no side effects)."""
+    if not enabled:
+        return True
+    return estimated_s <= (default_deadline_s if deadline_s is None else deadline_s)
+
+
+def check(api_path: str, estimated_s: float, deadline_s: float | None = None) -> None:
+    """Raise AdmissionRejected if ``estimated_s`` does not fit in the deadline."""
+    if not admits(estimated_s, deadline_s):
+        deadline_s = default_deadline_s if deadline_s is None else deadline_s
+        rejections[api_path] += 1
+        metrics.ADMISSION_REJECTIONS.labels(api_path).inc()
+        if system_logger.isEnabledFor(logging.DEBUG):
+            system_logger.debug(f"Admission rejected on {api_path}: estimated {estimated_s:.3f}s > deadline {deadline_s:.3f}s")
+        raise AdmissionRejected(api_path, estimated_s, deadline_s)
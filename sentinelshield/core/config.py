@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
-from typing import Literal, List, Dict
+from pydantic import BaseModel, field_validator
+from typing import Literal, List, Dict, Tuple
 
 
 class ModelSettings(BaseModel):
@@ -12,6 +12,27 @@ class ModelSettings(BaseModel):
 class APIConfig(BaseModel):
     """Configuration for a specific API endpoint"""
     providers: List[str] = ["dummy"]
+    # "sequential": run providers in order until one scores >= 0.5.
+    # "cascade": providers are ordered cheapest first; a provider decides alone when
+    # its score is outside ``uncertainty_band`` (ALLOW below, BLOCK at or above) and
+    # only escalates to the next provider when the score falls inside it.
+    mode: Literal["sequential", "cascade"] = "sequential"
+    uncertainty_band: Tuple[float, float] = (0.1, 0.9)
+    # Start every provider concurrently instead of one after another. Full-scan waits
+    # for all of them; the normal path returns on the first BLOCK and cancels the rest.
+    # Ignored in cascade mode, which is sequential by design.
+    parallel: bool = False
+    # What to do when the providers are saturated: "reject" (429 via admission
+    # control) or "rules_only" (immediate rules/cache verdict, see core/overload.py).
+    overload_policy: Literal["reject", "rules_only"] = "reject"
+
+    @field_validator("uncertainty_band")
+    @classmethod
+    def _check_band(cls, v: Tuple[float, float]) -> Tuple[float, float]:
+        low, high = v
+        if not 0.0 <= low <= high <= 1.0:
+            raise ValueError("uncertainty_band must satisfy 0 <= low <= high <= 1")
+        return v
 
 
 class Settings(BaseModel):
@@ -19,7 +40,7 @@ class Settings(BaseModel):
     # API-specific configurations
     api_configs: Dict[str, APIConfig] = {
         "/v1/prompt-guard": APIConfig(providers=["llama_prompt_guard_2"]),
-        "/v1/full-prompt-guard": APIConfig(providers=["llama_prompt_guard_2"]),
+        "/v1/full-prompt-guard": APIConfig(providers=["llama_prompt_guard_2"], parallel=True),
         "/v1/general-guard": APIConfig(providers=["dummy"]),
         "/v1/chat-guard": APIConfig(providers=["qw3_guard"]),
     }
@@ -1,10 +1,74 @@
+"""Structured, sampled audit logging kept off the request path.
+
+``system_logger`` and ``api_logger`` put records on a bounded queue and return;
+a background writer thread formats them as JSON lines and appends them in
+batches to ``logs/system.log`` and ``logs/api.log``. All gunicorn workers share
+these files. The newest backup ``.1`` is kept as plain text, and older backups
+are gzip-compressed. When the queue is full the record is dropped and counted
+(``stats()``), so a slow disk never blocks a request or grows memory.
+
+Formatting is lazy: ``%``-style arguments and ``extra={"fields": {...}}`` are
+rendered in the writer thread, so pass immutable values. Per-request audit
+records are sampled per endpoint with ``sampled()`` before anything is built:
+
+    if sampled(api_logger, "/v1/chat-guard"):
+        log_event(api_logger, "moderation", endpoint="/v1/chat-guard", decision=...)
+
+Configuration (env):
+    DISABLE_FILE_LOGGING                 – no log files, WARNING level
+    SENTINELSHIELD_LOG_SAMPLE_RATES      – "endpoint=rate,..." ("*" sets the default, 1.0)
+    SENTINELSHIELD_LOG_QUEUE_SIZE        – queued records before dropping (10000)
+    SENTINELSHIELD_LOG_BATCH_SIZE        – records per write (256)
+    SENTINELSHIELD_LOG_FLUSH_INTERVAL_S  – writer wake-up interval (0.5)
+    SENTINELSHIELD_LOG_MAX_BYTES / _BACKUPS / _COMPRESS – rotation (5 MB, 3, on)
+"""
+
+import fcntl
+import gzip
+import hashlib
 import logging
 import os
 import queue
-from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import random
+import shutil
+import threading
+from collections import Counter
+from logging.handlers import QueueHandler
+
+import orjson
 
 _FILE_LOGGING_DISABLED = os.environ.get('DISABLE_FILE_LOGGING', '').lower() in ('1', 'true', 'yes')
 
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        v = int(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        v = float(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+def _env_rates(name: str) -> dict[str, float]:
+    """Parse ``"endpoint=rate,endpoint=rate"``; rates are clamped to [0, 1]."""
+    out: dict[str, float] = {}
+    for item in os.getenv(name, "").split(","):
+        key, _, value = item.partition("=")
+        try:
+            if key.strip():
+                out[key.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return out
+
+
 # Ensure logs directory exists
 if not _FILE_LOGGING_DISABLED:
     os.makedirs('logs', exist_ok=True)
@@ -12,51 +76,252 @@ if not _FILE_LOGGING_DISABLED:
 system_log_path = 'logs/system.log'
 api_log_path = 'logs/api.log'
 
-_log_queue: queue.Queue = queue.Queue(-1)
-_listener: QueueListener | None = None
+_sample_rates = _env_rates("SENTINELSHIELD_LOG_SAMPLE_RATES")
+_default_sample_rate = _sample_rates.pop("*", 1.0)
+
+# Records dropped because the queue was full, and audit records sampled out.
+dropped: Counter[str] = Counter()
+sampled_out: Counter[str] = Counter()
+
+_STOP = object()
+
+
+def text_fingerprint(text: str) -> tuple[int, str]:
+    b = text.encode("utf-8", errors="ignore")
+    # Short, stable fingerprint for logs without leaking full content.
+    h = hashlib.blake2b(b, digest_size=8).hexdigest()
+    return len(text), h
+
+
+def sampled(log: logging.Logger, endpoint: str, level: int = logging.INFO) -> bool:
+    """Whether a per-request record for ``endpoint`` should be built at all."""
+    if not log.isEnabledFor(level):
+        return False
+    rate = _sample_rates.get(endpoint, _default_sample_rate)
+    if rate >= 1.0 or (rate > 0.0 and random.random() < rate):
+        return True
+    sampled_out[endpoint] += 1
+    return False
+
+
+def log_event(log: logging.Logger, event: str, level: int = logging.INFO, **fields) -> None:
+    """Log a structured record; ``fields`` become top-level JSON keys."""
+    log.log(level, event, extra={"fields": fields})
+
 
+def _format_record(record: logging.LogRecord) -> bytes:
+    out = {
+        "ts": round(record.created, 6),
+        "level": record.levelname,
+        "logger": record.name,
+        "msg": record.getMessage(),
+    }
+    fields = getattr(record, "fields", None)
+    if fields:
+        out.update(fields)
+    if record.exc_text:
+        out["exc"] = record.exc_text
+    return orjson.dumps(out, default=str, option=orjson.OPT_APPEND_NEWLINE)
 
-def _ensure_listener_started() -> QueueListener | None:
-    global _listener
+
+class _DroppingQueueHandler(QueueHandler):
+    """Enqueues records without formatting them and drops them when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only tracebacks are rendered here: they reference live frames.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped[record.name] += 1
+
+
+class _JsonLinesFile:
+    """Append-only log file rotated by size, shared safely by several processes.
+
+    Every gunicorn worker appends to the same path. Rotation happens under an
+    ``flock`` on ``<path>.lock``. It renames the live file to ``<path>.1``,
+    and writers that still hold the old inode notice the change before their
+    next write and reopen the path. Nothing is copied or removed while a
+    writer may still append to it: ``.1`` is only compressed into ``.2.gz`` at
+    the following rotation, long after every writer has moved on.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int, compress: bool) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self._f = None
+
+    def _replaced(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._f.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def write(self, data: bytes) -> None:
+        if self._f is not None and self._replaced():
+            self.close()
+        if self._f is None:
+            self._f = open(self.path, "ab")
+        self._f.write(data)
+        self._f.flush()
+        if self._f.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        with open(self.path + ".lock", "ab") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Another writer may have rotated while we waited for the lock.
+                if self._replaced() or os.fstat(self._f.fileno()).st_size < self.max_bytes:
+                    return
+                ext = ".gz" if self.compress else ""
+                for i in range(self.backups - 1, 1, -1):
+                    src = f"{self.path}.{i}{ext}"
+                    if os.path.exists(src):
+                        os.replace(src, f"{self.path}.{i + 1}{ext}")
+                first = f"{self.path}.1"
+                if os.path.exists(first):
+                    if self.backups < 2:
+                        os.remove(first)
+                    elif self.compress:
+                        with open(first, "rb") as src, gzip.open(f"{self.path}.2.gz", "wb") as dst:
+                            shutil.copyfileobj(src, dst)
+                        os.remove(first)
+                    else:
+                        os.replace(first, f"{self.path}.2")
+                os.replace(self.path, first)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                self.close()
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class _BatchWriter(threading.Thread):
+    """Drains the queue in batches: one formatted write per file per batch."""
+
+    def __init__(self, q: queue.Queue, sinks: dict[str, _JsonLinesFile], default_sink: _JsonLinesFile,
+                 batch_size: int, flush_interval_s: float) -> None:
+        super().__init__(name="sentinelshield-log-writer", daemon=True)
+        self.queue = q
+        self.sinks = sinks
+        self.default_sink = default_sink
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.written = 0
+        self.errors = 0
+
+    def run(self) -> None:
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval_s)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(r is _STOP for r in batch)
+            self._write([r for r in batch if r is not _STOP])
+            if stop:
+                for sink in {*self.sinks.values(), self.default_sink}:
+                    sink.close()
+                return
+
+    def _write(self, batch: list[logging.LogRecord]) -> None:
+        chunks: dict[_JsonLinesFile, list[bytes]] = {}
+        for record in batch:
+            try:
+                line = _format_record(record)
+            except Exception as e:  # a bad record must not stop the writer
+                self.errors += 1
+                line = orjson.dumps({"logger": record.name, "format_error": repr(e)}, option=orjson.OPT_APPEND_NEWLINE)
+            chunks.setdefault(self.sinks.get(record.name, self.default_sink), []).append(line)
+        for sink, lines in chunks.items():
+            try:
+                sink.write(b"".join(lines))
+                self.written += len(lines)
+            except OSError:
+                self.errors += 1
+
+
+_log_queue: queue.Queue = queue.Queue(_env_int("SENTINELSHIELD_LOG_QUEUE_SIZE", 10_000))
+_writer: _BatchWriter | None = None
+
+
+def _ensure_writer_started() -> _BatchWriter | None:
+    global _writer
     if _FILE_LOGGING_DISABLED:
         return None
-    if _listener is not None:
-        return _listener
+    if _writer is not None:
+        return _writer
 
-    system_handler = RotatingFileHandler(system_log_path, maxBytes=5_000_000, backupCount=3)
-    api_handler = RotatingFileHandler(api_log_path, maxBytes=5_000_000, backupCount=3)
+    max_bytes = _env_int("SENTINELSHIELD_LOG_MAX_BYTES", 5_000_000)
+    backups = _env_int("SENTINELSHIELD_LOG_BACKUPS", 3)
+    compress = os.getenv("SENTINELSHIELD_LOG_COMPRESS", "1").lower() not in {"0", "false", "no"}
+    system_file = _JsonLinesFile(system_log_path, max_bytes, backups, compress)
+    api_file = _JsonLinesFile(api_log_path, max_bytes, backups, compress)
+    _writer = _BatchWriter(
+        _log_queue,
+        {'sentinelshield.api': api_file},
+        system_file,
+        _env_int("SENTINELSHIELD_LOG_BATCH_SIZE", 256),
+        _env_float("SENTINELSHIELD_LOG_FLUSH_INTERVAL_S", 0.5),
+    )
+    _writer.start()
+    return _writer
 
-    formatter = logging.Formatter('[%(asctime)s] %(levelname)s %(name)s: %(message)s')
-    system_handler.setFormatter(formatter)
-    api_handler.setFormatter(formatter)
 
-    _listener = QueueListener(_log_queue, system_handler, api_handler, respect_handler_level=True)
-    _listener.start()
-    return _listener
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _writer
+    if _writer is not None:
+        try:
+            _log_queue.put(_STOP, timeout=1.0)
+            _writer.join(timeout=5.0)
+        except queue.Full:
+            pass
+        _writer = None
 
 
-def stop_logging() -> None:
-    global _listener
-    if _listener is not None:
-        _listener.stop()
-        _listener = None
+def stats() -> dict:
+    return {
+        "queued": _log_queue.qsize(),
+        "capacity": _log_queue.maxsize,
+        "written": _writer.written if _writer is not None else 0,
+        "write_errors": _writer.errors if _writer is not None else 0,
+        "dropped": dict(dropped),
+        "sampled_out": dict(sampled_out),
+    }
 
 
-_ensure_listener_started()
+_ensure_writer_started()
 
 # System logger (async)
 system_logger = logging.getLogger('sentinelshield.system')
 system_logger.setLevel(logging.WARNING if _FILE_LOGGING_DISABLED else logging.INFO)
 system_logger.propagate = False
 if not _FILE_LOGGING_DISABLED and not any(isinstance(h, QueueHandler) for h in system_logger.handlers):
-    system_logger.addHandler(QueueHandler(_log_queue))
+    system_logger.addHandler(_DroppingQueueHandler(_log_queue))
 
 # API logger (async)
 api_logger = logging.getLogger('sentinelshield.api')
 api_logger.setLevel(logging.WARNING if _FILE_LOGGING_DISABLED else logging.INFO)
 api_logger.propagate = False
 if not _FILE_LOGGING_DISABLED and not any(isinstance(h, QueueHandler) for h in api_logger.handlers):
-    api_logger.addHandler(QueueHandler(_log_queue))
+    api_logger.addHandler(_DroppingQueueHandler(_log_queue))
 
 # Default logger for backward compatibility
 logging.basicConfig(level=logging.INFO)
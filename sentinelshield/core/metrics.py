@@ -0,0 +1,111 @@
+"""Prometheus metrics for every pipeline stage, aggregated across workers.
+
+gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a fresh directory before
+forking. Each worker then writes its samples to mmap-backed files there, and
+``GET /metrics`` on any worker merges all of them, so one scrape covers the
+whole server. Without the variable (single-process uvicorn, tests) the default
+in-process registry is used. When prometheus_client is not installed, every
+metric is a no-op and /metrics is empty.
+"""
+
+from __future__ import annotations
+
+import os
+
+try:
+    import prometheus_client as prom
+    from prometheus_client import multiprocess
+except Exception:  # pragma: no cover - optional dependency
+    prom = None
+    multiprocess = None
+
+# Latency buckets from sub-millisecond rule hits to multi-second LLM calls.
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+_NOOP = _NoopMetric()
+
+
+def _counter(name: str, doc: str, labels: tuple[str, ...] = ()):
+    return prom.Counter(name, doc, labels) if prom is not None else _NOOP
+
+
+def _histogram(name: str, doc: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = _LATENCY_BUCKETS):
+    return prom.Histogram(name, doc, labels, buckets=buckets) if prom is not None else _NOOP
+
+
+def _gauge(name: str, doc: str, labels: tuple[str, ...] = ()):
+    # livesum: the server-wide value is the sum over live workers.
+    return prom.Gauge(name, doc, labels, multiprocess_mode="livesum") if prom is not None else _NOOP
+
+
+# Orchestrator / routers
+REQUESTS = _counter(
+    "sentinelshield_requests_total",
+    "Moderation responses by endpoint, decision and the stage that decided (rule, model, degraded)",
+    ("endpoint", "decision", "source"),
+)
+STAGE_SECONDS = _histogram(
+    "sentinelshield_stage_seconds",
+    "Time spent per pipeline stage (rules, <provider>, total)",
+    ("endpoint", "stage"),
+)
+RULE_EVALUATIONS = _counter("sentinelshield_rule_evaluations_total", "Rule engine evaluations by result", ("endpoint", "result"))
+ADMISSION_REJECTIONS = _counter("sentinelshield_admission_rejections_total", "Requests refused with 429", ("endpoint",))
+
+# Caches (rule evaluation cache and per-provider inference caches)
+CACHE_LOOKUPS = _counter("sentinelshield_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+
+# Providers
+PROVIDER_SECONDS = _histogram("sentinelshield_provider_seconds", "Provider moderate() latency, cache misses only", ("provider",))
+PROVIDER_ERRORS = _counter("sentinelshield_provider_errors_total", "Provider calls that failed open", ("provider",))
+
+# Inference batchers
+BATCH_SIZE = _histogram("sentinelshield_batch_size", "Items per executed batch", ("batcher",), buckets=_BATCH_SIZE_BUCKETS)
+BATCH_SECONDS = _histogram("sentinelshield_batch_seconds", "Batch execution time including scheduler wait", ("batcher",))
+BATCH_QUEUE_SECONDS = _histogram("sentinelshield_batch_queue_seconds", "Time a request waited before its batch started", ("batcher",))
+BATCH_PENDING = _gauge("sentinelshield_batch_pending", "Requests queued or running in a batcher", ("batcher",))
+
+# qw3-guard client
+QW3_ATTEMPTS = _counter("sentinelshield_qw3_attempts_total", "HTTP attempts by upstream and outcome", ("upstream", "outcome"))
+QW3_ATTEMPT_SECONDS = _histogram("sentinelshield_qw3_attempt_seconds", "Latency of HTTP attempts", ("outcome",))
+QW3_RETRIES = _counter("sentinelshield_qw3_retries_total", "Attempts retried after a retryable failure")
+QW3_HEDGES = _counter("sentinelshield_qw3_hedges_total", "Hedged second attempts sent")
+QW3_DEGRADED = _counter("sentinelshield_qw3_degraded_total", "Calls answered degraded", ("reason",))
+QW3_INFLIGHT = _gauge("sentinelshield_qw3_inflight", "Calls holding a concurrency-limiter slot")
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition body and content type for ``GET /metrics``."""
+    if prom is None:
+        return b"", "text/plain; charset=utf-8"
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prom.REGISTRY
+    return prom.generate_latest(registry), prom.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop a dead worker's live gauges (gunicorn ``child_exit`` hook)."""
+    if multiprocess is not None and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
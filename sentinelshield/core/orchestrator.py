@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import asyncio
 import hashlib
-import logging
 import os
 import re
 import time
@@ -12,20 +11,32 @@ from typing import List
 
 import yaml
 
-from .schema import ModerationResponse, Reason
+from . import admission, metrics, timing, tracing
+from .overload import DEGRADED_MODEL_VERSION, OverloadGuard
+from .schema import PROVIDER_UNAVAILABLE, ModerationResponse, Reason
 from .config import settings, APIConfig
-from .logger import logger, system_logger, api_logger
+from .logger import logger, system_logger, api_logger, log_event, sampled, text_fingerprint
 from ..models import providers
 
 
 _CACHE_MISS = object()
 
+# Orchestrators built by build_orchestrator, by API path (for admin stats).
+orchestrators: dict[str, "Orchestrator"] = {}
 
-def _text_fingerprint(text: str) -> tuple[int, str]:
-    b = text.encode("utf-8", errors="ignore")
-    # Short, stable fingerprint for logs without leaking full content.
-    h = hashlib.blake2b(b, digest_size=8).hexdigest()
-    return len(text), h
+
+def _allow_version(model_version: str, reasons: List[Reason]) -> str:
+    """Mark an ALLOW that a provider failed open on, so it is not mistaken for a model verdict."""
+    if any(r.category == PROVIDER_UNAVAILABLE for r in reasons):
+        return f"{model_version}:degraded:provider_unavailable"
+    return model_version
+
+
+def decision_source(resp: ModerationResponse) -> str:
+    """Which stage decided ``resp``: "rule", "model" or "degraded" (metrics label)."""
+    if resp.model_version and "degraded" in resp.model_version:
+        return "degraded"
+    return "rule" if resp.policy_version else "model"
 
 
 class Rule:
@@ -50,6 +61,8 @@ class RuleEngine:
         self._last_loaded_files: set[Path] = set()
         self._last_check_time: float = 0.0
         self._rule_by_id: dict[str, Rule] = {}
+        # Bumped whenever a new rule set is loaded.
+        self.version = 0
         self._eval_cache: OrderedDict[bytes, str | None] = OrderedDict()
 
         reload_interval_s = os.getenv("SENTINELSHIELD_RULE_RELOAD_INTERVAL_S", "5")
@@ -134,6 +147,7 @@ class RuleEngine:
         if new_rules:
             self._rules_cache = new_rules
             self._rule_by_id = {r.id: r for r in new_rules if r.id}
+            self.version += 1
             self._file_mtimes = current_mtimes
             self._last_loaded_files = set(current_mtimes.keys())
             self._eval_cache.clear()
@@ -160,6 +174,8 @@ class RuleEngine:
 
         key = self._cache_key(text)
         cached = self._cache_get(key)
+        if self._eval_cache_size > 0:
+            metrics.CACHE_LOOKUPS.labels("rules", "miss" if cached is _CACHE_MISS else "hit").inc()
         if cached is not _CACHE_MISS:
             if cached is None:
                 return None
@@ -191,6 +207,10 @@ class Orchestrator:
         # Get the configured providers for this API endpoint
         api_config = settings.api_configs.get(api_path, APIConfig())
         configured_providers = api_config.providers
+        self.mode = api_config.mode
+        self.uncertainty_band = api_config.uncertainty_band
+        self.parallel = api_config.parallel
+        self.overload = OverloadGuard(api_path) if api_config.overload_policy == "rules_only" else None
         
         # Only initialize the providers that are configured for this API
         self.providers = []
@@ -201,33 +221,226 @@ class Orchestrator:
             else:
                 logger.warning(f"Provider {provider_name} not available for API {api_path}")
 
-    def _log_response(self, text: str, resp: ModerationResponse, start_time: float) -> None:
-        if system_logger.isEnabledFor(logging.INFO):
-            total_time = time.monotonic() - start_time
-            system_logger.info(f"Moderation timings: total={total_time:.4f}s")
-        if api_logger.isEnabledFor(logging.INFO):
-            n, h = _text_fingerprint(text)
-            api_logger.info(f"{self.api_path} request: len={n} hash={h}")
-        if api_logger.isEnabledFor(logging.DEBUG):
-            api_logger.debug(f"{self.api_path} response: {resp}")
-
-    async def moderate(self, text: str) -> ModerationResponse:
+        # Cascade counters: requests that reached each stage and how many escalated past it.
+        self._cascade_requests = 0
+        self._stage_calls = [0] * len(self.providers)
+        self._stage_escalations = [0] * len(self.providers)
+
+        # Metric children resolved once instead of per request.
+        self._m_rules = metrics.STAGE_SECONDS.labels(api_path, "rules")
+        self._m_total = metrics.STAGE_SECONDS.labels(api_path, "total")
+        self._m_providers = {name: metrics.STAGE_SECONDS.labels(api_path, name) for name, _ in self.providers}
+
+        # Pre-serialized rule-hit responses, keyed by (rule id, action).
+        self._rule_responses: dict[tuple[str | None, str], ModerationResponse] = {}
+        self._rule_responses_version = -1
+
+    def estimated_wait_s(self) -> float:
+        """Predicted model time for a request that misses the rules (for admission control)."""
+        waits = []
+        for _, provider in self.providers:
+            estimate = getattr(provider, "estimated_wait_s", None)
+            waits.append(estimate() if callable(estimate) else 0.0)
+        if not waits:
+            return 0.0
+        # Concurrent providers overlap; a sequence or cascade can hit them all in turn.
+        return max(waits) if self.parallel and self.mode != "cascade" else sum(waits)
+
+    def degraded_response(self, text: str, reasons: List[Reason], blocked: bool = False) -> ModerationResponse:
+        """Rules-and-cache-only verdict used while the endpoint is overloaded."""
+        for name, provider in self.providers:
+            cached = getattr(provider, "cached", None)
+            hit = cached(text) if callable(cached) else None
+            if hit is not None:
+                reasons.append(Reason(engine=name, category=hit[1], score=hit[0]))
+                blocked = blocked or hit[0] >= 0.5
+        return ModerationResponse(
+            safe=not blocked,
+            decision="BLOCK" if blocked else "ALLOW",
+            reasons=reasons,
+            model_version=DEGRADED_MODEL_VERSION,
+        )
+
+    def overload_stats(self) -> dict | None:
+        return self.overload.stats() if self.overload is not None else None
+
+    def cascade_stats(self) -> dict:
+        """Per-stage call counts and escalation rates for this endpoint's cascade."""
+        stages = []
+        for i, (name, _) in enumerate(self.providers):
+            calls = self._stage_calls[i]
+            escalated = self._stage_escalations[i]
+            stages.append({
+                "provider": name,
+                "calls": calls,
+                "escalated": escalated,
+                "escalation_rate": escalated / calls if calls else 0.0,
+            })
+        last_calls = self._stage_calls[-1] if len(self.providers) > 1 else 0
+        return {
+            "mode": self.mode,
+            "uncertainty_band": list(self.uncertainty_band),
+            "requests": self._cascade_requests,
+            "escalation_rate": last_calls / self._cascade_requests if self._cascade_requests else 0.0,
+            "stages": stages,
+        }
+
+    async def _run_parallel(self, text: str, *, stop_on_block: bool) -> tuple[list, int | None]:
+        """Run all providers concurrently.
+
+        Returns per-provider ``(score, label)`` results in configured order (``None``
+        for providers cancelled before finishing) and the index of the blocking
+        provider. With ``stop_on_block`` the first BLOCK cancels the providers still
+        running, which releases their batcher slots and in-flight remote calls.
+        """
+        tasks = [asyncio.ensure_future(self._call(name, provider, text)) for name, provider in self.providers]
+        index = {task: i for i, task in enumerate(tasks)}
+        results: list = [None] * len(tasks)
+        blocked_by: int | None = None
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=index.get):
+                    i = index[task]
+                    results[i] = task.result()
+                    if blocked_by is None and results[i][0] >= 0.5:
+                        blocked_by = i
+                if stop_on_block and blocked_by is not None:
+                    break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        return results, blocked_by
+
+    async def _moderate_cascade(self, text: str, reasons: List[Reason]) -> ModerationResponse:
+        low, high = self.uncertainty_band
+        self._cascade_requests += 1
+        last = len(self.providers) - 1
+        for i, (name, provider) in enumerate(self.providers):
+            self._stage_calls[i] += 1
+            score, label = await self._call(name, provider, text)
+            reasons.append(Reason(engine=name, category=label, score=score))
+            if i == last:
+                blocked = score >= 0.5
+            elif label == PROVIDER_UNAVAILABLE:
+                # No verdict from this stage: let the next one decide.
+                self._stage_escalations[i] += 1
+                continue
+            elif score >= high:
+                blocked = True
+            elif score < low:
+                blocked = False
+            else:
+                self._stage_escalations[i] += 1
+                continue
+            return ModerationResponse(
+                safe=not blocked,
+                decision="BLOCK" if blocked else "ALLOW",
+                reasons=reasons,
+                model_version=name if blocked else _allow_version(name, reasons),
+            )
+        return ModerationResponse(safe=True, decision="ALLOW", reasons=reasons, model_version=_allow_version("pipeline", reasons))
+
+    async def _call(self, name: str, provider, text: str) -> tuple[float, str | None]:
+        start = time.monotonic()
+        try:
+            with tracing.span(f"provider {name}", attributes={"provider": name}):
+                return await provider.moderate(text)
+        finally:
+            elapsed = time.monotonic() - start
+            self._m_providers[name].observe(elapsed)
+            timing.record(name, elapsed)
+
+    def rule_response(self, rule: Rule) -> ModerationResponse:
+        """Shared, pre-serialized response for a rule hit under the current rule set.
+
+        Rule hits always produce the same body, so it is built and serialized
+        once per rule and rule set version. Callers must not mutate it.
+        """
+        version = self.rule_engine.version
+        if version != self._rule_responses_version:
+            self._rule_responses.clear()
+            self._rule_responses_version = version
+        key = (rule.id, rule.action)
+        resp = self._rule_responses.get(key)
+        if resp is None:
+            resp = ModerationResponse(
+                safe=rule.action == "ALLOW",
+                decision=rule.action,
+                reasons=[Reason(engine="rule", id=rule.id)],
+                policy_version="v1",
+            ).preserialize()
+            self._rule_responses[key] = resp
+        return resp
+
+    def _record_response(self, text: str, resp: ModerationResponse, start_time: float) -> None:
+        total_s = time.monotonic() - start_time
+        self._m_total.observe(total_s)
+        metrics.REQUESTS.labels(self.api_path, resp.decision, decision_source(resp)).inc()
+        if not sampled(api_logger, self.api_path):
+            return
+        n, h = text_fingerprint(text)
+        log_event(
+            api_logger,
+            "moderation",
+            endpoint=self.api_path,
+            len=n,
+            hash=h,
+            decision=resp.decision,
+            model_version=resp.model_version,
+            total_s=round(total_s, 6),
+        )
+
+    async def moderate(self, text: str, deadline_s: float | None = None) -> ModerationResponse:
+        """Moderate ``text``.
+
+        Raises admission.AdmissionRejected when the providers' predicted wait
+        exceeds ``deadline_s`` (default SENTINELSHIELD_REQUEST_DEADLINE_MS);
+        requests answered by the rule engine are always admitted.
+        """
         start_time = time.monotonic()
         reasons: List[Reason] = []
 
         if self.api_path == "/v1/full-prompt-guard":
-            rules = self.rule_engine.scan(text)
+            rule_start = time.monotonic()
+            with tracing.span("rules.scan") as rule_span:
+                rules = self.rule_engine.scan(text)
+                rule_span.set_attribute("rules.matched", len(rules))
+            rule_s = time.monotonic() - rule_start
+            self._m_rules.observe(rule_s)
+            timing.record("rules", rule_s)
+            metrics.RULE_EVALUATIONS.labels(self.api_path, "hit" if rules else "miss").inc()
             for r in rules:
                 reasons.append(Reason(engine="rule", id=r.id))
 
             blocked_by_rule = any(r.action != "ALLOW" for r in rules)
+            if self.providers:
+                estimate = self.estimated_wait_s()
+                if self.overload is not None and self.overload.should_degrade(estimate):
+                    resp = self.degraded_response(text, reasons, blocked=blocked_by_rule)
+                    self._record_response(text, resp, start_time)
+                    return resp
+                if blocked_by_rule and not admission.admits(estimate, deadline_s):
+                    # The rules already decided: answer BLOCK rather than invite a retry with a 429.
+                    resp = ModerationResponse(safe=False, decision="BLOCK", reasons=reasons, model_version="full-scan")
+                    self._record_response(text, resp, start_time)
+                    return resp
+                admission.check(self.api_path, estimate, deadline_s)
 
             blocked_by_model = False
-            for name, provider in self.providers:
-                score, label = await provider.moderate(text)
-                reasons.append(Reason(engine=name, category=label, score=score))
-                if score >= 0.5:
-                    blocked_by_model = True
+            if self.parallel:
+                results, blocked = await self._run_parallel(text, stop_on_block=False)
+                for (name, _), (score, label) in zip(self.providers, results):
+                    reasons.append(Reason(engine=name, category=label, score=score))
+                blocked_by_model = blocked is not None
+            else:
+                for name, provider in self.providers:
+                    score, label = await self._call(name, provider, text)
+                    reasons.append(Reason(engine=name, category=label, score=score))
+                    if score >= 0.5:
+                        blocked_by_model = True
 
             if blocked_by_rule or blocked_by_model:
                 resp = ModerationResponse(
@@ -236,34 +449,64 @@ class Orchestrator:
                     reasons=reasons,
                     model_version="full-scan",
                 )
-                self._log_response(text, resp, start_time)
+                self._record_response(text, resp, start_time)
                 return resp
 
             resp = ModerationResponse(
                 safe=True,
                 decision="ALLOW",
                 reasons=reasons,
-                model_version="full-scan",
+                model_version=_allow_version("full-scan", reasons),
             )
-            self._log_response(text, resp, start_time)
+            self._record_response(text, resp, start_time)
             return resp
 
         # 1. Rule engine check first
-        rule = self.rule_engine.evaluate(text)
+        with tracing.span("rules.evaluate") as rule_span:
+            rule = self.rule_engine.evaluate(text)
+            rule_span.set_attribute("rules.hit", rule.id if rule else "")
+        rule_s = time.monotonic() - start_time
+        self._m_rules.observe(rule_s)
+        timing.record("rules", rule_s)
+        metrics.RULE_EVALUATIONS.labels(self.api_path, "hit" if rule else "miss").inc()
         if rule:
-            reasons.append(Reason(engine="rule", id=rule.id))
-            resp = ModerationResponse(
-                safe=rule.action == "ALLOW",
-                decision=rule.action,
-                reasons=reasons,
-                policy_version="v1",
-            )
-            self._log_response(text, resp, start_time)
+            resp = self.rule_response(rule)
+            self._record_response(text, resp, start_time)
             return resp
 
         # 2. Model providers pipeline
+        if self.providers:
+            estimate = self.estimated_wait_s()
+            if self.overload is not None and self.overload.should_degrade(estimate):
+                resp = self.degraded_response(text, reasons)
+                self._record_response(text, resp, start_time)
+                return resp
+            admission.check(self.api_path, estimate, deadline_s)
+
+        if self.mode == "cascade" and self.providers:
+            resp = await self._moderate_cascade(text, reasons)
+            self._record_response(text, resp, start_time)
+            return resp
+
+        if self.parallel and len(self.providers) > 1:
+            results, blocked = await self._run_parallel(text, stop_on_block=True)
+            for (name, _), res in zip(self.providers, results):
+                if res is not None:
+                    reasons.append(Reason(engine=name, category=res[1], score=res[0]))
+            if blocked is not None:
+                resp = ModerationResponse(
+                    safe=False,
+                    decision="BLOCK",
+                    reasons=reasons,
+                    model_version=self.providers[blocked][0],
+                )
+            else:
+                resp = ModerationResponse(safe=True, decision="ALLOW", reasons=reasons, model_version=_allow_version("pipeline", reasons))
+            self._record_response(text, resp, start_time)
+            return resp
+
         for name, provider in self.providers:
-            score, label = await provider.moderate(text)
+            score, label = await self._call(name, provider, text)
             reasons.append(Reason(engine=name, category=label, score=score))
             if score >= 0.5:
                 resp = ModerationResponse(
@@ -272,7 +515,7 @@ class Orchestrator:
                     reasons=reasons,
                     model_version=name,
                 )
-                self._log_response(text, resp, start_time)
+                self._record_response(text, resp, start_time)
                 return resp
 
         # If all pass
@@ -280,9 +523,9 @@ class Orchestrator:
             safe=True,
             decision="ALLOW",
             reasons=reasons,
-            model_version="pipeline",
+            model_version=_allow_version("pipeline", reasons),
         )
-        self._log_response(text, resp, start_time)
+        self._record_response(text, resp, start_time)
         return resp
 
 
@@ -295,4 +538,6 @@ def build_orchestrator(
     rule_engine = RuleEngine(rules_files)
     if model_name:
         settings.model.active = model_name
-    return Orchestrator(rule_engine, api_path)
+    orc = Orchestrator(rule_engine, api_path)
+    orchestrators[api_path] = orc
+    return orc
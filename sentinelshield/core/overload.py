@@ -0,0 +1,98 @@
+"""Overload policy: fall back to rules-only verdicts while the models are saturated.
+
+An endpoint with ``APIConfig(overload_policy="rules_only")`` gets an
+OverloadGuard. It watches the predicted model wait (the same estimate admission
+control uses). When that reaches the enter threshold, requests that miss the
+rule engine get an immediate verdict from rules and cached provider results
+only, marked ``model_version="degraded:rules-only"``. The endpoint recovers once
+the estimate has stayed at or below the lower exit threshold for the minimum
+hold time; the gap between the two thresholds is the hysteresis. While degraded,
+one request per probe interval still goes to the models so the latency estimate
+keeps being refreshed.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+from .logger import system_logger
+
+DEGRADED_MODEL_VERSION = "degraded:rules-only"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        v = float(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+class OverloadGuard:
+    def __init__(
+        self,
+        name: str,
+        *,
+        enter_wait_s: float | None = None,
+        exit_wait_s: float | None = None,
+        min_hold_s: float | None = None,
+        probe_interval_s: float | None = None,
+    ) -> None:
+        self.name = name
+        self.enter_wait_s = enter_wait_s or _env_float("SENTINELSHIELD_DEGRADE_ENTER_WAIT_MS", 2000.0) / 1000.0
+        self.exit_wait_s = min(self.enter_wait_s, exit_wait_s or _env_float("SENTINELSHIELD_DEGRADE_EXIT_WAIT_MS", 500.0) / 1000.0)
+        self.min_hold_s = min_hold_s or _env_float("SENTINELSHIELD_DEGRADE_MIN_HOLD_S", 5.0)
+        self.probe_interval_s = probe_interval_s or _env_float("SENTINELSHIELD_DEGRADE_PROBE_INTERVAL_S", 1.0)
+        self.degraded = False
+        self.transitions = 0
+        self.degraded_requests = 0
+        self._degraded_since = 0.0
+        self._calm_since: float | None = None
+        self._last_probe = 0.0
+        self._degraded_total_s = 0.0
+
+    def should_degrade(self, estimated_wait_s: float) -> bool:
+        """Update the state from the current estimate; True if this request gets a rules-only verdict."""
+        now = time.monotonic()
+        if not self.degraded:
+            if estimated_wait_s < self.enter_wait_s:
+                return False
+            self.degraded = True
+            self.transitions += 1
+            self._degraded_since = now
+            self._calm_since = None
+            self._last_probe = now
+            system_logger.warning(f"{self.name}: overloaded (estimated wait {estimated_wait_s:.3f}s), serving rules-only verdicts")
+        elif estimated_wait_s <= self.exit_wait_s:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.min_hold_s and now - self._degraded_since >= self.min_hold_s:
+                self.degraded = False
+                self._degraded_total_s += now - self._degraded_since
+                system_logger.info(f"{self.name}: recovered after {now - self._degraded_since:.1f}s degraded")
+                return False
+        else:
+            self._calm_since = None
+
+        if now - self._last_probe >= self.probe_interval_s:
+            self._last_probe = now
+            return False  # probe: let this one through to refresh the estimate
+        self.degraded_requests += 1
+        return True
+
+    def degraded_seconds_total(self) -> float:
+        total = self._degraded_total_s
+        if self.degraded:
+            total += time.monotonic() - self._degraded_since
+        return total
+
+    def stats(self) -> dict:
+        return {
+            "degraded": self.degraded,
+            "degraded_seconds_total": self.degraded_seconds_total(),
+            "transitions": self.transitions,
+            "degraded_requests": self.degraded_requests,
+            "enter_wait_s": self.enter_wait_s,
+            "exit_wait_s": self.exit_wait_s,
+        }
@@ -0,0 +1,178 @@
+"""On-demand CPU and memory profiling of the worker serving the request.
+
+Nothing here runs until an admin endpoint asks for it: no profiler hook, no
+sampler thread and no tracemalloc tracing exist between captures. One capture
+runs at a time per worker, so a second request gets ``ProfilerBusy``.
+
+    cpu_pstats(seconds)        – cProfile on the event-loop thread; every
+                                 coroutine step the worker runs is recorded.
+                                 Returns a marshalled pstats dump
+                                 (``pstats.Stats(path)``, snakeviz, ...).
+    cpu_collapsed(seconds, …)  – samples the stacks of all threads (event loop,
+                                 inference executors, batchers) at a fixed
+                                 interval. Returns collapsed stacks for
+                                 flamegraph.pl / speedscope.
+    memory_diff(seconds, …)    – tracemalloc snapshots at the start and end of
+                                 the window, the top allocation sites that
+                                 grew, and the size of every in-process cache.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import FrameType
+from typing import Any, Iterable
+
+MAX_SECONDS = 60.0
+# Frames kept per tracemalloc traceback. Deeper traces cost more while tracing.
+_TRACE_FRAMES = 8
+
+
+class ProfilerBusy(RuntimeError):
+    """Another capture is already running in this worker."""
+
+
+_lock = threading.Lock()
+
+
+def _exclusive() -> None:
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already being captured")
+
+
+async def cpu_pstats(seconds: float) -> bytes:
+    """Deterministic profile of the event-loop thread for ``seconds``."""
+    _exclusive()
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)
+    finally:
+        _lock.release()
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample(seconds: float, interval_s: float) -> Counter[str]:
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels = []
+            f: FrameType | None = frame
+            while f is not None:
+                labels.append(_frame_label(f))
+                f = f.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval_s)
+    return stacks
+
+
+async def cpu_collapsed(seconds: float, interval_s: float = 0.005) -> str:
+    """Sampled stacks of every thread, as ``thread;outer;...;inner count`` lines."""
+    _exclusive()
+    try:
+        stacks = await asyncio.to_thread(_sample, seconds, interval_s)
+    finally:
+        _lock.release()
+    return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+
+def deep_sizeof(obj: Any, _seen: set[int] | None = None) -> int:
+    """Approximate retained size of ``obj``: containers, slots and ``__dict__``s are followed."""
+    seen = _seen if _seen is not None else set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            d = getattr(o, "__dict__", None)
+            if d is not None:
+                stack.append(d)
+            for slot in getattr(type(o), "__slots__", ()):
+                v = getattr(o, slot, None)
+                if v is not None:
+                    stack.append(v)
+    return total
+
+
+def cache_sizes(caches: Iterable[tuple[str, Any]]) -> dict[str, dict[str, int]]:
+    """Entries and approximate bytes per named cache (each object counted once)."""
+    out: dict[str, dict[str, int]] = {}
+    seen: set[int] = set()
+    for name, cache in caches:
+        if id(cache) in seen:
+            continue
+        out[name] = {"entries": len(cache), "bytes": deep_sizeof(cache, seen)}
+    return out
+
+
+async def memory_diff(seconds: float, caches: Iterable[tuple[str, Any]], top: int = 25) -> dict:
+    """tracemalloc growth over ``seconds`` plus the current size of each cache.
+
+    Tracing is started for the window only (unless something else already
+    started it) and stopped afterwards, so its overhead ends with the request.
+    """
+    _exclusive()
+    try:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(_TRACE_FRAMES)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+    finally:
+        _lock.release()
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    return {
+        "seconds": seconds,
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "top_growth": [
+            {
+                "location": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                "size_diff_bytes": s.size_diff,
+                "count_diff": s.count_diff,
+                "size_bytes": s.size,
+            }
+            for s in diff[:top]
+        ],
+        "caches": cache_sizes(caches),
+    }
@@ -1,11 +1,18 @@
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from typing import List
 
 import orjson
 from fastapi.responses import Response
 
+from . import timing
 
-@dataclass
+_FIELDS = ("safe", "decision", "reasons", "policy_version", "model_version")
+
+# Reason.category of a provider that could not score the text and failed open.
+PROVIDER_UNAVAILABLE = "unavailable"
+
+
+@dataclass(slots=True)
 class Reason:
     engine: str
     id: str | None = None
@@ -13,16 +20,32 @@ class Reason:
     score: float | None = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ModerationResponse:
     safe: bool
     decision: str
     reasons: List[Reason] = field(default_factory=list)
     policy_version: str | None = None
     model_version: str | None = None
+    # orjson skips underscore fields, so this never reaches the JSON body.
+    _json: bytes | None = field(default=None, init=False, repr=False, compare=False)
+
+    def preserialize(self) -> "ModerationResponse":
+        """Serialize once and reuse the bytes; the response must not be mutated afterwards."""
+        self._json = orjson.dumps(self)
+        return self
+
+    def to_json(self) -> bytes:
+        timings = timing.current()
+        if timings is not None and timings.in_body:
+            body = {name: getattr(self, name) for name in _FIELDS}
+            body["timings"] = timings.as_ms()
+            return orjson.dumps(body)
+        # orjson serializes slotted dataclasses natively, without asdict's deep copy.
+        return self._json if self._json is not None else orjson.dumps(self)
 
     def to_response(self) -> Response:
         return Response(
-            content=orjson.dumps(asdict(self)),
+            content=self.to_json(),
             media_type="application/json",
         )
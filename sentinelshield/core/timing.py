@@ -0,0 +1,58 @@
+"""Per-request stage timings, reported in a ``Server-Timing`` header.
+
+``api.server_timing.ServerTimingMiddleware`` opens a ``StageTimings`` for each
+request in a context variable. Pipeline code calls ``record(stage, seconds)``,
+which is a no-op outside a request. Tasks spawned by the request inherit the
+same collector, so concurrent stages (parallel providers, head/tail windows)
+are summed under their stage name. Long-lived workers that serve many requests,
+such as the batcher loops, must not record. They hand their timings back to
+the waiting request instead.
+"""
+
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar, Token
+
+
+class StageTimings:
+    __slots__ = ("start", "stages", "in_body")
+
+    def __init__(self, in_body: bool = False) -> None:
+        self.start = time.monotonic()
+        self.stages: dict[str, float] = {}
+        # The caller asked for the timings in the response body as well.
+        self.in_body = in_body
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_ms(self) -> dict[str, float]:
+        out = {stage: round(s * 1000.0, 3) for stage, s in self.stages.items()}
+        out["total"] = round((time.monotonic() - self.start) * 1000.0, 3)
+        return out
+
+    def header_value(self) -> str:
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.as_ms().items())
+
+
+_current: ContextVar[StageTimings | None] = ContextVar("sentinelshield_stage_timings", default=None)
+
+
+def begin(in_body: bool = False) -> tuple[StageTimings, Token]:
+    timings = StageTimings(in_body)
+    return timings, _current.set(timings)
+
+
+def end(token: Token) -> None:
+    _current.reset(token)
+
+
+def current() -> StageTimings | None:
+    return _current.get()
+
+
+def record(stage: str, seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
@@ -0,0 +1,285 @@
+"""OpenTelemetry-compatible trace spans with a local OTLP/JSON exporter.
+
+SENTINELSHIELD_TRACING=1 turns tracing on. When it is off, ``span()`` returns a
+shared no-op and nothing is allocated. Spans follow the OpenTelemetry data model:
+- 16-byte trace ids and 8-byte span ids
+- parent ids, kinds, attributes, links and a status.
+
+They are exported as OTLP/JSON lines, one ``{"resourceSpans": [...]}`` object
+per flushed batch. These are the files written by the collector's ``file``
+exporter, so ``otelcol`` or any OTLP/JSON reader can ingest them. A W3C
+``traceparent`` on the incoming request becomes the parent of the request span,
+and the qw3 client forwards the context upstream.
+
+    SENTINELSHIELD_TRACE_EXPORTER   – "file" (default) or "stdout"
+    SENTINELSHIELD_TRACE_FILE       – file exporter path (default logs/traces.jsonl)
+    SENTINELSHIELD_TRACE_BATCH_SIZE – spans buffered before a write (default 64)
+
+Shared work is traced the OpenTelemetry way. For example, a micro-batch gets
+its own root span that links to every request span it served, and each
+request's enqueue span links back to that batch span.
+"""
+
+from __future__ import annotations
+
+import abc
+import os
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Iterable, Mapping, NamedTuple
+
+import orjson
+
+# OTLP SpanKind values.
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+_STATUS_OK, _STATUS_ERROR = 1, 2
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        v = int(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+enabled = os.getenv("SENTINELSHIELD_TRACING", "0").lower() in {"1", "true", "yes"}
+
+
+class SpanContext(NamedTuple):
+    trace_id: str  # 32 lowercase hex chars
+    span_id: str  # 16 lowercase hex chars
+
+
+class Span:
+    __slots__ = ("name", "kind", "context", "parent_id", "start_ns", "end_ns", "attributes", "links", "status", "_token")
+
+    def __init__(self, name: str, kind: int, context: SpanContext, parent_id: str | None,
+                 attributes: Mapping[str, Any] | None, links: Iterable[SpanContext] | None) -> None:
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = dict(attributes) if attributes else {}
+        self.links = list(links) if links else []
+        self.status = 0
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_link(self, context: SpanContext) -> None:
+        self.links.append(context)
+
+    def record_error(self, exc: BaseException) -> None:
+        self.status = _STATUS_ERROR
+        self.attributes["exception.type"] = type(exc).__name__
+
+    def end(self) -> None:
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            _exporter.add(self)
+
+    # Context manager: makes the span current for the enclosed block.
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.record_error(exc)
+        _current.reset(self._token)
+        self.end()
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "links": [{"traceId": link.trace_id, "spanId": link.span_id} for link in self.links],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    context = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add_link(self, context: SpanContext) -> None:
+        pass
+
+    def record_error(self, exc: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current: ContextVar[Span | None] = ContextVar("sentinelshield_span", default=None)
+# Remote parent from the incoming traceparent, used by the request's root span.
+_remote: ContextVar[SpanContext | None] = ContextVar("sentinelshield_remote_span", default=None)
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def span(name: str, *, kind: int = INTERNAL, attributes: Mapping[str, Any] | None = None,
+         links: Iterable[SpanContext] | None = None, root: bool = False) -> Span | _NoopSpan:
+    """A span that is a child of the current one (or of the incoming traceparent).
+
+    Use as ``with span(...):`` to make it current, or call ``end()`` yourself.
+    ``root=True`` starts a new trace regardless of the current context.
+    """
+    if not enabled:
+        return NOOP_SPAN
+    parent = None if root else _current.get()
+    if parent is not None:
+        trace_id, parent_id = parent.context.trace_id, parent.context.span_id
+    else:
+        remote = None if root else _remote.get()
+        trace_id = remote.trace_id if remote is not None else secrets.token_hex(16)
+        parent_id = remote.span_id if remote is not None else None
+    return Span(name, kind, SpanContext(trace_id, secrets.token_hex(8)), parent_id, attributes, links)
+
+
+def current_context() -> SpanContext | None:
+    current = _current.get() if enabled else None
+    return current.context if current is not None else None
+
+
+def extract(headers: Mapping[str, str]) -> SpanContext | None:
+    """Parse a W3C ``traceparent`` header (``00-<trace>-<span>-<flags>``)."""
+    value = headers.get("traceparent")
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    trace_id, span_id = parts[1].lower(), parts[2].lower()
+    try:
+        int(trace_id, 16), int(span_id, 16)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id)
+
+
+def set_remote_parent(context: SpanContext | None):
+    return _remote.set(context)
+
+
+def reset_remote_parent(token) -> None:
+    _remote.reset(token)
+
+
+def inject(headers: dict[str, str], context: SpanContext | None = None) -> dict[str, str]:
+    """Add ``traceparent`` for ``context`` (default: the current span) to outgoing ``headers``."""
+    context = context or current_context()
+    if context is not None:
+        headers["traceparent"] = f"00-{context.trace_id}-{context.span_id}-01"
+    return headers
+
+
+class _Exporter(abc.ABC):
+    """Buffers finished spans and writes them as OTLP/JSON lines."""
+
+    def __init__(self, batch_size: int) -> None:
+        self.batch_size = batch_size
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+        self.exported = 0
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            if len(self._spans) < self.batch_size:
+                return
+            spans, self._spans = self._spans, []
+        self._export(spans)
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if spans:
+            self._export(spans)
+
+    def _export(self, spans: list[Span]) -> None:
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _otlp_attribute("service.name", "sentinelshield"),
+                    _otlp_attribute("process.pid", os.getpid()),
+                ]},
+                "scopeSpans": [{"scope": {"name": "sentinelshield"}, "spans": [s.to_otlp() for s in spans]}],
+            }]
+        }
+        try:
+            self._write(orjson.dumps(body, option=orjson.OPT_APPEND_NEWLINE))
+            self.exported += len(spans)
+        except OSError:
+            pass
+
+    @abc.abstractmethod
+    def _write(self, line: bytes) -> None:
+        """Persist one OTLP/JSON line."""
+
+
+class FileExporter(_Exporter):
+    def __init__(self, path: str, batch_size: int = 64) -> None:
+        super().__init__(batch_size)
+        self.path = path
+
+    def _write(self, line: bytes) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(line)
+
+
+class StdoutExporter(_Exporter):
+    def _write(self, line: bytes) -> None:
+        sys.stdout.buffer.write(line)
+        sys.stdout.flush()
+
+
+def _build_exporter() -> _Exporter:
+    batch_size = _env_int("SENTINELSHIELD_TRACE_BATCH_SIZE", 64)
+    if os.getenv("SENTINELSHIELD_TRACE_EXPORTER", "file").lower() == "stdout":
+        return StdoutExporter(batch_size)
+    return FileExporter(os.getenv("SENTINELSHIELD_TRACE_FILE", "logs/traces.jsonl"), batch_size)
+
+
+_exporter: _Exporter = _build_exporter()
+
+
+def flush() -> None:
+    _exporter.flush()
@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+import abc
+import os
+from typing import Any
+
+from ..core.logger import logger
+from .weights import mmap_enabled, pretrained_kwargs, share_mmap_weights
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        v = int(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+def _labels_from_config(config) -> list[str]:
+    id2label = getattr(config, "id2label", None) or {}
+    return [id2label.get(i, f"LABEL_{i}") for i in range(max(2, len(id2label)))]
+
+
+class _ClassifierEngine(abc.ABC):
+    """Shared surface of the direct classifier engines.
+
+    Subclasses set ``tokenizer`` and ``labels`` and implement ``encode`` (batch of
+    texts -> padded model inputs) and ``predict`` (model inputs -> float array of
+    unsafe probabilities, ``1 - P(label 0)``).
+    """
+
+    tokenizer = None
+    labels: list[str] = ["LABEL_0", "LABEL_1"]
+
+    @abc.abstractmethod
+    def encode(self, texts: list[str]):
+        """Batch of texts -> padded model inputs."""
+
+    @abc.abstractmethod
+    def predict(self, encoded):
+        """Model inputs -> float array of unsafe probabilities."""
+
+    def label_for(self, score: float) -> str:
+        return self.labels[1] if score >= 0.5 else self.labels[0]
+
+    def __call__(self, texts: list[str]):
+        return self.predict(self.encode(texts))
+
+
+class TorchClassifierEngine(_ClassifierEngine):
+    """Sequence-classification engine that owns its tokenizer and model directly.
+
+    Unlike ``transformers.pipeline("text-classification")`` there is no per-item
+    dict building or Python-side softmax: ``encode`` produces padded tensors for a
+    whole batch, ``predict`` runs one forward pass under ``torch.inference_mode``
+    and returns a float array of unsafe probabilities (``1 - P(label 0)``).
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        *,
+        device: str = "cpu",
+        max_length: int = 512,
+        num_threads: int | None = None,
+    ) -> None:
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        if device.startswith("npu"):
+            try:  # pragma: no cover - Ascend only
+                import torch_npu  # noqa: F401
+            except Exception as e:  # pragma: no cover - Ascend only
+                logger.warning("torch_npu not available for device %s: %s", device, e)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self._torch = torch
+        self.device = torch.device(device)
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_path, **pretrained_kwargs())
+        self.model.to(self.device).eval()
+        # CPU-resident weights point at the page cache so all workers share one copy.
+        self.shared_bytes = share_mmap_weights(self.model, model_path) if mmap_enabled(device) else 0
+
+        self.labels = _labels_from_config(self.model.config)
+
+    def encode(self, texts: list[str]):
+        """Tokenize ``texts`` into padded, truncated tensors on the engine device."""
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="pt",
+        )
+        return {k: v.to(self.device) for k, v in enc.items()}
+
+    def predict(self, encoded):
+        """Run one forward pass over pre-tokenized tensors; return unsafe scores as a numpy array."""
+        torch = self._torch
+        with torch.inference_mode():
+            logits = self.model(**encoded).logits
+            scores = 1.0 - torch.softmax(logits.float(), dim=-1)[:, 0]
+        return scores.cpu().numpy()
+
+
+class OnnxClassifierEngine(_ClassifierEngine):
+    """ONNX Runtime counterpart of TorchClassifierEngine for CPU-only nodes.
+
+    Loads a graph produced by ``python -m sentinelshield.models.export_onnx``
+    (fp32 or dynamically int8-quantized) and computes the same scores with a
+    numpy softmax, so it is a drop-in ``batch_fn`` target for InferenceBatcher.
+    """
+
+    def __init__(
+        self,
+        onnx_path: str,
+        tokenizer_path: str,
+        *,
+        max_length: int = 512,
+        num_threads: int | None = None,
+    ) -> None:
+        import numpy as np
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        opts.inter_op_num_threads = 1
+
+        self._np = np
+        self.session = ort.InferenceSession(onnx_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        self.labels = _labels_from_config(AutoConfig.from_pretrained(tokenizer_path))
+
+    def encode(self, texts: list[str]):
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        return {k: v.astype(self._np.int64) for k, v in enc.items() if k in self._input_names}
+
+    def predict(self, encoded):
+        np = self._np
+        logits = self.session.run(["logits"], encoded)[0].astype(np.float32)
+        logits -= logits.max(axis=-1, keepdims=True)
+        probs = np.exp(logits)
+        return 1.0 - probs[:, 0] / probs.sum(axis=-1)
+
+
+# Llama Guard 4 hazard taxonomy (MLCommons), as listed in the official prompt.
+LLAMA_GUARD_CATEGORIES = [
+    ("S1", "Violent Crimes"),
+    ("S2", "Non-Violent Crimes"),
+    ("S3", "Sex Crimes"),
+    ("S4", "Child Sexual Exploitation"),
+    ("S5", "Defamation"),
+    ("S6", "Specialized Advice"),
+    ("S7", "Privacy"),
+    ("S8", "Intellectual Property"),
+    ("S9", "Indiscriminate Weapons"),
+    ("S10", "Hate"),
+    ("S11", "Suicide & Self-Harm"),
+    ("S12", "Sexual Content"),
+    ("S13", "Elections"),
+    ("S14", "Code Interpreter Abuse"),
+]
+
+# Official Llama Guard 4 prompt, split so the fixed parts are tokenized once.
+LLAMA_GUARD_PREAMBLE = (
+    "<|begin_of_text|><|header_start|>user<|header_end|>\n\n"
+    "Task: Check if there is unsafe content in 'User' messages in conversations "
+    "according to our safety policy with the below categories.\n\n"
+    "<BEGIN UNSAFE CONTENT CATEGORIES>\n"
+    + "".join(f"{code}: {name}.\n" for code, name in LLAMA_GUARD_CATEGORIES)
+    + "<END UNSAFE CONTENT CATEGORIES>\n\n"
+    "<BEGIN CONVERSATION>\n\n"
+)
+LLAMA_GUARD_POSTAMBLE = (
+    "\n\n<END CONVERSATION>\n\n"
+    "Provide your safety assessment for ONLY THE LAST User message in the above conversation:\n"
+    " - First line must read 'safe' or 'unsafe'.\n"
+    " - If unsafe, a second line must include a comma-separated list of violated categories."
+    "<|eot|><|header_start|>assistant<|header_end|>\n\n"
+)
+# Continuation appended after the prompt so the same forward pass also yields
+# the category distribution conditioned on an "unsafe" verdict.
+_LLAMA_GUARD_CATEGORY_PROBE = "unsafe\nS"
+
+
+class LlamaGuardScoringEngine:
+    """Scores Llama Guard with one forward pass instead of autoregressive decoding.
+
+    Each text is wrapped in the official prompt. The logits at the position that
+    predicts the assistant's first token give ``P(unsafe)`` over the two-token
+    {"safe", "unsafe"} distribution (optionally temperature-calibrated). When
+    ``categories`` is on, ``"unsafe\nS"`` is appended to every row so the last
+    position's logits over the category number tokens identify the most likely
+    violated category, still within the same single pass. Only the last few
+    positions' logits are materialised, never the full ``seq x vocab`` matrix.
+
+    With ``prefix_cache`` the policy preamble, which is identical for every
+    request, is run once at load time on this engine's device. Its KV cache is
+    then reused by every batch, so a forward pass only covers the conversation
+    and the closing instructions.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        *,
+        device: str = "cpu",
+        max_length: int = 4096,
+        num_threads: int | None = None,
+        temperature: float = 1.0,
+        categories: bool = True,
+        prefix_cache: bool = True,
+    ) -> None:
+        import inspect
+
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self._torch = torch
+        self.device = torch.device(device)
+        self.max_length = max_length
+        self.temperature = temperature if temperature > 0 else 1.0
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModelForCausalLM.from_pretrained(model_path, **pretrained_kwargs())
+        self.model.to(self.device).eval()
+        self.shared_bytes = share_mmap_weights(self.model, model_path) if mmap_enabled(device) else 0
+
+        params = inspect.signature(self.model.forward).parameters
+        self._keep_kw = next((k for k in ("logits_to_keep", "num_logits_to_keep") if k in params), None)
+
+        def ids(text: str) -> list[int]:
+            return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+        self._preamble_ids = ids(LLAMA_GUARD_PREAMBLE)
+        self._postamble_ids = ids(LLAMA_GUARD_POSTAMBLE)
+        self._safe_id = ids("safe")[0]
+        self._unsafe_id = ids("unsafe")[0]
+        if self._safe_id == self._unsafe_id:
+            raise ValueError("tokenizer does not separate 'safe' and 'unsafe' at the first token")
+        self._pad_id = self.tokenizer.pad_token_id
+        if self._pad_id is None:
+            self._pad_id = self.tokenizer.eos_token_id or 0
+
+        self._probe_ids: list[int] = []
+        self._category_ids: list[int] = []
+        if categories:
+            probe = ids(_LLAMA_GUARD_CATEGORY_PROBE)
+            numbers = [ids(code[1:]) for code, _ in LLAMA_GUARD_CATEGORIES]
+            if probe and probe[0] == self._unsafe_id and all(len(n) == 1 for n in numbers):
+                self._probe_ids = probe
+                self._category_ids = [n[0] for n in numbers]
+            else:
+                logger.warning("Llama Guard tokenizer cannot probe categories in one pass; reporting 'unsafe' only")
+
+        self._prefix: list[tuple[Any, Any]] | None = None
+        if prefix_cache:
+            try:
+                self._prefix = self._compute_prefix()
+            except Exception as e:
+                logger.warning("Llama Guard prefix cache unavailable, recomputing the preamble per batch: %s", e)
+
+    def _compute_prefix(self) -> list[tuple[Any, Any]]:
+        """Run the preamble once; return its per-layer ``(keys, values)`` with batch size 1."""
+        torch = self._torch
+        input_ids = torch.tensor([self._preamble_ids], dtype=torch.long, device=self.device)
+        with torch.inference_mode():
+            cache = self.model(input_ids=input_ids, use_cache=True, **self._keep_kwargs(1)).past_key_values
+        if hasattr(cache, "layers"):
+            return [(layer.keys, layer.values) for layer in cache.layers]
+        return list(zip(cache.key_cache, cache.value_cache))  # transformers 4.x
+
+    def _prefix_cache(self, batch_size: int):
+        """A fresh DynamicCache holding the preamble KV broadcast to ``batch_size`` rows."""
+        from transformers import DynamicCache
+
+        try:
+            cache = DynamicCache(config=self.model.config)
+        except TypeError:  # transformers 4.x
+            cache = DynamicCache()
+        for idx, (keys, values) in enumerate(self._prefix):
+            # update() concatenates into new tensors, so the shared prefix is never written.
+            cache.update(keys.expand(batch_size, -1, -1, -1), values.expand(batch_size, -1, -1, -1), idx)
+        return cache
+
+    def _keep_kwargs(self, keep: int) -> dict:
+        return {self._keep_kw: keep} if self._keep_kw else {}
+
+    def encode(self, texts: list[str]):
+        """Build left-padded prompt tensors (plus the category probe) for ``texts``.
+
+        When the preamble is prefix-cached it is left out of the rows; positions
+        and the attention mask continue after it.
+        """
+        torch = self._torch
+        convs = self.tokenizer([f"User: {t}" for t in texts], add_special_tokens=False)["input_ids"]
+        head = [] if self._prefix is not None else self._preamble_ids
+        rows = [head + conv[-self.max_length:] + self._postamble_ids + self._probe_ids for conv in convs]
+        width = max(len(r) for r in rows)
+        input_ids = torch.full((len(rows), width), self._pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            input_ids[i, width - len(row):] = torch.tensor(row, dtype=torch.long)
+            attention_mask[i, width - len(row):] = 1
+        # Left padding: positions must count real tokens only.
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        if self._prefix is not None:
+            offset = len(self._preamble_ids)
+            position_ids = position_ids + offset
+            attention_mask = torch.cat([torch.ones((len(rows), offset), dtype=torch.long), attention_mask], dim=-1)
+        return {
+            "input_ids": input_ids.to(self.device),
+            "attention_mask": attention_mask.to(self.device),
+            "position_ids": position_ids.to(self.device),
+        }
+
+    def predict(self, encoded):
+        """One forward pass; return ``(unsafe_scores, category_indices or None)`` as numpy arrays."""
+        torch = self._torch
+        keep = len(self._probe_ids) + 1
+        kwargs = self._keep_kwargs(keep)
+        with torch.inference_mode():
+            if self._prefix is not None:
+                kwargs.update(past_key_values=self._prefix_cache(encoded["input_ids"].shape[0]), use_cache=True)
+            else:
+                kwargs["use_cache"] = False
+            logits = self.model(**encoded, **kwargs).logits[:, -keep:, :].float()
+            verdict = logits[:, 0, [self._safe_id, self._unsafe_id]] / self.temperature
+            scores = torch.softmax(verdict, dim=-1)[:, 1]
+            categories = None
+            if self._category_ids:
+                categories = logits[:, -1, self._category_ids].argmax(dim=-1).cpu().numpy()
+        return scores.cpu().numpy(), categories
+
+    def label_for(self, score: float, category: int | None = None) -> str:
+        if score < 0.5:
+            return "safe"
+        if category is None:
+            return "unsafe"
+        return LLAMA_GUARD_CATEGORIES[int(category)][0]
+
+    def __call__(self, texts: list[str]) -> list[tuple[float, str]]:
+        scores, categories = self.predict(self.encode(texts))
+        return [
+            (float(score), self.label_for(float(score), None if categories is None else categories[i]))
+            for i, score in enumerate(scores)
+        ]
+
+
+def load_torch_engine(model_path: str, device: str, *, max_length: int = 512) -> TorchClassifierEngine:
+    """Build a TorchClassifierEngine honouring SENTINELSHIELD_TORCH_NUM_THREADS."""
+    num_threads = _env_int("SENTINELSHIELD_TORCH_NUM_THREADS", 0) or None
+    return TorchClassifierEngine(model_path, device=device, max_length=max_length, num_threads=num_threads)
+
+
+def load_onnx_engine(model_path: str, onnx_path: str | None = None, *, max_length: int = 512) -> OnnxClassifierEngine:
+    """Build an OnnxClassifierEngine for an exported model under ``model_path``.
+
+    ``onnx_path`` defaults to ``<model_path>/onnx/model.onnx``, or ``model.int8.onnx``
+    when SENTINELSHIELD_ONNX_INT8 is set. Threads come from SENTINELSHIELD_ORT_NUM_THREADS.
+    """
+    if onnx_path is None:
+        int8 = os.getenv("SENTINELSHIELD_ONNX_INT8", "0").lower() in {"1", "true", "yes"}
+        onnx_path = os.path.join(model_path, "onnx", "model.int8.onnx" if int8 else "model.onnx")
+    num_threads = _env_int("SENTINELSHIELD_ORT_NUM_THREADS", 0) or None
+    return OnnxClassifierEngine(onnx_path, model_path, max_length=max_length, num_threads=num_threads)
+
+
+def load_llama_guard_engine(
+    model_path: str,
+    device: str,
+    *,
+    max_length: int = 4096,
+    temperature: float = 1.0,
+    categories: bool = True,
+    prefix_cache: bool = True,
+) -> LlamaGuardScoringEngine:
+    """Build a LlamaGuardScoringEngine honouring SENTINELSHIELD_TORCH_NUM_THREADS."""
+    num_threads = _env_int("SENTINELSHIELD_TORCH_NUM_THREADS", 0) or None
+    return LlamaGuardScoringEngine(
+        model_path,
+        device=device,
+        max_length=max_length,
+        num_threads=num_threads,
+        temperature=temperature,
+        categories=categories,
+        prefix_cache=prefix_cache,
+    )
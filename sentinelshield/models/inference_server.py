@@ -0,0 +1,155 @@
+"""
+Standalone inference server: model providers in their own process.
+
+HTTP workers normally import the model providers and each own a model replica,
+which ties WEB_CONCURRENCY to the number of model copies. In split mode the
+gunicorn master starts SENTINELSHIELD_INFERENCE_REPLICAS of these servers (see
+gunicorn.conf.py); every HTTP worker talks to them through
+``providers.remote.RemoteProvider`` over Unix sockets, so HTTP capacity and
+model replicas scale independently. Batching stays inside the server: requests
+from all HTTP workers land in the same provider InferenceBatcher.
+
+Run manually:
+    python -m sentinelshield.models.inference_server --socket /tmp/sentinelshield/infer-0.sock
+
+Wire format: each frame is a 4-byte big-endian length followed by an orjson
+object. Requests are ``{"id", "provider", "text"}``; responses are
+``{"id", "score", "label", "wait_s"}`` or ``{"id", "error"}``. ``wait_s`` is
+the provider's predicted wait for a new request, so HTTP workers can run
+admission control against the server's queue. Many requests may be in flight
+on one connection; responses are matched by ``id``.
+
+``{"id", "op": "ping"}`` is answered with ``{"id", "ready": true, "providers"}``.
+The socket is only bound once the models are loaded, and gunicorn.conf.py uses
+this reply as the readiness handshake. ``{"id", "op": "cancel"}`` is sent when
+the caller of request ``id`` gave up (timeout, parallel early exit). The server
+cancels that request, which drops it from the batch queue, and sends no
+response for it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import struct
+import sys
+from functools import partial
+from typing import Any
+
+import orjson
+
+from ..core.logger import logger
+
+_HEADER = struct.Struct(">I")
+_MAX_FRAME = 64 * 1024 * 1024
+
+# Providers that hold model weights and are worth moving out of HTTP workers.
+MODEL_PROVIDERS = ("llama_prompt_guard_2", "llama_guard_4_12b")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > _MAX_FRAME:
+        raise ValueError(f"frame too large: {size}")
+    return orjson.loads(await reader.readexactly(size))
+
+
+def encode_frame(obj: dict) -> bytes:
+    body = orjson.dumps(obj)
+    return _HEADER.pack(len(body)) + body
+
+
+async def _serve_one(req: dict, providers: dict, writer: asyncio.StreamWriter, lock: asyncio.Lock) -> None:
+    rid = req.get("id")
+    provider = providers.get(req.get("provider"))
+    try:
+        if req.get("op") == "ping":
+            out = {"id": rid, "ready": True, "providers": sorted(providers)}
+        elif provider is None:
+            raise KeyError(f"provider {req.get('provider')!r} not served here")
+        else:
+            score, label = await provider.moderate(req.get("text", ""))
+            estimate = getattr(provider, "estimated_wait_s", None)
+            out = {"id": rid, "score": float(score), "label": label, "wait_s": estimate() if callable(estimate) else 0.0}
+    except Exception as e:
+        out = {"id": rid, "error": f"{type(e).__name__}: {e}"}
+    async with lock:
+        writer.write(encode_frame(out))
+        await writer.drain()
+
+
+async def _handle_connection(providers: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    lock = asyncio.Lock()
+    tasks: dict[Any, asyncio.Task] = {}  # request id -> task serving it
+
+    def _done(rid: Any, task: asyncio.Task) -> None:
+        if tasks.get(rid) is task:
+            del tasks[rid]
+
+    try:
+        while True:
+            req = await read_frame(reader)
+            rid = req.get("id")
+            if req.get("op") == "cancel":
+                # The caller gave up: drop the request from the batch queue.
+                task = tasks.get(rid)
+                if task is not None:
+                    task.cancel()
+                continue
+            task = asyncio.create_task(_serve_one(req, providers, writer, lock))
+            tasks[rid] = task
+            task.add_done_callback(partial(_done, rid))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except Exception as e:
+        logger.error("Inference server connection error: %s", e)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        writer.close()
+
+
+async def serve(socket_path: str, providers: dict) -> asyncio.AbstractServer:
+    """Start serving ``providers`` (name -> provider) on ``socket_path``."""
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    return await asyncio.start_unix_server(
+        lambda r, w: _handle_connection(providers, r, w),
+        path=socket_path,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="SentinelShield inference server")
+    parser.add_argument("--socket", required=True, help="Unix socket path to listen on")
+    parser.add_argument(
+        "--providers",
+        default=",".join(MODEL_PROVIDERS),
+        help="comma-separated provider names to serve (only those configured are loaded)",
+    )
+    args = parser.parse_args(argv)
+
+    # This process owns the models: never route back to another server.
+    os.environ.pop("SENTINELSHIELD_INFERENCE_SOCKETS", None)
+    from .providers import get_provider, configured_providers
+
+    names = [n for n in args.providers.split(",") if n and n in configured_providers]
+    providers = {n: get_provider(n) for n in names}
+
+    async def run() -> None:
+        server = await serve(args.socket, providers)
+        logger.info("Inference server pid=%s serving %s on %s", os.getpid(), names, args.socket)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import os
+
 from . import dummy
 
 # Get all configured providers from settings
@@ -7,14 +9,27 @@ from ...core.config import settings
 configured_providers = set()
 for api_config in settings.api_configs.values():
     configured_providers.update(api_config.providers)
+# The qw3 guard's local fallback must be loaded as well.
+if "qw3_guard" in configured_providers and os.getenv("QW3_GUARD_FALLBACK_PROVIDER"):
+    configured_providers.add(os.getenv("QW3_GUARD_FALLBACK_PROVIDER"))
 
 # Only import providers that are actually configured for any API
 _providers = {
     "dummy": dummy.provider,
 }
 
+# Split mode: model providers live in inference server processes (see
+# sentinelshield/models/inference_server.py); HTTP workers only hold proxies.
+_inference_sockets = [p for p in os.getenv("SENTINELSHIELD_INFERENCE_SOCKETS", "").split(",") if p]
+if _inference_sockets:
+    from .remote import RemoteProvider
+    from ..inference_server import MODEL_PROVIDERS
+    for _name in MODEL_PROVIDERS:
+        if _name in configured_providers:
+            _providers[_name] = RemoteProvider(_name, _inference_sockets)
+
 # Only import llama_prompt_guard if it's configured for any API
-if "llama_prompt_guard_2" in configured_providers:
+if "llama_prompt_guard_2" in configured_providers and "llama_prompt_guard_2" not in _providers:
     try:
         from . import llama_prompt_guard
         _providers["llama_prompt_guard_2"] = getattr(llama_prompt_guard, "provider", dummy.provider)
@@ -23,7 +38,7 @@ if "llama_prompt_guard_2" in configured_providers:
         _providers["llama_prompt_guard_2"] = dummy.provider
 
 # Only import llama_guard_4_12b if it's configured for any API
-if "llama_guard_4_12b" in configured_providers:
+if "llama_guard_4_12b" in configured_providers and "llama_guard_4_12b" not in _providers:
     try:
         from . import llama_guard_4_12b
         _providers["llama_guard_4_12b"] = getattr(llama_guard_4_12b, "provider", dummy.provider)
@@ -0,0 +1,474 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable
+from ...core import metrics, timing, tracing
+from ...core.logger import logger
+from ..engines import load_onnx_engine, load_torch_engine
+from ..scheduler import SchedulerLane, scheduler
+from ..weights import LoadTimer, mmap_enabled, pretrained_kwargs, share_mmap_weights
+
+
+try:
+    from transformers import pipeline
+except Exception as e:  # pragma: no cover - optional dependency
+    logger.warning("transformers not available: %s", e)
+    pipeline = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        v = int(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+# Initial per-item tokenization cost (host seconds) for the shared scheduler.
+_TOKENIZE_COST_S = 0.0005
+# Tokenization has its own host device and executor, shared by every provider's
+# tokenize lane, so it never waits behind forward passes on the "cpu" device.
+_TOKENIZE_DEVICE = "cpu:tokenize"
+_TOKENIZE_MAX_WORKERS = _env_int("SENTINELSHIELD_TOKENIZE_MAX_WORKERS", 1)
+
+# EWMA weight of the newest batch in the per-batcher latency estimate.
+_BATCH_LATENCY_ALPHA = 0.2
+
+_CACHE_MISS = object()
+
+
+def _pipe_call(pipe, text: str):
+    return pipe(text, truncation=True)
+
+
+def _pipe_call_batch(pipe, texts: list[str]):
+    return pipe(texts, truncation=True)
+
+
+def _engine_call_batch(engine, texts: list[str]) -> list[float]:
+    return engine(texts).tolist()
+
+
+def _scored_call_batch(engine, texts: list[str]) -> list[tuple[float, str | None]]:
+    """For engines that already return ``(score, label)`` per text."""
+    return engine(texts)
+
+
+def _token_windows_batch(
+    tokenizer,
+    texts: list[str],
+    *,
+    token_limit: int,
+    window_tokens: int,
+) -> list[tuple[str, str] | None]:
+    """Return (head, tail) window texts for each text longer than ``token_limit``, else None.
+
+    Uses the tokenizer's batch call so fast (Rust) tokenizers encode the whole
+    batch in one native call without holding the GIL.
+    """
+    try:
+        # Full token ids without truncation; disable special tokens so windows correspond to content.
+        encoded = tokenizer(
+            texts,
+            add_special_tokens=False,
+            truncation=False,
+            return_attention_mask=False,
+        )["input_ids"]
+    except TypeError:
+        # Older tokenizers may not support these kwargs; fall back to per-text encode.
+        encoded = [tokenizer.encode(t, add_special_tokens=False) for t in texts]
+
+    windows: list[tuple[str, str] | None] = []
+    for ids in encoded:
+        if len(ids) <= token_limit:
+            windows.append(None)
+            continue
+        head_text = tokenizer.decode(ids[:window_tokens], skip_special_tokens=True)
+        tail_text = tokenizer.decode(ids[-window_tokens:], skip_special_tokens=True)
+        windows.append((head_text, tail_text))
+    return windows
+
+
+@dataclass(slots=True)
+class _QueuedReq:
+    text: str
+    fut: asyncio.Future
+    enqueued: float = 0.0
+    # Set by the executor; the waiting request reports them as its own stage timings.
+    started: float = 0.0
+    exec_s: float = 0.0
+    # Trace links between the request's enqueue span and the shared batch span.
+    span: tracing.SpanContext | None = None
+    batch_span: tracing.SpanContext | None = None
+
+
+class InferenceBatcher:
+    """Micro-batches concurrent single-item calls into one ``batch_fn(pipe, items)`` call.
+
+    ``batch_fn`` runs through the scheduler ``lane`` and must return one result per input item.
+    """
+
+    def __init__(
+        self,
+        pipe,
+        *,
+        lane: SchedulerLane,
+        max_batch_size: int,
+        max_wait_ms: int,
+        batch_fn: Callable[[Any, list], list] = _pipe_call_batch,
+    ) -> None:
+        self._pipe = pipe
+        self._lane = lane
+        self._batch_fn = batch_fn
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait_s = max(0, max_wait_ms) / 1000.0
+
+        self._queue: asyncio.Queue[_QueuedReq] = asyncio.Queue()
+        self._batch_queue: asyncio.Queue[list[_QueuedReq]] = asyncio.Queue()
+        self._collector_task: asyncio.Task | None = None
+        self._executor_task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Admission control inputs: requests not yet answered and recent batch latency.
+        self.pending = 0
+        self.batch_latency_s: float | None = None
+        self._m_size = metrics.BATCH_SIZE.labels(lane.name)
+        self._m_seconds = metrics.BATCH_SECONDS.labels(lane.name)
+        self._m_queue = metrics.BATCH_QUEUE_SECONDS.labels(lane.name)
+        self._m_pending = metrics.BATCH_PENDING.labels(lane.name)
+        self._stage_queue = f"{lane.name}.queue"
+        self._stage_exec = f"{lane.name}.exec"
+
+    def estimated_wait_s(self) -> float:
+        """Predicted time until a request submitted now is answered (0.0 before any batch ran)."""
+        if self.batch_latency_s is None:
+            return 0.0
+        batches = -(-(self.pending + 1) // self._max_batch_size)  # ceil
+        return self._max_wait_s + batches * self.batch_latency_s
+
+    def _ensure_runner(self) -> None:
+        loop = asyncio.get_running_loop()
+        if (
+            self._collector_task is None
+            or self._collector_task.done()
+            or self._loop is not loop
+        ):
+            self._loop = loop
+            # Fresh contexts: these loops serve every request, not the one that started them.
+            self._collector_task = loop.create_task(self._collector_loop(), context=contextvars.Context())
+            self._executor_task = loop.create_task(self._executor_loop(), context=contextvars.Context())
+
+    async def predict_one(self, text: str):
+        self._ensure_runner()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.pending += 1
+        self._m_pending.inc()
+        enqueue_span = tracing.span("batcher.enqueue", attributes={"batcher": self._lane.name})
+        req = _QueuedReq(text=text, fut=fut, enqueued=time.monotonic(), span=enqueue_span.context)
+        try:
+            with enqueue_span:
+                await self._queue.put(req)
+                result = await fut
+                if req.batch_span is not None:
+                    enqueue_span.add_link(req.batch_span)
+            timing.record(self._stage_queue, req.started - req.enqueued)
+            timing.record(self._stage_exec, req.exec_s)
+            return result
+        finally:
+            self.pending -= 1
+            self._m_pending.dec()
+
+    async def _collector_loop(self) -> None:
+        """Continuously drain the request queue into batches."""
+        while True:
+            first = await self._queue.get()
+            if first.fut.done():  # caller cancelled while queued: free the slot
+                continue
+            batch: list[_QueuedReq] = [first]
+
+            if self._max_wait_s > 0:
+                deadline = asyncio.get_running_loop().time() + self._max_wait_s
+                while len(batch) < self._max_batch_size:
+                    timeout = deadline - asyncio.get_running_loop().time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        nxt = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if not nxt.fut.done():
+                        batch.append(nxt)
+            else:
+                while len(batch) < self._max_batch_size and not self._queue.empty():
+                    nxt = self._queue.get_nowait()
+                    if not nxt.fut.done():
+                        batch.append(nxt)
+
+            await self._batch_queue.put(batch)
+
+    async def _executor_loop(self) -> None:
+        """Pull assembled batches and run inference, overlapping with collection."""
+        while True:
+            batch = [r for r in await self._batch_queue.get() if not r.fut.done()]
+            if not batch:
+                continue
+            texts = [r.text for r in batch]
+            start = time.monotonic()
+            self._m_size.observe(len(batch))
+            # One root span per batch, linked to every request it serves.
+            batch_span = tracing.span(
+                "batcher.execute",
+                root=True,
+                attributes={"batcher": self._lane.name, "batch.size": len(batch)},
+                links=[r.span for r in batch if r.span is not None],
+            )
+            for r in batch:
+                r.started = start
+                r.batch_span = batch_span.context
+                self._m_queue.observe(start - r.enqueued)
+            try:
+                results = await self._lane.run(self._batch_fn, self._pipe, texts, items=len(texts))
+                elapsed = time.monotonic() - start
+                self._m_seconds.observe(elapsed)
+                for r in batch:
+                    r.exec_s = elapsed
+                if self.batch_latency_s is None:
+                    self.batch_latency_s = elapsed
+                else:
+                    self.batch_latency_s += _BATCH_LATENCY_ALPHA * (elapsed - self.batch_latency_s)
+
+                if not isinstance(results, list) or len(results) != len(batch):
+                    raise RuntimeError(f"Unexpected batch result shape: {type(results)} (len={getattr(results, '__len__', lambda: -1)()})")
+
+                for req, res in zip(batch, results):
+                    if not req.fut.cancelled():
+                        req.fut.set_result(res)
+            except Exception as e:
+                batch_span.record_error(e)
+                for req in batch:
+                    if not req.fut.cancelled():
+                        req.fut.set_exception(e)
+            finally:
+                batch_span.end()
+
+
+class BatchedClassifierProvider:
+    """Base for HF/ONNX sequence classifiers with micro-batching, caching and windowing.
+
+    Subclasses only declare configuration as class attributes. Environment
+    variables are read as ``{env_prefix}_MODEL_PATH``, ``_DEVICE``, ``_BACKEND``
+    (``pipeline``/``torch``/``onnx``), ``_ONNX_PATH``, ``_BATCHING``,
+    ``_MAX_BATCH_SIZE`` and ``_MAX_WAIT_MS``. Inputs longer than ``token_limit``
+    tokens are scored as head and tail windows of ``window_tokens`` each.
+    """
+
+    name = "classifier"
+    display_name = "Classifier"
+    env_prefix = "SENTINELSHIELD_CLASSIFIER"
+    default_model_path = ""
+    default_device = "cpu"
+    default_backend = "pipeline"
+    default_max_batch_size = 32
+    default_max_wait_ms = 50
+    token_limit = 512
+    window_tokens = 256
+    # Upper bound on tokens per character for the model's tokenizer. Texts with
+    # len(text) * max_tokens_per_char <= token_limit cannot exceed the limit, so
+    # they skip tokenization entirely.
+    max_tokens_per_char = 4
+    # Initial per-item cost estimate (device seconds) for the shared scheduler;
+    # the scheduler refines it from measured batch times.
+    inference_cost_s = 0.01
+
+    def _env(self, key: str, default: str) -> str:
+        return os.getenv(f"{self.env_prefix}_{key}", default)
+
+    def __init__(self) -> None:
+        self.pipe = None
+        self.engine = None
+        self._lane: SchedulerLane | None = None
+        self._batch_fn: Callable[[Any, list], list] | None = None
+        self._batcher: InferenceBatcher | None = None
+        self._tokenize_batcher: InferenceBatcher | None = None
+
+        # Inference result cache (same pattern as RuleEngine._eval_cache)
+        self._cache: OrderedDict[bytes, tuple[float, str | None]] = OrderedDict()
+        self._cache_size = _env_int("SENTINELSHIELD_INFERENCE_CACHE_SIZE", 4096)
+        self.load_stats: dict[str, float] = {}
+
+        timer = LoadTimer(self.name)
+        backend = self._env("BACKEND", self.default_backend).lower()
+        if backend == "pipeline" and pipeline is None:
+            return
+        model_path = self._env("MODEL_PATH", self.default_model_path)
+        if not os.path.isdir(model_path):
+            logger.error(
+                "%s model not found at '%s'. "
+                "Run download.py on the host first, then re-mount ./models into the container.",
+                self.display_name,
+                model_path,
+            )
+            return
+        device = self._env("DEVICE", self.default_device)
+        try:  # pragma: no cover - optional dependency
+            model, batch_fn, shared_bytes = self._load_backend(backend, model_path, device)
+        except Exception as e:  # pragma: no cover - optional dependency
+            logger.warning("Failed to load %s model: %s", self.display_name, e)
+            return
+        self.load_stats = timer.done(shared_bytes)
+        self._batch_fn = batch_fn
+
+        # Tokenization and ONNX inference run on host cores; torch/pipeline on the configured device.
+        lane_device = "cpu" if backend == "onnx" else device
+        self._lane = scheduler.register(self.name, device=lane_device, cost=self.inference_cost_s)
+
+        tokenizer = getattr(model, "tokenizer", None)
+        if tokenizer is not None:
+            self._tokenize_batcher = InferenceBatcher(
+                tokenizer,
+                lane=scheduler.register(
+                    f"{self.name}.tokenize", device=_TOKENIZE_DEVICE, cost=_TOKENIZE_COST_S, workers=_TOKENIZE_MAX_WORKERS
+                ),
+                max_batch_size=_env_int("SENTINELSHIELD_TOKENIZE_MAX_BATCH_SIZE", 64),
+                max_wait_ms=_env_int("SENTINELSHIELD_TOKENIZE_MAX_WAIT_MS", 0),
+                batch_fn=partial(_token_windows_batch, token_limit=self.token_limit, window_tokens=self.window_tokens),
+            )
+
+        batching_enabled = self._env("BATCHING", "1").lower() not in {"0", "false", "no"}
+        if batching_enabled:
+            max_batch_size = _env_int(f"{self.env_prefix}_MAX_BATCH_SIZE", self.default_max_batch_size)
+            max_wait_ms = _env_int(f"{self.env_prefix}_MAX_WAIT_MS", self.default_max_wait_ms)
+            self._batcher = InferenceBatcher(
+                model,
+                lane=self._lane,
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_wait_ms,
+                batch_fn=batch_fn,
+            )
+
+    def _load_backend(self, backend: str, model_path: str, device: str) -> tuple[Any, Callable[[Any, list], list], int]:
+        """Load the model; return ``(model, batch_fn, mmap_shared_bytes)``.
+
+        ``model`` must expose ``tokenizer`` for long-input windowing.
+        """
+        if backend == "torch":
+            # Direct engine: owns tokenizer + model, bypasses the HF pipeline.
+            self.engine = load_torch_engine(model_path, device, max_length=self.token_limit)
+            return self.engine, _engine_call_batch, self.engine.shared_bytes
+        if backend == "onnx":
+            # CPU-only nodes: ONNX Runtime graph exported by sentinelshield.models.export_onnx.
+            self.engine = load_onnx_engine(model_path, self._env("ONNX_PATH", "") or None, max_length=self.token_limit)
+            return self.engine, _engine_call_batch, 0
+        self.pipe = pipeline(
+            "text-classification",
+            model=model_path,
+            tokenizer=model_path,
+            device=device,
+            model_kwargs=pretrained_kwargs(),
+        )
+        shared_bytes = share_mmap_weights(self.pipe.model, model_path) if mmap_enabled(device) else 0
+        return self.pipe, _pipe_call_batch, shared_bytes
+
+    def _cache_key(self, text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", errors="ignore"), digest_size=16).digest()
+
+    def _cache_get(self, key: bytes) -> tuple[float, str | None] | object:
+        if self._cache_size <= 0:
+            return _CACHE_MISS
+        try:
+            v = self._cache.pop(key)
+        except KeyError:
+            return _CACHE_MISS
+        self._cache[key] = v  # move to end
+        return v
+
+    def _cache_put(self, key: bytes, value: tuple[float, str | None]) -> None:
+        if self._cache_size <= 0:
+            return
+        self._cache[key] = value
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def cached(self, text: str) -> tuple[float, str | None] | None:
+        """Result for ``text`` if it is in the inference cache, without running the model."""
+        hit = self._cache_get(self._cache_key(text))
+        return None if hit is _CACHE_MISS else hit  # type: ignore[return-value]
+
+    def estimated_wait_s(self) -> float:
+        """Predicted inference wait for a new request, from the batcher's queue and batch latency."""
+        return self._batcher.estimated_wait_s() if self._batcher is not None else 0.0
+
+    async def _get_token_windows(self, text: str) -> tuple[str, str] | None:
+        if self._tokenize_batcher is None:
+            return None
+        if len(text) * self.max_tokens_per_char <= self.token_limit:
+            return None
+        return await self._tokenize_batcher.predict_one(text)
+
+    async def _infer(self, text: str) -> tuple[float, str | None]:
+        score = 0.0
+        label: str | None = None
+
+        if self.pipe is None and self.engine is None:
+            await asyncio.sleep(0)
+            return score, label
+
+        if self._batcher is not None:
+            res = await self._batcher.predict_one(text)
+        elif self.engine is not None:
+            res = (await self._lane.run(self._batch_fn, self.engine, [text]))[0]
+        else:
+            res = await self._lane.run(_pipe_call, self.pipe, text)
+
+        if isinstance(res, tuple):
+            # Scoring engines return (score, label) directly.
+            return res
+        if isinstance(res, float):
+            # Direct engine already returns the unsafe probability.
+            return res, self.engine.label_for(res)
+
+        if isinstance(res, list):
+            res = res[0]
+        if isinstance(res, dict):
+            label = res.get("label", None)
+            score = float(res.get("score", 0.0))
+        if label == "LABEL_0":
+            score = 1 - score
+        return score, label
+
+    async def moderate(self, text: str) -> tuple[float, str | None]:
+        lookup_start = time.monotonic()
+        key = self._cache_key(text)
+        cached = self._cache_get(key)
+        if self._cache_size > 0:
+            metrics.CACHE_LOOKUPS.labels(self.name, "miss" if cached is _CACHE_MISS else "hit").inc()
+            timing.record(f"{self.name}.cache", time.monotonic() - lookup_start)
+        if cached is not _CACHE_MISS:
+            return cached  # type: ignore[return-value]
+        start = time.monotonic()
+
+        windows = await self._get_token_windows(text)
+        if windows is not None:
+            head_text, tail_text = windows
+            head_res, tail_res = await asyncio.gather(
+                self._infer(head_text),
+                self._infer(tail_text),
+            )
+            # Choose the window with the higher score; on tie prefer the tail (more recent context).
+            if head_res[0] > tail_res[0]:
+                result = head_res
+            else:
+                result = tail_res
+        else:
+            result = await self._infer(text)
+
+        metrics.PROVIDER_SECONDS.labels(self.name).observe(time.monotonic() - start)
+        self._cache_put(key, result)
+        return result
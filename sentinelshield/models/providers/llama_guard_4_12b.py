@@ -1,78 +1,51 @@
 from __future__ import annotations
 
-import asyncio
-import os
-from concurrent.futures import ThreadPoolExecutor
-from ...core.logger import logger
+from typing import Any, Callable
 
-try:
-    from transformers.pipelines import pipeline
-except Exception as e:
-    logger.warning("transformers not available: %s", e)
-    pipeline = None
+from ..engines import load_llama_guard_engine
+from .base import BatchedClassifierProvider, _scored_call_batch
 
 
-def _env_int(name: str, default: int) -> int:
-    try:
-        v = int(os.getenv(name, str(default)))
-        return v if v > 0 else default
-    except Exception:
-        return default
+class LlamaGuard4_12BProvider(BatchedClassifierProvider):
+    """Llama Guard 4 12B.
 
+    The default ``logits`` backend formats the official Llama Guard prompt and
+    scores it with a single forward pass (see LlamaGuardScoringEngine); labels are
+    ``"safe"`` or the most likely hazard category (``"S1"``..``"S14"``). The
+    ``pipeline``/``torch``/``onnx`` classifier backends remain selectable through
+    SENTINELSHIELD_LLAMA_GUARD_BACKEND.
+    """
 
-_INFERENCE_MAX_WORKERS = _env_int("SENTINELSHIELD_INFERENCE_MAX_WORKERS", 4)
-_INFERENCE_POOL = ThreadPoolExecutor(max_workers=_INFERENCE_MAX_WORKERS)
-_INFERENCE_CONCURRENCY = _env_int("SENTINELSHIELD_INFERENCE_CONCURRENCY", _INFERENCE_MAX_WORKERS)
-
-
-def _pipe_call(pipe, text: str):
-    return pipe(text, truncation=True)
-
-
-class LlamaGuard4_12BProvider:
     name = "llama_guard_4_12b"
-
-    def __init__(self) -> None:
-        self.pipe = None
-        self._sem = asyncio.Semaphore(_INFERENCE_CONCURRENCY)
-        if pipeline is None:
-            return
-        model_path = os.getenv(
-            "SENTINELSHIELD_LLAMA_GUARD_MODEL_PATH",
-            "/workspace/models/Llama-Guard-4-12B",
-        )
-        if not os.path.isdir(model_path):
-            logger.error(
-                "Llama Guard 4 12B model not found at '%s'. "
-                "Run download.py on the host first, then re-mount ./models into the container.",
-                model_path,
-            )
-            return
+    display_name = "Llama Guard 4 12B"
+    env_prefix = "SENTINELSHIELD_LLAMA_GUARD"
+    default_model_path = "/workspace/models/Llama-Guard-4-12B"
+    default_device = "cpu"
+    default_backend = "logits"
+    # A 12B forward pass is expensive: smaller batches, same collection window.
+    default_max_batch_size = 8
+    token_limit = 4096
+    window_tokens = 2048
+    # Byte-level BPE: at most one token per UTF-8 byte.
+    max_tokens_per_char = 4
+    inference_cost_s = 0.5
+
+    def _load_backend(self, backend: str, model_path: str, device: str) -> tuple[Any, Callable[[Any, list], list], int]:
+        if backend != "logits":
+            return super()._load_backend(backend, model_path, device)
         try:
-            self.pipe = pipeline(
-                "text-classification",
-                model=model_path,
-                tokenizer=model_path,
-            )
-        except Exception as e:
-            logger.warning("Failed to load Llama-Guard-4-12B model: %s", e)
+            temperature = float(self._env("SCORE_TEMPERATURE", "1.0"))
+        except ValueError:
+            temperature = 1.0
+        self.engine = load_llama_guard_engine(
+            model_path,
+            device,
+            max_length=self.token_limit,
+            temperature=temperature,
+            categories=self._env("CATEGORIES", "1").lower() not in {"0", "false", "no"},
+            prefix_cache=self._env("PREFIX_CACHE", "1").lower() not in {"0", "false", "no"},
+        )
+        return self.engine, _scored_call_batch, self.engine.shared_bytes
 
-    async def moderate(self, text: str) -> tuple[float, str | None]:
-        score = 0.0
-        label = None
-        if self.pipe is None:
-            await asyncio.sleep(0)
-            return score, label
-        async with self._sem:
-            loop = asyncio.get_running_loop()
-            res = await loop.run_in_executor(_INFERENCE_POOL, _pipe_call, self.pipe, text)
-        if isinstance(res, list):
-            res = res[0]
-        if isinstance(res, dict):
-            label = res.get("label",  None)
-            score = float(res.get("score", 0.0))
-        if label == 'LABEL_0':
-            score = 1 - score
-        return score, label
 
-provider = LlamaGuard4_12BProvider() 
\ No newline at end of file
+provider = LlamaGuard4_12BProvider()
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import os
 import random
-from typing import List, Dict, Any
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple
+from ...core import metrics, timing, tracing
 from ...core.logger import logger
 
 try:
@@ -29,19 +33,473 @@ def _env_float(name: str, default: float) -> float:
         return default
 
 
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).lower() not in {"0", "false", "no", ""}
+
+
+_RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class _LatencyTracker:
+    """Rolling window of recent successful call latencies with a cached percentile."""
+
+    def __init__(self, window: int, percentile: float, min_samples: int) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+        self._percentile = min(max(percentile, 0.0), 100.0)
+        self._min_samples = min_samples
+        self._cached: float | None = None
+        self._since_refresh = 0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._since_refresh += 1
+
+    def threshold(self) -> float | None:
+        """The tracked percentile in seconds, or None until enough samples exist."""
+        if len(self._samples) < self._min_samples:
+            return None
+        # Re-sort at most every 16 samples; the window moves slowly.
+        if self._cached is None or self._since_refresh >= 16:
+            ordered = sorted(self._samples)
+            idx = min(len(ordered) - 1, int(len(ordered) * self._percentile / 100.0))
+            self._cached = ordered[idx]
+            self._since_refresh = 0
+        return self._cached
+
+
+class _HedgeBudget:
+    """Token bucket capping hedged attempts to ``max_rate`` of requests (with a small burst)."""
+
+    def __init__(self, max_rate: float, burst: float = 5.0) -> None:
+        self._rate = max_rate
+        self._burst = burst
+        self._tokens = burst
+
+    def on_request(self) -> None:
+        self._tokens = min(self._burst, self._tokens + self._rate)
+
+    def try_spend(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+
+class _Upstream:
+    """One qw3-guard replica with passive health and load tracking."""
+
+    def __init__(self, base: str) -> None:
+        self.base = base.rstrip("/")
+        self.outstanding = 0
+        self.ewma_latency_s: float | None = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.probing = False
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until > 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "outstanding": self.outstanding,
+            "ewma_latency_s": self.ewma_latency_s,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected": self.ejected,
+            "ejections": self.ejections,
+        }
+
+
+class _UpstreamPool:
+    """Picks a replica per attempt and ejects failing ones until a probe succeeds.
+
+    ``policy`` is ``least_outstanding`` (fewest in-flight requests, EWMA latency as
+    tie-break) or ``ewma`` (lowest ``ewma_latency * (outstanding + 1)``). After
+    ``eject_failures`` consecutive errors, timeouts or 5xx responses a replica is
+    taken out of rotation for ``eject_s`` (doubling per repeated ejection up to
+    ``eject_max_s``). Once that elapses a probe (``GET {base}/models``) runs in the
+    background, and only a successful probe re-admits the replica.
+    """
+
+    _EWMA_ALPHA = 0.3
+
+    def __init__(self, bases: List[str], *, policy: str, eject_failures: int, eject_s: float, eject_max_s: float) -> None:
+        self.upstreams = [_Upstream(b) for b in bases]
+        self.policy = policy
+        self._eject_failures = eject_failures
+        self._eject_s = eject_s
+        self._eject_max_s = eject_max_s
+        self._probe_tasks: set[asyncio.Task] = set()
+
+    def _load(self, up: _Upstream) -> tuple:
+        latency = up.ewma_latency_s or 0.0
+        if self.policy == "ewma":
+            return (latency * (up.outstanding + 1), up.outstanding)
+        return (up.outstanding, latency)
+
+    def choose(self, probe: Callable[[_Upstream], Awaitable[bool]] | None = None, avoid: set | None = None) -> _Upstream:
+        """Pick a replica, skipping ejected ones and, when possible, those in ``avoid``."""
+        now = time.monotonic()
+        healthy = []
+        for up in self.upstreams:
+            if not up.ejected:
+                healthy.append(up)
+            elif now >= up.ejected_until and not up.probing and probe is not None:
+                self._start_probe(up, probe)
+        if not healthy:
+            # Everything is ejected: fail open to the replica closest to re-admission.
+            return min(self.upstreams, key=lambda u: u.ejected_until)
+        if avoid:
+            healthy = [u for u in healthy if u.base not in avoid] or healthy
+        best = min(self._load(u) for u in healthy)
+        return random.choice([u for u in healthy if self._load(u) == best])
+
+    def _start_probe(self, up: _Upstream, probe: Callable[[_Upstream], Awaitable[bool]]) -> None:
+        up.probing = True
+
+        async def run() -> None:
+            try:
+                ok = await probe(up)
+            except Exception:
+                ok = False
+            finally:
+                up.probing = False
+            if ok:
+                logger.info("QW3-Guard upstream %s re-admitted after probe", up.base)
+                up.ejected_until = 0.0
+                up.consecutive_failures = 0
+            else:
+                self._eject(up)
+
+        task = asyncio.ensure_future(run())
+        self._probe_tasks.add(task)
+        task.add_done_callback(self._probe_tasks.discard)
+
+    def _eject(self, up: _Upstream) -> None:
+        up.ejections += 1
+        duration = min(self._eject_max_s, self._eject_s * (2 ** min(up.ejections - 1, 16)))
+        up.ejected_until = time.monotonic() + duration
+
+    def on_success(self, up: _Upstream, latency_s: float) -> None:
+        up.consecutive_failures = 0
+        up.ejections = 0
+        if up.ewma_latency_s is None:
+            up.ewma_latency_s = latency_s
+        else:
+            up.ewma_latency_s += self._EWMA_ALPHA * (latency_s - up.ewma_latency_s)
+
+    def on_failure(self, up: _Upstream) -> None:
+        up.consecutive_failures += 1
+        if not up.ejected and len(self.upstreams) > 1 and up.consecutive_failures >= self._eject_failures:
+            logger.warning("QW3-Guard upstream %s ejected after %s consecutive failures", up.base, up.consecutive_failures)
+            self._eject(up)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {up.base: up.stats() for up in self.upstreams}
+
+
+class _Permit(NamedTuple):
+    """Admission by ``_CircuitBreaker.allow()``, handed back to ``record()``."""
+
+    generation: int
+    trial: bool
+
+
+class _CircuitBreaker:
+    """Closed -> open when the recent failure or slow-call rate crosses a threshold.
+
+    While open every call is refused. After ``open_s`` the breaker goes half-open
+    and lets a single trial call through: success closes it, failure reopens it.
+    Only the trial's outcome decides; calls admitted before the breaker opened
+    (an older generation) may still finish afterwards and are only counted.
+    """
+
+    def __init__(self, *, window: int, min_calls: int, error_rate: float, slow_call_s: float, slow_rate: float, open_s: float) -> None:
+        self._outcomes: deque[tuple[bool, bool]] = deque(maxlen=window)
+        self._min_calls = min_calls
+        self._error_rate = error_rate
+        self._slow_call_s = slow_call_s
+        self._slow_rate = slow_rate
+        self._open_s = open_s
+        self._opened_at: float | None = None
+        self._trial_inflight = False
+        self._generation = 0
+        self.opens = 0
+        self.rejected = 0
+        self.stale_outcomes = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self._open_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> _Permit | None:
+        state = self.state
+        if state == "closed":
+            return _Permit(self._generation, False)
+        if state == "half_open" and not self._trial_inflight:
+            self._trial_inflight = True
+            return _Permit(self._generation, True)
+        self.rejected += 1
+        return None
+
+    def cancel_trial(self, permit: _Permit) -> None:
+        if permit.trial:
+            self._trial_inflight = False
+
+    def record(self, permit: _Permit, ok: bool, latency_s: float) -> None:
+        if permit.trial:
+            self._trial_inflight = False
+            if ok:
+                self._opened_at = None
+                self._outcomes.clear()
+                logger.info("QW3-Guard circuit closed")
+            else:
+                self._opened_at = time.monotonic()
+            return
+        if permit.generation != self._generation or self._opened_at is not None:
+            # Started before the breaker opened: not evidence about the upstream now.
+            self.stale_outcomes += 1
+            return
+        self._outcomes.append((not ok, latency_s >= self._slow_call_s))
+        if len(self._outcomes) < self._min_calls:
+            return
+        n = len(self._outcomes)
+        failures = sum(f for f, _ in self._outcomes)
+        slow = sum(sl for _, sl in self._outcomes)
+        if failures / n >= self._error_rate or slow / n >= self._slow_rate:
+            self._opened_at = time.monotonic()
+            self._generation += 1
+            self.opens += 1
+            logger.warning("QW3-Guard circuit opened (failures=%s slow=%s of last %s calls)", failures, slow, n)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "opens": self.opens, "rejected": self.rejected, "stale_outcomes": self.stale_outcomes}
+
+
+class LimiterRejected(Exception):
+    """Raised when the local queue in front of qw3-guard is full or waited too long."""
+
+
+class _AdaptiveLimiter:
+    """AIMD concurrency limit for calls to the upstream, with a bounded local queue.
+
+    Each finished call is a sample. An error, or a latency above ``tolerance``
+    times the baseline (a slowly rising minimum of observed latencies), cuts the
+    limit by ``backoff``, at most once per observed latency so one burst of
+    timeouts counts once. Other samples add ``1 / limit`` while at least half the
+    limit is in use, which adds about one slot per round trip. Calls over the limit
+    wait in FIFO order. They are rejected when ``max_queue`` calls are already
+    waiting or after ``queue_timeout_s``. With ``adaptive=False`` the limit stays
+    at ``max_limit``, like a plain semaphore.
+    """
+
+    _BASELINE_DRIFT = 0.001
+
+    def __init__(self, *, initial: int, min_limit: int, max_limit: int, max_queue: int, queue_timeout_s: float, tolerance: float, backoff: float, adaptive: bool = True) -> None:
+        self.adaptive = adaptive
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), max_limit) if adaptive else max_limit)
+        self.inflight = 0
+        self.rejected = 0
+        self._max_queue = max_queue
+        self._queue_timeout_s = queue_timeout_s
+        self._tolerance = tolerance
+        self._backoff = backoff
+        self._baseline_s: float | None = None
+        self.latency_ewma_s: float | None = None
+        self._last_drop = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    async def acquire(self) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        if self.queued >= self._max_queue:
+            self.rejected += 1
+            raise LimiterRejected(f"qw3-guard local queue full ({self._max_queue})")
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self._queue_timeout_s)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return  # granted right at the deadline
+            fut.cancel()
+            self.rejected += 1
+            raise LimiterRejected(f"qw3-guard queue wait exceeded {self._queue_timeout_s}s") from None
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # slot was granted just before cancellation: hand it on
+            else:
+                fut.cancel()
+            raise
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            try:
+                fut.set_result(None)
+            except RuntimeError:  # waiter's event loop has been closed
+                continue
+            self.inflight += 1
+
+    def estimated_wait_s(self) -> float:
+        """Predicted completion time of a call submitted now: queue wait plus one call."""
+        if self.latency_ewma_s is None:
+            return 0.0
+        rounds = 0 if self.inflight < int(self.limit) else -(-(self.queued + 1) // max(1, int(self.limit)))
+        return (rounds + 1) * self.latency_ewma_s
+
+    def on_sample(self, latency_s: float, ok: bool) -> None:
+        if self.latency_ewma_s is None:
+            self.latency_ewma_s = latency_s
+        else:
+            self.latency_ewma_s += 0.2 * (latency_s - self.latency_ewma_s)
+        if not self.adaptive:
+            return
+        if ok:
+            if self._baseline_s is None or latency_s < self._baseline_s:
+                self._baseline_s = latency_s
+            else:
+                self._baseline_s *= 1.0 + self._BASELINE_DRIFT
+        congested = not ok or (self._baseline_s is not None and latency_s > self._baseline_s * self._tolerance)
+        now = time.monotonic()
+        if congested:
+            if now - self._last_drop >= latency_s:
+                self.limit = max(float(self.min_limit), self.limit * self._backoff)
+                self._last_drop = now
+        elif self.inflight + 1 >= self.limit / 2:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "baseline_latency_s": self._baseline_s,
+        }
+
+
+def _verdict_complete(text: str) -> bool:
+    """True once the streamed output holds every line ``_parse_response`` needs.
+
+    A finished ``Safety: Safe`` line is enough (the label is "safe" whatever
+    follows); any other verdict also needs the finished ``Categories:`` line.
+    """
+    safety = None
+    for line in text.split("\n")[:-1]:  # the last element is an unfinished line
+        if line.startswith("Safety:"):
+            safety = line.split(":", 1)[1].strip().lower()
+            if safety == "safe":
+                return True
+        elif line.startswith("Categories:") and safety is not None:
+            return True
+    return False
+
+
+async def _read_stream_until_verdict(resp) -> str:
+    """Accumulate SSE ``delta.content`` until the verdict lines are complete or the stream ends."""
+    parts: List[str] = []
+    async for raw in resp.content:
+        line = raw.strip()
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+        choices = json.loads(data).get("choices") or [{}]
+        delta = choices[0].get("delta") or {}
+        if delta.get("content"):
+            parts.append(delta["content"])
+            if "\n" in delta["content"] and _verdict_complete("".join(parts)):
+                break
+    return "".join(parts)
+
+
+def _messages_to_text(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages)
+
+
 class QW3GuardProvider:
     name = "qw3_guard"
 
     def __init__(self) -> None:
         self.api_key = os.getenv("QW3_GUARD_API_KEY", "EMPTY")
-        self.api_base = os.getenv("QW3_GUARD_API_BASE", "http://172.16.21.51:8036/v1")
+        # Comma-separated list of replicas; requests are balanced across them.
+        api_bases = [b.strip() for b in os.getenv("QW3_GUARD_API_BASE", "http://172.16.21.51:8036/v1").split(",") if b.strip()]
+        self.api_base = api_bases[0]
+        self._pool = _UpstreamPool(
+            api_bases,
+            policy=os.getenv("QW3_GUARD_LB_POLICY", "least_outstanding").lower(),
+            eject_failures=_env_int("QW3_GUARD_EJECT_FAILURES", 3),
+            eject_s=_env_float("QW3_GUARD_EJECT_S", 5.0),
+            eject_max_s=_env_float("QW3_GUARD_EJECT_MAX_S", 60.0),
+        )
+        self._probe_timeout_s = _env_float("QW3_GUARD_PROBE_TIMEOUT_S", 2.0)
         self.model = os.getenv("QW3_GUARD_MODEL", "qw3-guard")
         self.session = None
-        self._sem = asyncio.Semaphore(_env_int("QW3_GUARD_CONCURRENCY", 200))
+        # QW3_GUARD_CONCURRENCY is the ceiling; the adaptive limiter finds the
+        # upstream's real capacity below it from latency and errors.
+        self._limiter = _AdaptiveLimiter(
+            initial=_env_int("QW3_GUARD_CONCURRENCY_INITIAL", 20),
+            min_limit=_env_int("QW3_GUARD_CONCURRENCY_MIN", 2),
+            max_limit=_env_int("QW3_GUARD_CONCURRENCY", 200),
+            max_queue=_env_int("QW3_GUARD_MAX_QUEUE", 1000),
+            queue_timeout_s=_env_float("QW3_GUARD_QUEUE_TIMEOUT_S", 10.0),
+            tolerance=_env_float("QW3_GUARD_LIMIT_LATENCY_TOLERANCE", 2.0),
+            backoff=min(_env_float("QW3_GUARD_LIMIT_BACKOFF", 0.9), 0.99),
+            adaptive=_env_flag("QW3_GUARD_ADAPTIVE_CONCURRENCY", "1"),
+        )
         self._max_retries = _env_int("QW3_GUARD_MAX_RETRIES", 2)
         self._retry_base_s = _env_float("QW3_GUARD_RETRY_BASE_S", 0.2)
         self._retry_max_s = _env_float("QW3_GUARD_RETRY_MAX_S", 2.0)
 
+        # Hedging: if an attempt is slower than the tracked latency percentile, send a
+        # second identical attempt and use whichever answers first.
+        self._hedge_enabled = _env_flag("QW3_GUARD_HEDGE")
+        self._latency = _LatencyTracker(
+            window=_env_int("QW3_GUARD_HEDGE_WINDOW", 512),
+            percentile=_env_float("QW3_GUARD_HEDGE_PERCENTILE", 95.0),
+            min_samples=_env_int("QW3_GUARD_HEDGE_MIN_SAMPLES", 20),
+        )
+        self._hedge_budget = _HedgeBudget(_env_float("QW3_GUARD_HEDGE_MAX_RATE", 0.05))
+        self._hedge_min_delay_s = _env_float("QW3_GUARD_HEDGE_MIN_DELAY_S", 0.05)
+        self.hedge_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+
+        # Circuit breaker: fail fast (or use the local fallback provider) while the
+        # upstream is erroring or too slow instead of waiting out timeouts and retries.
+        self._breaker = _CircuitBreaker(
+            window=_env_int("QW3_GUARD_BREAKER_WINDOW", 50),
+            min_calls=_env_int("QW3_GUARD_BREAKER_MIN_CALLS", 10),
+            error_rate=_env_float("QW3_GUARD_BREAKER_ERROR_RATE", 0.5),
+            slow_call_s=_env_float("QW3_GUARD_BREAKER_SLOW_CALL_S", 10.0),
+            slow_rate=_env_float("QW3_GUARD_BREAKER_SLOW_RATE", 0.8),
+            open_s=_env_float("QW3_GUARD_BREAKER_OPEN_S", 10.0),
+        )
+        self.fallback_provider = os.getenv("QW3_GUARD_FALLBACK_PROVIDER", "") or None
+
+        # Streaming: read the verdict from SSE deltas and hang up once it is complete.
+        self._stream = _env_flag("QW3_GUARD_STREAM")
+        self._stream_max_tokens = _env_int("QW3_GUARD_STREAM_MAX_TOKENS", 32)
+
     async def _get_session(self):
         """Get or create aiohttp session"""
         if aiohttp is None:
@@ -61,30 +519,133 @@ class QW3GuardProvider:
             self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
         return self.session
 
-    async def _post_json_with_retries(self, url: str, *, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any] | None:
+    async def _probe(self, up: _Upstream) -> bool:
+        session = await self._get_session()
+        if session is None:
+            return False
+        timeout = aiohttp.ClientTimeout(total=self._probe_timeout_s)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        async with session.get(f"{up.base}/models", headers=headers, timeout=timeout) as resp:
+            return resp.status == 200
+
+    async def _post_once(self, session, path: str, *, headers: Dict[str, str], payload: Dict[str, Any], retryable: bool, avoid: set) -> Dict[str, Any] | None:
+        """One POST to the chosen upstream. Returns the JSON body, None on a final failure, or raises to request a retry.
+
+        Upstreams that failed are added to ``avoid`` so retries go elsewhere.
+        """
+        queued_at = time.monotonic()
+        await self._limiter.acquire()
+        timing.record("qw3_guard.queue", time.monotonic() - queued_at)
+        metrics.QW3_INFLIGHT.inc()
+        up = self._pool.choose(self._probe, avoid)
+        up.outstanding += 1
+        attempt_span = tracing.span("qw3.attempt", kind=tracing.CLIENT, attributes={"server.address": up.base})
+        if attempt_span.context is not None:
+            headers = tracing.inject(dict(headers), attempt_span.context)
+        start = time.monotonic()
+        ok = False
+        overloaded = False
+        cancelled = False
+        outcome = "error"
+        try:
+            async with session.post(f"{up.base}{path}", headers=headers, json=payload) as resp:
+                outcome = "ok" if resp.status == 200 else f"http_{resp.status}"
+                if resp.status < 500:
+                    ok = True
+                overloaded = resp.status in {429, 503}
+                if resp.status == 200:
+                    if payload.get("stream"):
+                        content = await _read_stream_until_verdict(resp)
+                        # Closing mid-stream drops the connection, which aborts the
+                        # rest of the generation upstream.
+                        resp.close()
+                        data = {"choices": [{"message": {"content": content}}]}
+                    else:
+                        data = await resp.json()
+                    elapsed = time.monotonic() - start
+                    self._latency.record(elapsed)
+                    self._pool.on_success(up, elapsed)
+                    return data
+                if resp.status in _RETRYABLE_STATUSES and retryable:
+                    await resp.release()
+                    raise aiohttp.ClientResponseError(
+                        request_info=resp.request_info,
+                        history=resp.history,
+                        status=resp.status,
+                        message=f"retryable status {resp.status}",
+                        headers=resp.headers,
+                    )
+                logger.warning("QW3-Guard API %s returned status %s", up.base, resp.status)
+                return None
+        except asyncio.CancelledError:
+            # Hedge loser or caller gave up: says nothing about the upstream.
+            ok = cancelled = True
+            outcome = "cancelled"
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            timing.record("qw3_guard.upstream", elapsed)
+            metrics.QW3_ATTEMPTS.labels(up.base, outcome).inc()
+            attempt_span.set_attribute("outcome", outcome)
+            attempt_span.end()
+            metrics.QW3_ATTEMPT_SECONDS.labels(outcome).observe(elapsed)
+            metrics.QW3_INFLIGHT.dec()
+            up.outstanding -= 1
+            if not ok:
+                avoid.add(up.base)
+                self._pool.on_failure(up)
+            if not cancelled:
+                self._limiter.on_sample(elapsed, ok and not overloaded)
+            self._limiter.release()
+
+    async def _post_hedged(self, session, path: str, *, headers: Dict[str, str], payload: Dict[str, Any], retryable: bool, avoid: set) -> Dict[str, Any] | None:
+        """``_post_once``, plus a second attempt if the first outlives the latency percentile."""
+        threshold = self._latency.threshold() if self._hedge_enabled else None
+        if threshold is None:
+            return await self._post_once(session, path, headers=headers, payload=payload, retryable=retryable, avoid=avoid)
+
+        def attempt() -> asyncio.Task:
+            return asyncio.ensure_future(self._post_once(session, path, headers=headers, payload=payload, retryable=retryable, avoid=avoid))
+
+        primary = attempt()
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(threshold, self._hedge_min_delay_s))
+            if not done and self._hedge_budget.try_spend():
+                self.hedge_stats["hedged"] += 1
+                metrics.QW3_HEDGES.inc()
+                tasks.append(attempt())
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # A failed attempt only counts if no other attempt can still succeed.
+                    if task.exception() is None or not pending:
+                        if task is not primary:
+                            self.hedge_stats["hedge_wins"] += 1
+                        return task.result()
+            raise RuntimeError("unreachable")  # pragma: no cover
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _post_json_with_retries(self, path: str, *, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any] | None:
         session = await self._get_session()
         if session is None:
             return None
 
-        retryable_statuses = {408, 425, 429, 500, 502, 503, 504}
+        self.hedge_stats["requests"] += 1
+        self._hedge_budget.on_request()
         attempt = 0
+        avoid: set = set()
         while True:
             try:
-                async with self._sem:
-                    async with session.post(url, headers=headers, json=payload) as resp:
-                        if resp.status == 200:
-                            return await resp.json()
-                        if resp.status in retryable_statuses and attempt < self._max_retries:
-                            await resp.release()
-                            raise aiohttp.ClientResponseError(
-                                request_info=resp.request_info,
-                                history=resp.history,
-                                status=resp.status,
-                                message=f"retryable status {resp.status}",
-                                headers=resp.headers,
-                            )
-                        logger.warning("QW3-Guard API returned status %s", resp.status)
-                        return None
+                return await self._post_hedged(
+                    session, path, headers=headers, payload=payload, retryable=attempt < self._max_retries, avoid=avoid
+                )
+            except LimiterRejected:
+                raise  # shed locally: retrying would only add load
             except Exception as e:
                 if attempt >= self._max_retries:
                     logger.error("Error calling QW3-Guard API (attempt %s/%s): %s", attempt + 1, self._max_retries + 1, e)
@@ -94,6 +655,7 @@ class QW3GuardProvider:
                 # full jitter
                 sleep_s = random.random() * backoff
                 attempt += 1
+                metrics.QW3_RETRIES.inc()
                 await asyncio.sleep(sleep_s)
 
     async def _parse_response(self, response_text: str) -> tuple[float, str | None]:
@@ -128,26 +690,8 @@ class QW3GuardProvider:
         
         return score, label
 
-    async def moderate_messages(self, messages: List[Dict[str, str]]) -> tuple[float, str | None]:
-        """
-        Moderate messages in OpenAI chat completions format.
-        
-        Args:
-            messages: List of message dicts with 'role' and 'content' keys,
-                     e.g., [{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]
-        
-        Returns:
-            Tuple of (score, label) where score is 0.0-1.0 and label is category string
-        """
-        if not messages:
-            return 0.0, None
-        
-        if aiohttp is None:
-            logger.warning("aiohttp not available, cannot call QW3-Guard API")
-            await asyncio.sleep(0)
-            return 0.0, None
-        
-        url = f"{self.api_base}/chat/completions"
+    async def _call_upstream(self, messages: List[Dict[str, str]]) -> tuple[float, str | None] | None:
+        """Ask qw3-guard; None when no usable answer came back."""
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
@@ -156,20 +700,93 @@ class QW3GuardProvider:
             "model": self.model,
             "messages": messages
         }
+        if self._stream:
+            payload["stream"] = True
+            payload["max_tokens"] = self._stream_max_tokens
         
         try:
-            data = await self._post_json_with_retries(url, headers=headers, payload=payload)
+            data = await self._post_json_with_retries("/chat/completions", headers=headers, payload=payload)
             if not data:
-                return 0.0, None
+                return None
             # Extract the content from the response
             if "choices" in data and len(data["choices"]) > 0:
                 content = data["choices"][0]["message"]["content"]
                 return await self._parse_response(content)
             logger.warning("QW3-Guard API response missing choices: %s", data)
-            return 0.0, None
+            return None
+        except LimiterRejected:
+            raise
         except Exception as e:
             logger.error(f"Error calling QW3-Guard API: {e}")
-            return 0.0, None
+            return None
+
+    async def _degraded(self, messages: List[Dict[str, str]], reason: str) -> tuple[float, str | None, str, str]:
+        metrics.QW3_DEGRADED.labels(reason).inc()
+        if self.fallback_provider:
+            from . import get_provider
+
+            try:
+                score, label = await get_provider(self.fallback_provider).moderate(_messages_to_text(messages))
+                return score, label, self.fallback_provider, reason
+            except Exception as e:
+                logger.error("QW3-Guard fallback provider %s failed: %s", self.fallback_provider, e)
+        return 0.0, None, self.name, reason
+
+    async def moderate_messages_with_status(self, messages: List[Dict[str, str]]) -> tuple[float, str | None, str, str | None]:
+        """
+        Like ``moderate_messages`` but also reports how the answer was produced.
+
+        Returns:
+            Tuple of (score, label, engine, degraded). ``degraded`` is
+            ``"circuit_open"`` while the breaker refuses calls, ``"overloaded"``
+            when the local concurrency queue shed the call, or
+            ``"upstream_error"`` when the call failed. ``engine`` names the
+            fallback provider that scored the chat, or is ``qw3_guard`` with a
+            fail-open score of 0.0 when none is configured; either way the
+            answer is marked so it is never mistaken for a real verdict.
+        """
+        if not messages:
+            return 0.0, None, self.name, None
+        
+        if aiohttp is None:
+            logger.warning("aiohttp not available, cannot call QW3-Guard API")
+            await asyncio.sleep(0)
+            return 0.0, None, self.name, None
+
+        permit = self._breaker.allow()
+        if permit is None:
+            return await self._degraded(messages, "circuit_open")
+
+        start = time.monotonic()
+        result = None
+        try:
+            result = await self._call_upstream(messages)
+        except LimiterRejected as e:
+            # Local load shedding is not an upstream failure: keep it out of the breaker.
+            self._breaker.cancel_trial(permit)
+            logger.warning("QW3-Guard call shed locally: %s", e)
+            return await self._degraded(messages, "overloaded")
+        except asyncio.CancelledError:
+            self._breaker.cancel_trial(permit)
+            raise
+        self._breaker.record(permit, result is not None, time.monotonic() - start)
+        if result is None:
+            return await self._degraded(messages, "upstream_error")
+        return result[0], result[1], self.name, None
+
+    async def moderate_messages(self, messages: List[Dict[str, str]]) -> tuple[float, str | None]:
+        """
+        Moderate messages in OpenAI chat completions format.
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content' keys,
+                     e.g., [{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]
+        
+        Returns:
+            Tuple of (score, label) where score is 0.0-1.0 and label is category string
+        """
+        score, label, _, _ = await self.moderate_messages_with_status(messages)
+        return score, label
 
     async def moderate(self, text: str) -> tuple[float, str | None]:
         """
@@ -179,6 +796,18 @@ class QW3GuardProvider:
         messages = [{"role": "user", "content": text}]
         return await self.moderate_messages(messages)
 
+    def estimated_wait_s(self) -> float:
+        return 0.0 if self._breaker.state == "open" else self._limiter.estimated_wait_s()
+
+    def stats(self) -> Dict[str, Any]:
+        """Client-side state: concurrency limit and queue, breaker, upstreams and hedging."""
+        return {
+            "limiter": self._limiter.stats(),
+            "breaker": self._breaker.stats(),
+            "upstreams": self._pool.stats(),
+            "hedge": dict(self.hedge_stats),
+        }
+
     async def close(self):
         """Close the aiohttp session"""
         if self.session and not self.session.closed:
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import os
+import time
+from collections import OrderedDict
+
+from ...core import metrics, timing
+from ...core.logger import logger
+from ...core.schema import PROVIDER_UNAVAILABLE
+from ..inference_server import encode_frame, read_frame
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        v = int(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        v = float(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+# EWMA weight of the newest round trip in a connection's latency estimate.
+_LATENCY_ALPHA = 0.2
+# A server-reported wait older than this no longer describes its queue.
+_WAIT_REPORT_TTL_S = 1.0
+
+
+class _Connection:
+    """One multiplexed Unix-socket connection to an inference server replica."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.inflight = 0
+        # Round-trip latency EWMA, and the server's last predicted wait with its arrival time.
+        self.latency_s: float | None = None
+        self.server_wait_s = 0.0
+        self.server_wait_at = 0.0
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._connect_lock: asyncio.Lock | None = None
+
+    def _usable(self) -> bool:
+        return (
+            self._writer is not None
+            and not self._writer.is_closing()
+            and self._loop is asyncio.get_running_loop()
+            and self._reader_task is not None
+            and not self._reader_task.done()
+        )
+
+    async def _ensure_connected(self) -> None:
+        if self._usable():
+            return
+        loop = asyncio.get_running_loop()
+        if self._connect_lock is None or self._loop is not loop:
+            self._connect_lock = asyncio.Lock()
+            self._loop = loop
+        async with self._connect_lock:
+            if self._usable():
+                return
+            reader, self._writer = await asyncio.open_unix_connection(self.path)
+            self._reader_task = loop.create_task(self._read_loop(reader))
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                resp = await read_frame(reader)
+                fut = self._pending.pop(resp.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(resp)
+        except Exception as e:
+            err = ConnectionError(f"inference server {self.path} disconnected: {e}")
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(err)
+            self._pending.clear()
+
+    def estimated_wait_s(self) -> float:
+        """The server's recent queue estimate, or the local round-trip latency while requests are in flight."""
+        wait = self.server_wait_s if time.monotonic() - self.server_wait_at < _WAIT_REPORT_TTL_S else 0.0
+        if self.inflight and self.latency_s is not None:
+            wait = max(wait, self.latency_s)
+        return wait
+
+    def _cancel_remote(self, rid: int) -> None:
+        """Tell the server to drop ``rid``; best effort, the connection may already be gone."""
+        if self._writer is None or self._writer.is_closing():
+            return
+        try:
+            self._writer.write(encode_frame({"id": rid, "op": "cancel"}))
+        except Exception:
+            pass
+
+    async def request(self, rid: int, provider: str, text: str, timeout: float) -> dict:
+        await self._ensure_connected()
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[rid] = fut
+        self.inflight += 1
+        start = time.monotonic()
+        try:
+            self._writer.write(encode_frame({"id": rid, "provider": provider, "text": text}))
+            await self._writer.drain()
+            resp = await asyncio.wait_for(fut, timeout=timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self._cancel_remote(rid)
+            raise
+        finally:
+            self.inflight -= 1
+            self._pending.pop(rid, None)
+        now = time.monotonic()
+        elapsed = now - start
+        self.latency_s = elapsed if self.latency_s is None else self.latency_s + _LATENCY_ALPHA * (elapsed - self.latency_s)
+        if "wait_s" in resp:
+            self.server_wait_s, self.server_wait_at = float(resp["wait_s"]), now
+        return resp
+
+
+class RemoteProvider:
+    """Provider proxy that forwards ``moderate`` to inference server processes.
+
+    Requests go to the replica with the fewest in-flight requests, so a slow
+    batch on one replica does not hold back the others. ``estimated_wait_s``
+    uses the queue estimate that each server returns with every response, so
+    admission control sees the queue shared by all HTTP workers. Results are
+    also kept in a local LRU cache, like the in-process providers' inference
+    cache. Repeated texts then skip the round trip, and ``cached`` can serve the
+    rules-only overload mode.
+
+    When no replica answers, the call fails open with category
+    ``PROVIDER_UNAVAILABLE``. The orchestrator then marks the ALLOW as degraded.
+    """
+
+    def __init__(self, name: str, socket_paths: list[str]) -> None:
+        self.name = name
+        self._conns = [_Connection(p) for p in socket_paths]
+        self._ids = itertools.count()
+        self._timeout_s = _env_float("SENTINELSHIELD_INFERENCE_TIMEOUT_S", 30.0)
+        self._cache: OrderedDict[bytes, tuple[float, str | None]] = OrderedDict()
+        self._cache_size = _env_int("SENTINELSHIELD_INFERENCE_CACHE_SIZE", 4096)
+        self._cache_label = f"{name}.remote"
+
+    def _cache_key(self, text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", errors="ignore"), digest_size=16).digest()
+
+    def _cache_get(self, key: bytes) -> tuple[float, str | None] | None:
+        hit = self._cache.get(key)
+        if hit is not None:
+            self._cache.move_to_end(key)
+        return hit
+
+    def _cache_put(self, key: bytes, value: tuple[float, str | None]) -> None:
+        self._cache[key] = value
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def cached(self, text: str) -> tuple[float, str | None] | None:
+        """Result for ``text`` if this worker already received it, without a round trip."""
+        return self._cache_get(self._cache_key(text))
+
+    def _choose(self) -> _Connection:
+        return min(self._conns, key=lambda c: c.inflight)
+
+    def estimated_wait_s(self) -> float:
+        """Predicted wait on the replica the next request would go to."""
+        return self._choose().estimated_wait_s()
+
+    async def moderate(self, text: str) -> tuple[float, str | None]:
+        lookup_start = time.monotonic()
+        key = self._cache_key(text)
+        hit = self._cache_get(key)
+        metrics.CACHE_LOOKUPS.labels(self._cache_label, "miss" if hit is None else "hit").inc()
+        timing.record(f"{self.name}.cache", time.monotonic() - lookup_start)
+        if hit is not None:
+            return hit
+        conn = self._choose()
+        start = time.monotonic()
+        try:
+            resp = await conn.request(next(self._ids), self.name, text, self._timeout_s)
+        except Exception as e:
+            logger.error("Error calling inference server %s for %s: %s", conn.path, self.name, e)
+            metrics.PROVIDER_ERRORS.labels(self.name).inc()
+            return 0.0, PROVIDER_UNAVAILABLE
+        metrics.PROVIDER_SECONDS.labels(self.name).observe(time.monotonic() - start)
+        if "error" in resp:
+            logger.error("Inference server %s failed for %s: %s", conn.path, self.name, resp["error"])
+            metrics.PROVIDER_ERRORS.labels(self.name).inc()
+            return 0.0, PROVIDER_UNAVAILABLE
+        result = (float(resp["score"]), resp.get("label"))
+        self._cache_put(key, result)
+        return result
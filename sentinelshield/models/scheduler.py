@@ -0,0 +1,208 @@
+"""Process-wide inference scheduler shared by all model providers.
+
+Providers no longer own thread pools or semaphores. Each registers a lane
+(name, device, weight, per-item cost) and submits blocking calls through it.
+The scheduler owns one executor per device and caps concurrent calls per
+device across every provider, so loading two models in one worker no longer
+oversubscribes cores or the NPU.
+
+When a device is saturated, waiting calls are granted in weighted-fair order
+(start-time fair queuing on device seconds): each lane is charged its estimated
+cost ``items * seconds_per_item / weight``, where ``seconds_per_item`` starts
+at the registered cost and tracks measured execution time (EWMA). A cheap
+classifier therefore keeps getting slots while a 12B model is busy, and
+neither starves the other.
+
+A lane may also name a host-side device of its own with its own executor size
+(``register(..., workers=n)``). Tokenization does this. Short tokenizer jobs
+then never queue behind a multi-second forward pass on the "cpu" device,
+which ONNX models and CPU-resident Llama Guard 4 use.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+_EWMA_ALPHA = 0.2
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        v = int(os.getenv(name, str(default)))
+        return v if v > 0 else default
+    except Exception:
+        return default
+
+
+def _env_weights(name: str) -> dict[str, float]:
+    """Parse ``"provider=weight,provider=weight"``."""
+    out: dict[str, float] = {}
+    for item in os.getenv(name, "").split(","):
+        key, _, value = item.partition("=")
+        try:
+            if key.strip() and float(value) > 0:
+                out[key.strip()] = float(value)
+        except ValueError:
+            continue
+    return out
+
+
+class _Device:
+    def __init__(self, name: str, workers: int, slots: int) -> None:
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"infer-{name}")
+        self.slots = slots
+        self.busy = 0
+        self.vclock = 0.0
+        self.waiters: list[tuple[float, int, asyncio.Future, SchedulerLane, int]] = []
+
+
+class SchedulerLane:
+    """A provider's handle on the scheduler: submit blocking calls with ``run``."""
+
+    def __init__(self, scheduler: InferenceScheduler, name: str, device: _Device, weight: float, cost: float) -> None:
+        self._scheduler = scheduler
+        self.name = name
+        self.device = device
+        self.weight = weight
+        self.seconds_per_item = cost
+        self.vtime = 0.0
+        self.inflight = 0
+        self.queued = 0
+        self.calls = 0
+        self.busy_s = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args: Any, items: int = 1) -> Any:
+        """Run ``fn(*args)`` on this lane's device executor once the scheduler grants a slot."""
+        await self._scheduler._acquire(self, items)
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        try:
+            work = self.device.executor.submit(fn, *args)
+        except BaseException:
+            self._scheduler._release(self, items, 0.0)
+            raise
+        # The slot is held until the executor call itself finishes. A cancelled
+        # caller stops waiting, but the device is busy until fn returns.
+        work.add_done_callback(lambda _: self._finished(loop, items, time.monotonic() - start))
+        return await asyncio.wrap_future(work, loop=loop)
+
+    def _finished(self, loop: asyncio.AbstractEventLoop, items: int, elapsed: float) -> None:
+        # Runs in the executor thread (or wherever the future was cancelled).
+        try:
+            loop.call_soon_threadsafe(self._scheduler._release, self, items, elapsed)
+        except RuntimeError:  # event loop already closed: nobody is left to wake
+            self._scheduler._release(self, items, elapsed)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "device": self.device.name,
+            "weight": self.weight,
+            "seconds_per_item": self.seconds_per_item,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "calls": self.calls,
+            "busy_s": self.busy_s,
+        }
+
+
+class InferenceScheduler:
+    def __init__(self, *, workers_per_device: int, slots_per_device: int, weights: dict[str, float] | None = None) -> None:
+        self._workers = max(1, workers_per_device)
+        self._slots = max(1, slots_per_device)
+        self._weights = weights or {}
+        self._devices: dict[str, _Device] = {}
+        self._lanes: dict[str, SchedulerLane] = {}
+        self._seq = itertools.count()
+
+    def device(self, name: str, workers: int | None = None) -> _Device:
+        dev = self._devices.get(name)
+        if dev is None:
+            if workers is None:
+                dev = _Device(name, self._workers, self._slots)
+            else:
+                dev = _Device(name, max(1, workers), max(1, workers))
+            self._devices[name] = dev
+        return dev
+
+    def register(
+        self, name: str, *, device: str = "cpu", weight: float = 1.0, cost: float = 0.01, workers: int | None = None
+    ) -> SchedulerLane:
+        """Register (or re-register) a provider lane.
+
+        ``cost`` is the initial estimate of device seconds per item; ``weight`` is the
+        lane's share of the device when it is contended (overridable through
+        SENTINELSHIELD_SCHEDULER_WEIGHTS="name=weight,..."). ``workers`` sizes the
+        executor and slot count of a device created here instead of the defaults.
+        """
+        lane = SchedulerLane(self, name, self.device(device, workers), self._weights.get(name, weight), cost)
+        self._lanes[name] = lane
+        return lane
+
+    def _grant(self, lane: SchedulerLane, items: int) -> None:
+        dev = lane.device
+        start = max(lane.vtime, dev.vclock)
+        lane.vtime = start + items * lane.seconds_per_item / lane.weight
+        dev.vclock = start
+        dev.busy += 1
+        lane.inflight += 1
+
+    async def _acquire(self, lane: SchedulerLane, items: int) -> None:
+        dev = lane.device
+        if dev.busy < dev.slots and not dev.waiters:
+            self._grant(lane, items)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        tag = max(lane.vtime, dev.vclock) + items * lane.seconds_per_item / lane.weight
+        heapq.heappush(dev.waiters, (tag, next(self._seq), fut, lane, items))
+        lane.queued += 1
+        try:
+            await fut  # _wake grants the slot before resolving fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Slot was granted just before cancellation: hand it on.
+                self._release(lane, items, 0.0)
+            raise
+        finally:
+            lane.queued -= 1
+
+    def _release(self, lane: SchedulerLane, items: int, elapsed: float) -> None:
+        dev = lane.device
+        dev.busy -= 1
+        lane.inflight -= 1
+        if elapsed > 0:
+            lane.calls += 1
+            lane.busy_s += elapsed
+            per_item = elapsed / max(1, items)
+            lane.seconds_per_item += _EWMA_ALPHA * (per_item - lane.seconds_per_item)
+        self._wake(dev)
+
+    def _wake(self, dev: _Device) -> None:
+        while dev.waiters and dev.busy < dev.slots:
+            _, _, fut, lane, items = heapq.heappop(dev.waiters)
+            if fut.done():
+                continue
+            try:
+                fut.set_result(None)
+            except RuntimeError:  # waiter's event loop has been closed
+                continue
+            self._grant(lane, items)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {name: lane.stats() for name, lane in self._lanes.items()}
+
+
+scheduler = InferenceScheduler(
+    workers_per_device=_env_int("SENTINELSHIELD_INFERENCE_MAX_WORKERS", 4),
+    slots_per_device=_env_int(
+        "SENTINELSHIELD_INFERENCE_CONCURRENCY",
+        _env_int("SENTINELSHIELD_INFERENCE_MAX_WORKERS", 4),
+    ),
+    weights=_env_weights("SENTINELSHIELD_SCHEDULER_WEIGHTS"),
+)
@@ -0,0 +1,114 @@
+"""Memory-mapped model weights shared across gunicorn workers.
+
+``safetensors.torch.load_file`` returns CPU tensors that are views of a private
+file mapping, so every worker reading the same file shares one page-cache copy.
+``share_mmap_weights`` rebinds a loaded model's parameters onto those views,
+releasing the per-worker anonymous copy that ``from_pretrained`` may have made.
+"""
+
+from __future__ import annotations
+
+import glob
+import itertools
+import os
+import time
+
+from ..core.logger import logger
+
+
+def mmap_enabled(device: str | None) -> bool:
+    """Weights are mmap-shared only for CPU-resident models (SENTINELSHIELD_MMAP_WEIGHTS=0 disables)."""
+    if os.getenv("SENTINELSHIELD_MMAP_WEIGHTS", "1").lower() in {"0", "false", "no"}:
+        return False
+    return device is None or str(device).startswith("cpu")
+
+
+def pretrained_kwargs() -> dict:
+    """Extra ``from_pretrained`` kwargs that avoid a transient random-init copy on load."""
+    try:
+        import transformers
+    except Exception:  # pragma: no cover - optional dependency
+        return {}
+    major = int(transformers.__version__.split(".", 1)[0])
+    # transformers>=5 always loads via the meta device; 4.x needs the explicit opt-in.
+    return {"low_cpu_mem_usage": True} if major < 5 else {}
+
+
+def mmap_state_dict(model_dir: str) -> dict:
+    """Load every ``*.safetensors`` shard in ``model_dir`` as mmap-backed CPU tensors."""
+    from safetensors.torch import load_file
+
+    state: dict = {}
+    for path in sorted(glob.glob(os.path.join(model_dir, "*.safetensors"))):
+        state.update(load_file(path, device="cpu"))
+    return state
+
+
+def share_mmap_weights(model, model_dir: str) -> int:
+    """Point ``model``'s CPU parameters/buffers at mmap-backed safetensors views.
+
+    Tensors whose name, shape and dtype match the checkpoint are rebound; the
+    rest keep their own storage. Returns the number of bytes now file-backed.
+    """
+    import torch
+
+    try:
+        state = mmap_state_dict(model_dir)
+    except Exception as e:  # pragma: no cover - optional dependency
+        logger.warning("Could not memory-map weights under '%s': %s", model_dir, e)
+        return 0
+    if not state:
+        logger.warning("No safetensors weights under '%s'; weights stay per-worker", model_dir)
+        return 0
+
+    shared = 0
+    with torch.no_grad():
+        for name, tensor in itertools.chain(model.named_parameters(), model.named_buffers()):
+            src = state.get(name)
+            if src is None or tensor.device.type != "cpu" or src.shape != tensor.shape or src.dtype != tensor.dtype:
+                continue
+            if tensor.untyped_storage().data_ptr() != src.untyped_storage().data_ptr():
+                tensor.data = src
+            shared += src.nbytes
+    return shared
+
+
+def process_memory_mb() -> dict[str, float]:
+    """Resident memory of this process split into anonymous (private) and file-backed (shared) MB."""
+    out: dict[str, float] = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in {"VmRSS", "RssAnon", "RssFile", "RssShmem"}:
+                    out[key] = int(value.split()[0]) / 1024.0
+    except OSError:  # pragma: no cover - non-Linux
+        pass
+    return out
+
+
+class LoadTimer:
+    """Measures provider cold start and logs per-worker RSS once the model is ready."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = time.monotonic()
+        self.stats: dict[str, float] = {}
+
+    def done(self, shared_bytes: int = 0) -> dict[str, float]:
+        self.stats = {
+            "load_s": time.monotonic() - self.start,
+            "mmap_shared_mb": shared_bytes / (1024.0 * 1024.0),
+            **process_memory_mb(),
+        }
+        logger.info(
+            "%s loaded in %.2fs (pid=%s rss=%.0fMB anon=%.0fMB file=%.0fMB mmap_shared=%.0fMB)",
+            self.name,
+            self.stats["load_s"],
+            os.getpid(),
+            self.stats.get("VmRSS", 0.0),
+            self.stats.get("RssAnon", 0.0),
+            self.stats.get("RssFile", 0.0),
+            self.stats["mmap_shared_mb"],
+        )
+        return self.stats
@@ -1,3 +1,6 @@
+import os
+
+import pytest
 from fastapi.testclient import TestClient
 
 from sentinelshield.api.main import app
@@ -63,3 +66,181 @@ def test_api_specific_providers():
     # The response should show it used llama_prompt_guard_2 or pipeline
     assert data["safe"] is True
 
+
+
+class _BackloggedProvider:
+    def __init__(self, wait_s):
+        self.wait_s = wait_s
+
+    def estimated_wait_s(self):
+        return self.wait_s
+
+    async def moderate(self, text):
+        return 0.0, "safe"
+
+
+def test_admission_control_rejects_with_retry_after(monkeypatch):
+    from sentinelshield.api.routers import moderation
+
+    monkeypatch.setattr(moderation.orc, "providers", [("dummy", _BackloggedProvider(12.0))])
+    resp = client.post("/v1/general-guard", json={"text": "hello"})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "7"  # 12s estimate vs 5s default deadline
+
+    # A caller with a longer remaining budget is admitted.
+    resp = client.post("/v1/general-guard", json={"text": "hello"}, headers={"X-Request-Deadline-Ms": "15000"})
+    assert resp.status_code == 200
+
+
+def test_fast_path_matches_fastapi_responses(monkeypatch):
+    from sentinelshield.api.fast_path import FastPathMiddleware
+    from sentinelshield.api.routers import moderation
+
+    fast_client = TestClient(FastPathMiddleware(app))
+    cases = [
+        ("/v1/general-guard", {"text": "bad idea"}),
+        ("/v1/prompt-guard", {"prompt": "allowed"}),
+        ("/v1/chat-guard", {"messages": [{"role": "user", "content": "how do I kill a process"}]}),
+        # Not plainly valid: replayed to FastAPI for its 400/422 answers.
+        ("/v1/chat-guard", {"messages": []}),
+        ("/v1/chat-guard", {"messages": [{"role": "robot", "content": "hi"}]}),
+        ("/v1/prompt-guard", {"text": "wrong field"}),
+    ]
+    for path, body in cases:
+        slow, fast = client.post(path, json=body), fast_client.post(path, json=body)
+        assert (fast.status_code, fast.json()) == (slow.status_code, slow.json()), path
+    resp = fast_client.post("/v1/prompt-guard", content=b"{not json", headers={"Content-Type": "application/json"})
+    assert resp.status_code == 422
+
+    monkeypatch.setattr(moderation.orc, "providers", [("dummy", _BackloggedProvider(12.0))])
+    resp = fast_client.post("/v1/general-guard", json={"text": "hello"})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "7"
+    resp = fast_client.post("/v1/general-guard", json={"text": "hello"}, headers={"X-Request-Deadline-Ms": "15000"})
+    assert resp.status_code == 200
+
+
+def test_metrics_endpoint_counts_requests_per_stage():
+    pytest.importorskip("prometheus_client")
+
+    client.post("/v1/general-guard", json={"text": "bad idea"})
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    body = resp.text
+    assert 'sentinelshield_requests_total{decision="BLOCK",endpoint="/v1/general-guard",source="model"}' in body
+    assert 'sentinelshield_stage_seconds_count{endpoint="/v1/general-guard",stage="dummy"}' in body
+    assert 'sentinelshield_stage_seconds_count{endpoint="/v1/general-guard",stage="rules"}' in body
+
+
+def test_metrics_are_aggregated_across_worker_processes(tmp_path, monkeypatch):
+    pytest.importorskip("prometheus_client")
+    import subprocess
+    import sys
+
+    script = (
+        "from sentinelshield.core import metrics\n"
+        "metrics.REQUESTS.labels('/v1/test', 'BLOCK', 'rule').inc(3)\n"
+    )
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "DISABLE_FILE_LOGGING": "1"}
+    for _ in range(2):  # two "workers"
+        subprocess.run([sys.executable, "-c", script], env=env, check=True)
+
+    from sentinelshield.core import metrics
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    body, _ = metrics.render()
+    assert b'sentinelshield_requests_total{decision="BLOCK",endpoint="/v1/test",source="rule"} 6.0' in body
+
+
+def test_server_timing_header_and_opt_in_body():
+    resp = client.post("/v1/general-guard", json={"text": "bad idea"})
+    stages = dict(part.strip().split(";dur=") for part in resp.headers["Server-Timing"].split(","))
+    assert {"rules", "dummy", "total"} <= set(stages)
+    assert "timings" not in resp.json()
+
+    resp = client.post("/v1/general-guard", json={"text": "bad idea"}, headers={"X-Debug-Timing": "1"})
+    data = resp.json()
+    assert data["decision"] == "BLOCK"
+    assert {"rules", "dummy", "total"} <= set(data["timings"])
+
+
+def _read_spans(path):
+    import orjson
+
+    spans = []
+    with open(path, "rb") as f:
+        for line in f:
+            for rs in orjson.loads(line)["resourceSpans"]:
+                for ss in rs["scopeSpans"]:
+                    spans.extend(ss["spans"])
+    return spans
+
+
+def test_request_spans_continue_incoming_traceparent(tmp_path, monkeypatch):
+    from sentinelshield.core import tracing
+
+    path = str(tmp_path / "traces.jsonl")
+    monkeypatch.setattr(tracing, "enabled", True)
+    monkeypatch.setattr(tracing, "_exporter", tracing.FileExporter(path))
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    resp = client.post(
+        "/v1/general-guard",
+        json={"text": "bad idea"},
+        headers={"traceparent": f"00-{trace_id}-{parent_id}-01"},
+    )
+    assert resp.status_code == 200
+    tracing.flush()
+
+    spans = {s["name"]: s for s in _read_spans(path)}
+    server = spans["POST /v1/general-guard"]
+    assert server["traceId"] == trace_id and server["parentSpanId"] == parent_id
+    assert server["kind"] == tracing.SERVER
+    for name in ("rules.evaluate", "provider dummy"):
+        assert spans[name]["traceId"] == trace_id
+        assert spans[name]["parentSpanId"] == server["spanId"]
+
+
+def test_profiling_endpoints_require_admin_token(monkeypatch):
+    from sentinelshield.api.routers import admin
+
+    monkeypatch.setattr(admin, "_admin_token", "")
+    assert client.get("/v1/admin/profile/cpu", params={"seconds": 0.01}).status_code == 404
+
+    monkeypatch.setattr(admin, "_admin_token", "s3cret")
+    resp = client.get("/v1/admin/profile/cpu", params={"seconds": 0.01}, headers={"X-Admin-Token": "wrong"})
+    assert resp.status_code == 403
+
+
+def test_cpu_profile_pstats_and_collapsed(tmp_path, monkeypatch):
+    import pstats
+
+    from sentinelshield.api.routers import admin
+
+    monkeypatch.setattr(admin, "_admin_token", "s3cret")
+    headers = {"X-Admin-Token": "s3cret"}
+
+    resp = client.get("/v1/admin/profile/cpu", params={"seconds": 0.05, "format": "pstats"}, headers=headers)
+    assert resp.status_code == 200
+    path = tmp_path / "worker.pstats"
+    path.write_bytes(resp.content)
+    assert pstats.Stats(str(path)).total_calls > 0
+
+    resp = client.get("/v1/admin/profile/cpu", params={"seconds": 0.05, "interval_ms": 1}, headers=headers)
+    assert resp.status_code == 200
+    stack, count = resp.text.splitlines()[0].rsplit(" ", 1)
+    assert ";" in stack and int(count) > 0
+
+
+def test_memory_profile_reports_cache_sizes(monkeypatch):
+    from sentinelshield.api.routers import admin
+
+    monkeypatch.setattr(admin, "_admin_token", "s3cret")
+    client.post("/v1/general-guard", json={"text": "bad idea"})
+    resp = client.get("/v1/admin/profile/memory", params={"seconds": 0.01}, headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert isinstance(data["top_growth"], list)
+    caches = data["caches"]
+    assert caches["rule_eval:/v1/general-guard"]["entries"] >= 1
+    assert caches["rule_eval:/v1/general-guard"]["bytes"] > 0
+    assert "rule_responses:/v1/general-guard" in caches
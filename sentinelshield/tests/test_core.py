@@ -1,6 +1,9 @@
 import asyncio
+import time
 from pathlib import Path
 
+import pytest
+
 from sentinelshield.core.orchestrator import build_orchestrator
 from sentinelshield.core.config import settings
 
@@ -26,3 +29,283 @@ def test_orchestrator_multiple_rules():
     assert resp.decision == "ALLOW"
     resp2 = asyncio.run(orc.moderate("nazi"))
     assert resp2.decision == "BLOCK"
+
+
+class _ScoreProvider:
+    def __init__(self, scores: dict[str, float]):
+        self.scores = scores
+        self.calls = 0
+
+    async def moderate(self, text: str):
+        self.calls += 1
+        return self.scores.get(text, 0.0), None
+
+
+def test_cascade_escalates_only_inside_uncertainty_band(monkeypatch):
+    from sentinelshield.core import orchestrator
+    from sentinelshield.core.config import APIConfig
+
+    cheap = _ScoreProvider({"benign": 0.01, "attack": 0.97, "unsure": 0.5})
+    expensive = _ScoreProvider({"unsure": 0.8})
+    fakes = {"cheap": cheap, "expensive": expensive}
+    monkeypatch.setattr(orchestrator.providers, "get_provider", fakes.get)
+    monkeypatch.setitem(
+        settings.api_configs,
+        "/v1/cascade-test",
+        APIConfig(providers=["cheap", "expensive"], mode="cascade", uncertainty_band=(0.1, 0.9)),
+    )
+    orc = build_orchestrator(rules_files=[Path("sentinelshield/rules/blacklist.yml")], api_path="/v1/cascade-test")
+
+    benign = asyncio.run(orc.moderate("benign"))
+    attack = asyncio.run(orc.moderate("attack"))
+    unsure = asyncio.run(orc.moderate("unsure"))
+
+    assert (benign.decision, benign.model_version) == ("ALLOW", "cheap")
+    assert (attack.decision, attack.model_version) == ("BLOCK", "cheap")
+    assert (unsure.decision, unsure.model_version) == ("BLOCK", "expensive")
+    assert [r.engine for r in unsure.reasons] == ["cheap", "expensive"]
+    assert expensive.calls == 1
+
+    stats = orc.cascade_stats()
+    assert stats["requests"] == 3
+    assert stats["escalation_rate"] == pytest.approx(1 / 3)
+    assert stats["stages"][0]["escalated"] == 1
+    assert orchestrator.orchestrators["/v1/cascade-test"] is orc
+
+
+class _SlowProvider:
+    def __init__(self, score: float, delay_s: float):
+        self.score = score
+        self.delay_s = delay_s
+        self.cancelled = False
+
+    async def moderate(self, text: str):
+        try:
+            await asyncio.sleep(self.delay_s)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.score, "x"
+
+
+def test_parallel_fan_out_cancels_rest_on_first_block(monkeypatch):
+    from sentinelshield.core import orchestrator
+    from sentinelshield.core.config import APIConfig
+
+    fakes = {"slow": _SlowProvider(0.0, 5.0), "fast_block": _SlowProvider(0.9, 0.01)}
+    monkeypatch.setattr(orchestrator.providers, "get_provider", fakes.get)
+    monkeypatch.setitem(settings.api_configs, "/v1/parallel-test", APIConfig(providers=["slow", "fast_block"], parallel=True))
+    orc = build_orchestrator(rules_files=[Path("sentinelshield/rules/blacklist.yml")], api_path="/v1/parallel-test")
+
+    async def run():
+        resp = await orc.moderate("hello")
+        await asyncio.sleep(0)
+        return resp
+
+    resp = asyncio.run(asyncio.wait_for(run(), timeout=2))
+    assert (resp.decision, resp.model_version) == ("BLOCK", "fast_block")
+    assert [r.engine for r in resp.reasons] == ["fast_block"]
+    assert fakes["slow"].cancelled
+
+
+def test_parallel_full_scan_waits_for_all_concurrently(monkeypatch):
+    from sentinelshield.core import orchestrator
+    from sentinelshield.core.config import APIConfig
+
+    fakes = {"a": _SlowProvider(0.9, 0.2), "b": _SlowProvider(0.1, 0.2), "c": _SlowProvider(0.2, 0.2)}
+    monkeypatch.setattr(orchestrator.providers, "get_provider", fakes.get)
+    monkeypatch.setitem(settings.api_configs, "/v1/full-prompt-guard", APIConfig(providers=["a", "b", "c"], parallel=True))
+    # Full scan is keyed on the real path; restore the router's orchestrator afterwards.
+    monkeypatch.setitem(orchestrator.orchestrators, "/v1/full-prompt-guard", orchestrator.orchestrators.get("/v1/full-prompt-guard"))
+    orc = build_orchestrator(rules_files=[Path("sentinelshield/rules/blacklist.yml")], api_path="/v1/full-prompt-guard")
+
+    start = time.monotonic()
+    resp = asyncio.run(orc.moderate("hello"))
+    assert time.monotonic() - start < 0.5
+    assert resp.decision == "BLOCK"
+    assert [r.engine for r in resp.reasons] == ["a", "b", "c"]
+    assert not any(p.cancelled for p in fakes.values())
+
+
+def test_full_scan_rule_block_is_not_turned_into_429(tmp_path, monkeypatch):
+    from sentinelshield.core import admission, orchestrator
+    from sentinelshield.core.config import APIConfig
+
+    class _Saturated(_ScoreProvider):
+        def estimated_wait_s(self):
+            return 30.0
+
+    saturated = _Saturated({})
+    rules = tmp_path / "rules.yml"
+    rules.write_text('- id: stop\n  when: content.match(r"\\bstop\\b")\n  then: BLOCK\n')
+    monkeypatch.setattr(admission, "enabled", True)
+    monkeypatch.setattr(orchestrator.providers, "get_provider", {"slow": saturated}.get)
+    monkeypatch.setitem(settings.api_configs, "/v1/full-prompt-guard", APIConfig(providers=["slow"]))
+    monkeypatch.setitem(orchestrator.orchestrators, "/v1/full-prompt-guard", orchestrator.orchestrators.get("/v1/full-prompt-guard"))
+    orc = build_orchestrator(rules_files=[rules], api_path="/v1/full-prompt-guard")
+
+    resp = asyncio.run(orc.moderate("please stop", deadline_s=1.0))
+    assert resp.decision == "BLOCK" and [r.id for r in resp.reasons] == ["stop"]
+    assert saturated.calls == 0
+    with pytest.raises(admission.AdmissionRejected):
+        asyncio.run(orc.moderate("hello", deadline_s=1.0))
+
+
+def test_overload_guard_hysteresis_and_degraded_time():
+    from sentinelshield.core.overload import OverloadGuard
+
+    guard = OverloadGuard("/v1/test", enter_wait_s=1.0, exit_wait_s=0.2, min_hold_s=0.05, probe_interval_s=60)
+    assert not guard.should_degrade(0.5)
+    assert guard.should_degrade(1.5)
+    assert guard.should_degrade(0.5)  # below enter but above exit: stays degraded
+    assert guard.should_degrade(0.1)  # calm, but not for min_hold_s yet
+    time.sleep(0.06)
+    assert not guard.should_degrade(0.1)
+    stats = guard.stats()
+    assert stats["transitions"] == 1 and stats["degraded_requests"] == 3
+    assert stats["degraded_seconds_total"] >= 0.05 and not stats["degraded"]
+
+
+def test_unreachable_inference_server_marks_allow_degraded(tmp_path, monkeypatch):
+    from sentinelshield.core import orchestrator
+    from sentinelshield.core.config import APIConfig
+    from sentinelshield.core.schema import PROVIDER_UNAVAILABLE
+    from sentinelshield.models.providers.remote import RemoteProvider
+
+    down = RemoteProvider("remote", [str(tmp_path / "missing.sock")])
+    monkeypatch.setattr(orchestrator.providers, "get_provider", {"remote": down}.get)
+    monkeypatch.setitem(settings.api_configs, "/v1/remote-down-test", APIConfig(providers=["remote"]))
+    monkeypatch.setitem(orchestrator.orchestrators, "/v1/remote-down-test", None)
+    orc = build_orchestrator(rules_files=[Path("sentinelshield/rules/blacklist.yml")], api_path="/v1/remote-down-test")
+
+    resp = asyncio.run(orc.moderate("hello"))
+    assert resp.decision == "ALLOW"
+    assert resp.model_version == "pipeline:degraded:provider_unavailable"
+    assert resp.reasons[0].category == PROVIDER_UNAVAILABLE
+    assert orchestrator.decision_source(resp) == "degraded"
+
+
+def test_rules_only_overload_policy_marks_degraded_and_uses_cache(monkeypatch):
+    from sentinelshield.core import orchestrator
+    from sentinelshield.core.config import APIConfig
+
+    class _Saturated(_ScoreProvider):
+        def estimated_wait_s(self):
+            return 30.0
+
+        def cached(self, text):
+            return (0.9, "injection") if text == "seen attack" else None
+
+    provider = _Saturated({})
+    monkeypatch.setattr(orchestrator.providers, "get_provider", {"model": provider}.get)
+    monkeypatch.setitem(settings.api_configs, "/v1/overload-test", APIConfig(providers=["model"], overload_policy="rules_only"))
+    monkeypatch.setenv("SENTINELSHIELD_DEGRADE_PROBE_INTERVAL_S", "60")
+    orc = build_orchestrator(rules_files=[Path("sentinelshield/rules/blacklist.yml")], api_path="/v1/overload-test")
+
+    fresh = asyncio.run(orc.moderate("hello"))
+    seen = asyncio.run(orc.moderate("seen attack"))
+    assert (fresh.decision, fresh.model_version) == ("ALLOW", "degraded:rules-only")
+    assert (seen.decision, seen.model_version) == ("BLOCK", "degraded:rules-only")
+    assert provider.calls == 0
+    assert orc.overload_stats()["degraded"]
+
+
+def test_rule_hit_responses_are_preserialized_per_ruleset_version(tmp_path):
+    import orjson
+
+    rules = tmp_path / "rules.yml"
+    rules.write_text('- id: stop\n  when: content.match(r"\\bstop\\b")\n  then: BLOCK\n')
+    orc = build_orchestrator(rules_files=[rules], api_path="/v1/test-rule-cache")
+    first = asyncio.run(orc.moderate("please stop"))
+    second = asyncio.run(orc.moderate("stop now"))
+    assert first is second
+    assert orjson.loads(first.to_json()) == {
+        "safe": False,
+        "decision": "BLOCK",
+        "reasons": [{"engine": "rule", "id": "stop", "category": None, "score": None}],
+        "policy_version": "v1",
+        "model_version": None,
+    }
+
+    # A reloaded rule set gets fresh responses.
+    rules.write_text('- id: stop\n  when: content.match(r"\\bstop\\b")\n  then: ALLOW\n')
+    orc.rule_engine._load_rules()
+    third = asyncio.run(orc.moderate("stop again"))
+    assert third is not first and third.decision == "ALLOW"
+    assert orjson.loads(third.to_json())["safe"] is True
+
+
+def test_log_writer_batches_json_lines_rotates_compressed_and_counts_drops(tmp_path):
+    import gzip
+    import logging
+    import queue
+
+    import orjson
+
+    from sentinelshield.core import logger as log
+
+    q = queue.Queue(3)
+    test_logger = logging.getLogger("sentinelshield.test-writer")
+    test_logger.propagate = False
+    test_logger.setLevel(logging.INFO)
+    handler = log._DroppingQueueHandler(q)
+    test_logger.addHandler(handler)
+    try:
+        before = log.dropped["sentinelshield.test-writer"]
+        for i in range(5):
+            log.log_event(test_logger, "moderation", endpoint="/v1/test", n=i)
+        # The queue holds 3 records; the rest are counted, not blocked on.
+        assert log.dropped["sentinelshield.test-writer"] - before == 2
+    finally:
+        test_logger.removeHandler(handler)
+
+    path = str(tmp_path / "api.log")
+    sink = log._JsonLinesFile(path, max_bytes=1, backups=2, compress=True)
+    writer = log._BatchWriter(q, {}, sink, batch_size=10, flush_interval_s=0.01)
+    writer.start()
+    q.put(log._STOP, timeout=5)
+    writer.join(timeout=5)
+    assert writer.written == 3
+    with open(path + ".1", "rb") as f:
+        lines = [orjson.loads(line) for line in f]
+    assert [line["n"] for line in lines] == [0, 1, 2]
+    assert lines[0]["msg"] == "moderation" and lines[0]["endpoint"] == "/v1/test"
+
+    # The next rotation compresses the previous backup.
+    sink.write(b'{"n": 3}\n')
+    with gzip.open(path + ".2.gz") as f:
+        assert [orjson.loads(line)["n"] for line in f] == [0, 1, 2]
+
+
+def test_log_files_shared_by_two_writers_lose_nothing_across_rotations(tmp_path):
+    import glob
+    import gzip
+    import threading
+
+    from sentinelshield.core import logger as log
+
+    path = str(tmp_path / "api.log")
+    per_writer = 2000
+
+    def run(name):
+        # Separate file objects, as in two gunicorn workers.
+        sink = log._JsonLinesFile(path, max_bytes=2000, backups=1000, compress=True)
+        for i in range(per_writer):
+            sink.write(f"{name}-{i}\n".encode())
+        sink.close()
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    lines = []
+    for name in glob.glob(path + "*"):
+        if name.endswith(".lock"):
+            continue
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(name, "rb") as f:
+            lines.extend(f.read().decode().splitlines())
+    assert len(glob.glob(path + ".*.gz")) > 1  # rotated and compressed several times
+    assert sorted(lines) == sorted(f"{n}-{i}" for n in ("a", "b") for i in range(per_writer))
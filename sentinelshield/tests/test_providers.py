@@ -0,0 +1,632 @@
+import asyncio
+import threading
+from functools import partial
+import time
+
+import pytest
+
+from sentinelshield.models.providers import base
+from sentinelshield.models.providers import llama_prompt_guard as lpg
+from sentinelshield.models.scheduler import InferenceScheduler
+
+
+class _WordTokenizer:
+    """Whitespace tokenizer exposing the HF batch-call/decode surface."""
+
+    def __init__(self) -> None:
+        self.batch_sizes: list[int] = []
+
+    def __call__(self, texts, **kwargs):
+        self.batch_sizes.append(len(texts))
+        return {"input_ids": [t.split() for t in texts]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(ids)
+
+
+def test_token_windows_batch_only_windows_long_texts():
+    tok = _WordTokenizer()
+    long_text = " ".join(f"w{i}" for i in range(512 + 10))
+    short, windows = base._token_windows_batch(tok, ["a b c", long_text], token_limit=512, window_tokens=256)
+    assert short is None
+    head, tail = windows
+    assert head.split()[0] == "w0"
+    assert len(head.split()) == 256
+    assert tail.split()[-1] == f"w{512 + 9}"
+
+
+def test_tokenization_is_batched_across_concurrent_requests():
+    tok = _WordTokenizer()
+
+    async def run():
+        batcher = base.InferenceBatcher(
+            tok,
+            lane=InferenceScheduler(workers_per_device=1, slots_per_device=1).register("tok"),
+            max_batch_size=16,
+            max_wait_ms=20,
+            batch_fn=partial(base._token_windows_batch, token_limit=512, window_tokens=256),
+        )
+        return await asyncio.gather(*(batcher.predict_one(f"text {i}") for i in range(8)))
+
+    results = asyncio.run(run())
+    assert results == [None] * 8
+    assert tok.batch_sizes == [8]
+
+
+def test_cancelled_requests_do_not_take_batch_slots():
+    tok = _WordTokenizer()
+
+    async def run():
+        batcher = base.InferenceBatcher(
+            tok,
+            lane=InferenceScheduler(workers_per_device=1, slots_per_device=1).register("tok"),
+            max_batch_size=16,
+            max_wait_ms=50,
+            batch_fn=partial(base._token_windows_batch, token_limit=512, window_tokens=256),
+        )
+        tasks = [asyncio.ensure_future(batcher.predict_one(f"text {i}")) for i in range(6)]
+        await asyncio.sleep(0)
+        for task in tasks[::2]:
+            task.cancel()
+        return await asyncio.gather(*tasks[1::2])
+
+    assert asyncio.run(run()) == [None] * 3
+    assert tok.batch_sizes == [3]
+
+
+def test_batcher_estimates_wait_from_queue_depth_and_batch_latency():
+    tok = _WordTokenizer()
+    batcher = base.InferenceBatcher(
+        tok,
+        lane=InferenceScheduler(workers_per_device=1, slots_per_device=1).register("tok"),
+        max_batch_size=4,
+        max_wait_ms=10,
+        batch_fn=partial(base._token_windows_batch, token_limit=512, window_tokens=256),
+    )
+    assert batcher.estimated_wait_s() == 0.0  # no batch latency observed yet
+    batcher.batch_latency_s = 0.2
+    batcher.pending = 9
+    # The 10th request lands in the 3rd batch of 4.
+    assert batcher.estimated_wait_s() == pytest.approx(0.01 + 3 * 0.2)
+
+
+def test_batched_requests_report_their_own_queue_and_exec_timings():
+    from sentinelshield.core import timing
+
+    tok = _WordTokenizer()
+
+    async def one(batcher, i):
+        timings, token = timing.begin()
+        try:
+            await batcher.predict_one(f"text {i}")
+            return timings.stages
+        finally:
+            timing.end(token)
+
+    async def run():
+        batcher = base.InferenceBatcher(
+            tok,
+            lane=InferenceScheduler(workers_per_device=1, slots_per_device=1).register("tok"),
+            max_batch_size=16,
+            max_wait_ms=20,
+            batch_fn=partial(base._token_windows_batch, token_limit=512, window_tokens=256),
+        )
+        return await asyncio.gather(*(one(batcher, i) for i in range(3)))
+
+    for stages in asyncio.run(run()):
+        # Each request sees exactly one queue wait and one shared batch execution.
+        assert set(stages) == {"tok.queue", "tok.exec"}
+        assert stages["tok.queue"] >= 0.0 and stages["tok.exec"] > 0.0
+
+
+def test_batch_span_links_every_request_span(tmp_path, monkeypatch):
+    import orjson
+
+    from sentinelshield.core import tracing
+
+    path = str(tmp_path / "traces.jsonl")
+    monkeypatch.setattr(tracing, "enabled", True)
+    monkeypatch.setattr(tracing, "_exporter", tracing.FileExporter(path))
+    tok = _WordTokenizer()
+
+    async def one(batcher, i):
+        with tracing.span(f"request {i}"):
+            return await batcher.predict_one(f"text {i}")
+
+    async def run():
+        batcher = base.InferenceBatcher(
+            tok,
+            lane=InferenceScheduler(workers_per_device=1, slots_per_device=1).register("tok"),
+            max_batch_size=16,
+            max_wait_ms=20,
+            batch_fn=partial(base._token_windows_batch, token_limit=512, window_tokens=256),
+        )
+        return await asyncio.gather(*(one(batcher, i) for i in range(3)))
+
+    asyncio.run(run())
+    tracing.flush()
+    with open(path, "rb") as f:
+        spans = [s for line in f for s in orjson.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    (batch,) = [s for s in spans if s["name"] == "batcher.execute"]
+    enqueues = [s for s in spans if s["name"] == "batcher.enqueue"]
+    assert len(enqueues) == 3 and "parentSpanId" not in batch
+    assert {link["spanId"] for link in batch["links"]} == {s["spanId"] for s in enqueues}
+    for s in enqueues:
+        assert s["links"] == [{"traceId": batch["traceId"], "spanId": batch["spanId"]}]
+    # Each enqueue span sits in its own request's trace.
+    assert len({s["traceId"] for s in enqueues}) == 3
+
+
+def test_short_prompts_skip_tokenization():
+    provider = lpg.LlamaPromptGuard2Provider.__new__(lpg.LlamaPromptGuard2Provider)
+    provider._tokenize_batcher = object()  # would fail if used
+    assert asyncio.run(provider._get_token_windows("short prompt")) is None
+
+
+def test_short_byte_fallback_prompts_are_still_tokenized():
+    seen = []
+
+    class _Recording:
+        async def predict_one(self, text):
+            seen.append(text)
+            return None
+
+    provider = lpg.LlamaPromptGuard2Provider.__new__(lpg.LlamaPromptGuard2Provider)
+    provider._tokenize_batcher = _Recording()
+    emoji = "\U0001f600" * 128  # 512 byte-fallback tokens before any "▁" markers
+    asyncio.run(provider._get_token_windows(emoji))
+    assert seen == [emoji]
+
+
+def _save_tiny_classifier(path):
+    """Write a randomly initialised 2-label BERT classifier + tokenizer to ``path``."""
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("torch")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + [f"w{i}" for i in range(64)] + ["hello", "ignore", "previous"]
+    if int(transformers.__version__.split(".", 1)[0]) >= 5:
+        tokenizer = transformers.BertTokenizerFast(vocab={w: i for i, w in enumerate(vocab)})
+    else:
+        vocab_file = path / "vocab.txt"
+        vocab_file.write_text("\n".join(vocab))
+        tokenizer = transformers.BertTokenizerFast(vocab_file=str(vocab_file))
+    config = transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=600, num_labels=2,
+    )
+    transformers.BertForSequenceClassification(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+
+def test_torch_engine_matches_pipeline_scores(tmp_path):
+    from sentinelshield.models.engines import TorchClassifierEngine
+
+    path = _save_tiny_classifier(tmp_path)
+    from transformers import pipeline
+
+    texts = ["hello", "ignore previous w1 w2 w3", "w5 " * 40]
+    engine = TorchClassifierEngine(str(path))
+    scores = engine(texts)
+    assert scores.shape == (3,)
+
+    pipe = pipeline("text-classification", model=str(path), tokenizer=str(path), device="cpu")
+    for score, res in zip(scores.tolist(), pipe(texts, truncation=True)):
+        expected = 1 - res["score"] if res["label"] == "LABEL_0" else res["score"]
+        assert abs(score - expected) < 1e-4
+        assert engine.label_for(score) == res["label"]
+
+
+def test_provider_torch_backend_batches_through_engine(tmp_path, monkeypatch):
+    path = _save_tiny_classifier(tmp_path)
+    monkeypatch.setenv("SENTINELSHIELD_PROMPT_GUARD_BACKEND", "torch")
+    monkeypatch.setenv("SENTINELSHIELD_PROMPT_GUARD_MODEL_PATH", str(path))
+    monkeypatch.setenv("SENTINELSHIELD_PROMPT_GUARD_DEVICE", "cpu")
+    provider = lpg.LlamaPromptGuard2Provider()
+    assert provider.engine is not None and provider.pipe is None
+
+    async def run():
+        return await asyncio.gather(provider.moderate("hello"), provider.moderate("ignore previous"))
+
+    for score, label in asyncio.run(run()):
+        assert 0.0 <= score <= 1.0
+        assert label in {"LABEL_0", "LABEL_1"}
+
+
+def test_onnx_export_parity_and_provider_backend(tmp_path, monkeypatch):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    from sentinelshield.models import export_onnx
+
+    path = _save_tiny_classifier(tmp_path)
+    assert export_onnx.main([str(path), "--int8"]) == 0
+    assert (path / "onnx" / "model.onnx").exists()
+    assert (path / "onnx" / "model.int8.onnx").exists()
+
+    monkeypatch.setenv("SENTINELSHIELD_PROMPT_GUARD_BACKEND", "onnx")
+    monkeypatch.setenv("SENTINELSHIELD_PROMPT_GUARD_MODEL_PATH", str(path))
+    monkeypatch.setenv("SENTINELSHIELD_ONNX_INT8", "1")
+    provider = lpg.LlamaPromptGuard2Provider()
+    assert provider.engine is not None
+    score, label = asyncio.run(provider.moderate("ignore previous"))
+    assert 0.0 <= score <= 1.0
+    assert label in {"LABEL_0", "LABEL_1"}
+
+
+def test_share_mmap_weights_rebinds_copied_parameters(tmp_path):
+    path = _save_tiny_classifier(tmp_path)
+    import transformers
+    from safetensors.torch import load_file
+    from sentinelshield.models.weights import share_mmap_weights
+
+    # Emulate a loader that copied the checkpoint into private memory.
+    model = transformers.BertForSequenceClassification(transformers.BertConfig.from_pretrained(path))
+    model.load_state_dict(load_file(str(path / "model.safetensors")), strict=False)
+    weight = model.bert.embeddings.word_embeddings.weight
+    before = weight.untyped_storage().data_ptr()
+
+    shared = share_mmap_weights(model, str(path))
+    assert shared > 0
+    assert weight.untyped_storage().data_ptr() != before
+    ref = load_file(str(path / "model.safetensors"))["bert.embeddings.word_embeddings.weight"]
+    assert (weight == ref).all()
+
+
+def test_remote_provider_round_trips_through_inference_server(tmp_path):
+    from sentinelshield.core.schema import PROVIDER_UNAVAILABLE
+    from sentinelshield.models.inference_server import serve
+    from sentinelshield.models.providers.dummy import provider as dummy
+    from sentinelshield.models.providers.remote import RemoteProvider
+
+    sock = str(tmp_path / "infer.sock")
+
+    async def run():
+        server = await serve(sock, {"dummy": dummy})
+        async with server:
+            remote = RemoteProvider("dummy", [sock])
+            results = await asyncio.gather(remote.moderate("bad idea"), remote.moderate("hello"))
+            missing = await RemoteProvider("llama_prompt_guard_2", [sock]).moderate("hello")
+            return results, missing
+
+    results, missing = asyncio.run(run())
+    assert results == [(1.0, "BLOCK"), (0.0, "ALLOW")]
+    assert missing == (0.0, PROVIDER_UNAVAILABLE)
+
+
+def test_remote_provider_estimated_wait_comes_from_the_server(tmp_path):
+    from sentinelshield.models.inference_server import serve
+    from sentinelshield.models.providers.remote import RemoteProvider
+
+    class _Busy:
+        async def moderate(self, text):
+            return 0.0, "ALLOW"
+
+        def estimated_wait_s(self):
+            return 2.5
+
+    sock = str(tmp_path / "infer.sock")
+
+    async def run():
+        server = await serve(sock, {"busy": _Busy()})
+        async with server:
+            remote = RemoteProvider("busy", [sock])
+            before = remote.estimated_wait_s()
+            await remote.moderate("hello")
+            return before, remote.estimated_wait_s()
+
+    assert asyncio.run(run()) == (0.0, 2.5)
+
+
+def test_remote_provider_caches_results_locally(tmp_path):
+    from sentinelshield.models.inference_server import serve
+    from sentinelshield.models.providers.remote import RemoteProvider
+
+    class _Counting:
+        calls = 0
+
+        async def moderate(self, text):
+            self.calls += 1
+            return 0.9, "BLOCK"
+
+    served = _Counting()
+    sock = str(tmp_path / "infer.sock")
+
+    async def run():
+        server = await serve(sock, {"counting": served})
+        async with server:
+            remote = RemoteProvider("counting", [sock])
+            assert remote.cached("bad") is None
+            first = await remote.moderate("bad")
+            second = await remote.moderate("bad")
+            return first, second, remote.cached("bad")
+
+    assert asyncio.run(run()) == ((0.9, "BLOCK"),) * 3
+    assert served.calls == 1
+
+
+def test_gunicorn_master_waits_for_and_restarts_inference_replicas(tmp_path, monkeypatch):
+    import importlib.util
+    import logging
+    import types
+
+    monkeypatch.setenv("DISABLE_FILE_LOGGING", "1")
+    monkeypatch.setenv("SENTINELSHIELD_INFERENCE_REPLICAS", "1")
+    monkeypatch.setenv("SENTINELSHIELD_INFERENCE_SOCKET_DIR", str(tmp_path))
+    monkeypatch.setenv("SENTINELSHIELD_INFERENCE_SOCKETS", "")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "metrics"))
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    server = types.SimpleNamespace(log=logging.getLogger("test.gunicorn"))
+
+    conf.on_starting(server)
+    try:
+        sock = conf._replica_socket(0)
+        assert conf._ping(sock)  # ready before on_starting returned
+        first = conf._inference_procs[0]
+        first.kill()
+        first.wait()
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline and conf._inference_procs[0] is first:
+            time.sleep(0.1)
+        replacement = conf._inference_procs[0]
+        assert replacement is not first
+        while time.monotonic() < deadline and not _ping_quietly(conf, sock):
+            time.sleep(0.1)
+        assert conf._ping(sock)
+    finally:
+        conf.on_exit(server)
+    assert all(p.poll() is not None for p in conf._inference_procs.values())
+
+
+def test_gunicorn_supervisor_restarts_replicas_without_waiting_for_readiness(tmp_path, monkeypatch):
+    import importlib.util
+    import logging
+    import types
+
+    monkeypatch.setenv("SENTINELSHIELD_INFERENCE_REPLICAS", "2")
+    monkeypatch.setenv("SENTINELSHIELD_INFERENCE_SOCKET_DIR", str(tmp_path))
+    monkeypatch.setenv("SENTINELSHIELD_INFERENCE_READY_TIMEOUT_S", "5")
+    monkeypatch.setenv("SENTINELSHIELD_INFERENCE_SOCKETS", "")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "metrics"))
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    server = types.SimpleNamespace(log=logging.getLogger("test.gunicorn"))
+
+    class _Proc:
+        pid, returncode = 0, None
+
+        def poll(self):
+            return self.returncode
+
+        def kill(self):
+            self.returncode = -9
+
+    def start(server, i):
+        conf._inference_procs[i] = _Proc()
+        return conf._inference_procs[i]
+
+    monkeypatch.setattr(conf, "_start_replica", start)
+    monkeypatch.setattr(conf, "_ping", lambda sock, timeout=2.0: False)  # still loading
+    for i in range(2):
+        start(server, i).returncode = 1
+
+    began = time.monotonic()
+    conf._check_replicas(server)  # both dead replicas replaced in one pass
+    assert time.monotonic() - began < 1
+    assert all(p.returncode is None for p in conf._inference_procs.values())
+    assert conf._inference_ready == {0: False, 1: False}
+
+    conf._inference_started_at[0] -= 10  # replica 0 never became ready
+    monkeypatch.setattr(conf, "_ping", lambda sock, timeout=2.0: sock.endswith("infer-1.sock"))
+    conf._check_replicas(server)
+    assert conf._inference_procs[0].returncode == -9
+    assert conf._inference_ready[1] is True
+
+
+def _ping_quietly(conf, sock):
+    try:
+        return conf._ping(sock)
+    except OSError:
+        return False
+
+
+def test_cancelled_lane_call_keeps_its_slot_until_the_work_finishes():
+    sched = InferenceScheduler(workers_per_device=2, slots_per_device=1)
+    lane = sched.register("heavy", device="npu:0", cost=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    async def run():
+        task = asyncio.create_task(lane.run(work))
+        while not started.is_set():
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        held = (lane.device.busy, lane.inflight)
+        release.set()
+        # The next caller only gets the slot once the device call returned.
+        result = await asyncio.wait_for(lane.run(lambda: "next"), timeout=5)
+        return held, result, lane.device.busy
+
+    held, result, busy_after = asyncio.run(run())
+    assert held == (1, 1)
+    assert result == "next" and busy_after == 0
+
+
+def test_tokenize_device_does_not_queue_behind_cpu_inference():
+    sched = InferenceScheduler(workers_per_device=1, slots_per_device=1)
+    heavy = sched.register("llama_guard_4_12b", device="cpu", cost=5.0)
+    tokenize = sched.register("llama_prompt_guard_2.tokenize", device="cpu:tokenize", cost=0.0005, workers=2)
+    release = threading.Event()
+
+    async def run():
+        forward = asyncio.create_task(heavy.run(release.wait, 5))
+        await asyncio.sleep(0.05)  # the forward pass holds the only "cpu" slot
+        start = time.monotonic()
+        await tokenize.run(lambda: None)
+        waited = time.monotonic() - start
+        release.set()
+        await forward
+        return waited
+
+    assert asyncio.run(run()) < 1.0
+    assert tokenize.device.slots == 2 and heavy.device.slots == 1
+
+
+def test_cancelled_remote_call_is_cancelled_on_the_inference_server(tmp_path):
+    from sentinelshield.models.inference_server import serve
+    from sentinelshield.models.providers.remote import RemoteProvider
+
+    class _Slow:
+        def __init__(self):
+            self.started = asyncio.Event()
+            self.cancelled = asyncio.Event()
+
+        async def moderate(self, text):
+            self.started.set()
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                self.cancelled.set()
+                raise
+            return 0.0, "ALLOW"
+
+    sock = str(tmp_path / "infer.sock")
+
+    async def run():
+        slow = _Slow()
+        server = await serve(sock, {"slow": slow})
+        async with server:
+            remote = RemoteProvider("slow", [sock])
+            task = asyncio.create_task(remote.moderate("hello"))
+            await asyncio.wait_for(slow.started.wait(), timeout=5)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            await asyncio.wait_for(slow.cancelled.wait(), timeout=5)
+            return remote._conns[0].inflight
+
+    assert asyncio.run(run()) == 0
+
+
+def test_scheduler_caps_device_concurrency_and_shares_between_lanes():
+    sched = InferenceScheduler(workers_per_device=4, slots_per_device=2)
+    heavy = sched.register("heavy", device="npu:0", cost=0.05)
+    light = sched.register("light", device="npu:0", cost=0.001)
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+    finished: list[str] = []
+
+    def work(name, seconds):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(seconds)
+        with lock:
+            active["now"] -= 1
+        return name
+
+    async def run():
+        async def call(lane, seconds):
+            finished.append(await lane.run(work, lane.name, seconds))
+
+        await asyncio.gather(
+            *(call(heavy, 0.05) for _ in range(6)),
+            *(call(light, 0.001) for _ in range(6)),
+        )
+
+    asyncio.run(run())
+    assert active["max"] <= 2
+    # Weighted-fair granting lets the cheap lane finish well before the heavy backlog drains.
+    assert finished.index("light") < 4
+    assert max(i for i, n in enumerate(finished) if n == "light") < len(finished) - 1
+    assert sched.stats()["heavy"]["calls"] == 6
+
+
+def test_llama_guard_4_gets_batching_cache_and_windowing_from_base(tmp_path, monkeypatch):
+    from sentinelshield.models.providers.llama_guard_4_12b import LlamaGuard4_12BProvider
+
+    path = _save_tiny_classifier(tmp_path)
+    monkeypatch.setenv("SENTINELSHIELD_LLAMA_GUARD_MODEL_PATH", str(path))
+    monkeypatch.setenv("SENTINELSHIELD_LLAMA_GUARD_BACKEND", "torch")
+
+    class _SmallWindowGuard(LlamaGuard4_12BProvider):
+        token_limit = 16
+        window_tokens = 8
+
+    provider = _SmallWindowGuard()
+    assert provider._batcher is not None and provider._tokenize_batcher is not None
+    long_text = " ".join(f"w{i}" for i in range(40))
+
+    async def run():
+        first = await asyncio.gather(provider.moderate("hello"), provider.moderate(long_text))
+        windows = await provider._get_token_windows(long_text)
+        return first, windows, await provider.moderate(long_text)
+
+    first, windows, again = asyncio.run(run())
+    assert windows == (" ".join(f"w{i}" for i in range(8)), " ".join(f"w{i}" for i in range(32, 40)))
+    assert again == first[1]
+    assert len(provider._cache) == 2
+
+
+def _save_tiny_llama_guard(path):
+    """Write a randomly initialised tiny Llama causal LM + word-level tokenizer to ``path``."""
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("torch")
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    words = ["<pad>", "<unk>", "safe", "unsafe", "S", "User:"] + [str(i) for i in range(1, 15)] + [f"w{i}" for i in range(32)]
+    vocab = {w: i for i, w in enumerate(words)}
+    tok = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    transformers.PreTrainedTokenizerFast(tokenizer_object=tok, pad_token="<pad>", unk_token="<unk>").save_pretrained(path)
+    config = transformers.LlamaConfig(
+        vocab_size=len(words), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=2, num_key_value_heads=2, max_position_embeddings=1024, pad_token_id=0,
+    )
+    transformers.LlamaForCausalLM(config).save_pretrained(path)
+    return path
+
+
+def test_llama_guard_scoring_engine_single_pass_matches_unpadded_rows(tmp_path):
+    import torch
+
+    from sentinelshield.models.engines import LlamaGuardScoringEngine
+
+    engine = LlamaGuardScoringEngine(str(_save_tiny_llama_guard(tmp_path)), prefix_cache=False)
+    texts = ["w1", "w2 w3 w4 w5 w6 w7", "w8 w9 w10"]
+    scored = engine(texts)  # one left-padded batch
+
+    for text, (score, label) in zip(texts, scored):
+        row = engine.encode([text])
+        with torch.inference_mode():
+            logits = engine.model(input_ids=row["input_ids"]).logits[0]
+        # Position predicting the first assistant token, before the "unsafe\nS" probe.
+        decision = logits[-len(engine._probe_ids) - 1, [engine._safe_id, engine._unsafe_id]]
+        assert score == pytest.approx(torch.softmax(decision, -1)[1].item(), abs=1e-4)
+        category = int(logits[-1, engine._category_ids].argmax())
+        assert label == ("safe" if score < 0.5 else f"S{category + 1}")
+
+
+def test_llama_guard_prefix_cache_matches_full_prompt(tmp_path):
+    from sentinelshield.models.engines import LlamaGuardScoringEngine
+
+    path = str(_save_tiny_llama_guard(tmp_path))
+    full = LlamaGuardScoringEngine(path, prefix_cache=False)
+    cached = LlamaGuardScoringEngine(path)
+    assert cached._prefix is not None
+    # Only the conversation and closing instructions are run per batch.
+    assert cached.encode(["w1"])["input_ids"].shape[1] == full.encode(["w1"])["input_ids"].shape[1] - len(full._preamble_ids)
+
+    texts = ["w1", "w2 w3 w4 w5 w6 w7", "w8 w9 w10"]
+    for _ in range(2):  # the shared prefix must survive reuse
+        for (got, got_label), (want, want_label) in zip(cached(texts), full(texts)):
+            assert got == pytest.approx(want, abs=1e-4)
+            assert got_label == want_label
+    assert cached(["w3"])[0][0] == pytest.approx(full(["w3"])[0][0], abs=1e-4)
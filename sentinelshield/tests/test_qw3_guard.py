@@ -0,0 +1,331 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+from sentinelshield.models.providers import qw3_guard
+
+
+def _completion(content: str) -> dict:
+    return {"choices": [{"message": {"content": content}}]}
+
+
+async def _start_upstream(handler, models=None):
+    """Serve ``handler`` on 127.0.0.1 at an ephemeral port; return (runner, api_base)."""
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handler)
+    if models is not None:
+        app.router.add_get("/v1/models", models)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def test_slow_attempt_is_hedged_and_fast_answer_wins(monkeypatch):
+    monkeypatch.setenv("QW3_GUARD_HEDGE", "1")
+    monkeypatch.setenv("QW3_GUARD_HEDGE_MAX_RATE", "1")
+    calls = []
+
+    async def handler(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            await asyncio.sleep(1.0)  # e.g. an upstream GC pause
+        return web.json_response(_completion("Safety: Unsafe\nCategories: Violent"))
+
+    async def run():
+        runner, api_base = await _start_upstream(handler)
+        monkeypatch.setenv("QW3_GUARD_API_BASE", api_base)
+        provider = qw3_guard.QW3GuardProvider()
+        for _ in range(20):
+            provider._latency.record(0.01)
+        try:
+            start = time.monotonic()
+            result = await provider.moderate("hi")
+            return result, time.monotonic() - start, provider.hedge_stats
+        finally:
+            await provider.close()
+            await runner.cleanup()
+
+    result, elapsed, stats = asyncio.run(run())
+    assert result == (1.0, "Violent")
+    assert elapsed < 0.5
+    assert len(calls) == 2
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_hedge_budget_caps_hedge_rate():
+    budget = qw3_guard._HedgeBudget(0.1, burst=1.0)
+    spent = 0
+    for _ in range(100):
+        budget.on_request()
+        spent += budget.try_spend()
+    assert spent <= 11
+
+
+def test_failing_upstream_is_ejected_and_readmitted_by_probe(monkeypatch):
+    monkeypatch.setenv("QW3_GUARD_MAX_RETRIES", "1")
+    monkeypatch.setenv("QW3_GUARD_RETRY_BASE_S", "0.001")
+    monkeypatch.setenv("QW3_GUARD_EJECT_FAILURES", "2")
+    monkeypatch.setenv("QW3_GUARD_EJECT_S", "0.2")
+    state = {"bad_healthy": False, "bad_calls": 0, "good_calls": 0}
+
+    async def bad(request):
+        state["bad_calls"] += 1
+        if state["bad_healthy"]:
+            return web.json_response(_completion("Safety: Safe"))
+        return web.Response(status=503)
+
+    async def bad_models(request):
+        return web.Response(status=200 if state["bad_healthy"] else 503)
+
+    async def good(request):
+        state["good_calls"] += 1
+        return web.json_response(_completion("Safety: Safe"))
+
+    async def run():
+        bad_runner, bad_base = await _start_upstream(bad, bad_models)
+        good_runner, good_base = await _start_upstream(good)
+        monkeypatch.setenv("QW3_GUARD_API_BASE", f"{bad_base},{good_base}")
+        provider = qw3_guard.QW3GuardProvider()
+        try:
+            results = [await provider.moderate("hi") for _ in range(10)]
+            ejected = provider._pool.stats()[bad_base]["ejected"]
+            bad_calls_while_ejected = state["bad_calls"]
+            results += [await provider.moderate("hi") for _ in range(10)]
+            assert state["bad_calls"] == bad_calls_while_ejected
+
+            state["bad_healthy"] = True
+            await asyncio.sleep(0.25)
+            await provider.moderate("hi")  # triggers the re-admission probe
+            await asyncio.sleep(0.05)
+            readmitted = not provider._pool.stats()[bad_base]["ejected"]
+            return results, ejected, bad_calls_while_ejected, readmitted
+        finally:
+            await provider.close()
+            await bad_runner.cleanup()
+            await good_runner.cleanup()
+
+    results, ejected, bad_calls, readmitted = asyncio.run(run())
+    # A retry after a failure goes to the other replica.
+    assert all(r == (0.0, "safe") for r in results)
+    assert ejected and bad_calls == 2
+    assert readmitted
+
+
+def test_least_outstanding_prefers_idle_upstream():
+    pool = qw3_guard._UpstreamPool(["http://a", "http://b"], policy="least_outstanding", eject_failures=3, eject_s=1, eject_max_s=1)
+    pool.upstreams[0].outstanding = 3
+    assert pool.choose().base == "http://b"
+    pool.policy = "ewma"
+    pool.upstreams[0].ewma_latency_s, pool.upstreams[1].ewma_latency_s = 0.01, 0.5
+    assert pool.choose().base == "http://a"
+
+
+def test_breaker_half_open_is_resolved_only_by_its_trial_call():
+    breaker = qw3_guard._CircuitBreaker(window=10, min_calls=2, error_rate=0.5, slow_call_s=10, slow_rate=1.0, open_s=0.05)
+    early_fail, early_ok, late_ok, slow_fail = (breaker.allow() for _ in range(4))
+    breaker.record(early_fail, False, 0.1)
+    breaker.record(slow_fail, False, 0.1)
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    trial = breaker.allow()
+    assert trial is not None and trial.trial
+    assert breaker.allow() is None  # one trial at a time
+
+    # Calls admitted before the breaker opened finish while the trial is in flight.
+    breaker.record(early_ok, True, 0.1)
+    assert breaker.state == "half_open"
+    breaker.record(trial, True, 0.1)
+    assert breaker.state == "closed"
+
+    breaker.record(late_ok, False, 0.1)  # a stale failure must not count against the closed circuit
+    breaker.record(breaker.allow(), False, 0.1)
+    assert breaker.state == "closed"
+    assert breaker.stats()["stale_outcomes"] == 2
+
+
+def test_circuit_opens_fails_fast_and_uses_local_fallback(monkeypatch):
+    monkeypatch.setenv("QW3_GUARD_MAX_RETRIES", "0")
+    monkeypatch.setenv("QW3_GUARD_BREAKER_MIN_CALLS", "3")
+    monkeypatch.setenv("QW3_GUARD_BREAKER_OPEN_S", "0.2")
+    monkeypatch.setenv("QW3_GUARD_FALLBACK_PROVIDER", "dummy")
+    state = {"up": False, "calls": 0}
+
+    async def handler(request):
+        state["calls"] += 1
+        if not state["up"]:
+            return web.Response(status=500)
+        return web.json_response(_completion("Safety: Safe"))
+
+    async def run():
+        runner, api_base = await _start_upstream(handler)
+        monkeypatch.setenv("QW3_GUARD_API_BASE", api_base)
+        provider = qw3_guard.QW3GuardProvider()
+        msgs = [{"role": "user", "content": "a bad idea"}]
+        try:
+            failing = [await provider.moderate_messages_with_status(msgs) for _ in range(3)]
+            opened = provider._breaker.state
+            calls_when_open = state["calls"]
+            open_result = await provider.moderate_messages_with_status(msgs)
+            assert state["calls"] == calls_when_open  # failed fast, upstream untouched
+
+            state["up"] = True
+            await asyncio.sleep(0.25)
+            recovered = await provider.moderate_messages_with_status(msgs)
+            return failing, opened, open_result, recovered, provider._breaker.state
+        finally:
+            await provider.close()
+            await runner.cleanup()
+
+    failing, opened, open_result, recovered, final_state = asyncio.run(run())
+    # The dummy fallback blocks "bad"; its verdict is used and marked degraded.
+    assert failing[0] == (1.0, "BLOCK", "dummy", "upstream_error")
+    assert opened == "open"
+    assert open_result == (1.0, "BLOCK", "dummy", "circuit_open")
+    assert recovered == (0.0, "safe", "qw3_guard", None)
+    assert final_state == "closed"
+
+
+def test_upstream_failure_without_fallback_is_marked_degraded(monkeypatch):
+    monkeypatch.setenv("QW3_GUARD_MAX_RETRIES", "0")
+    monkeypatch.delenv("QW3_GUARD_FALLBACK_PROVIDER", raising=False)
+
+    async def handler(request):
+        return web.Response(status=500)
+
+    async def run():
+        runner, api_base = await _start_upstream(handler)
+        monkeypatch.setenv("QW3_GUARD_API_BASE", api_base)
+        provider = qw3_guard.QW3GuardProvider()
+        try:
+            return await provider.moderate_messages_with_status([{"role": "user", "content": "hello"}])
+        finally:
+            await provider.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == (0.0, None, "qw3_guard", "upstream_error")
+
+
+def test_streaming_mode_stops_reading_once_verdict_is_parsed(monkeypatch):
+    monkeypatch.setenv("QW3_GUARD_STREAM", "1")
+    seen = {}
+
+    async def handler(request):
+        seen["payload"] = await request.json()
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        chunks = ["Safety: Un", "safe\n", "Categories: Violent", "\n", "Refusal: Yes\n"]
+        for chunk in chunks:
+            event = {"choices": [{"delta": {"content": chunk}}]}
+            await resp.write(f"data: {json.dumps(event)}\n\n".encode())
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(2.0)  # the rest of a long generation
+        await resp.write(b"data: [DONE]\n\n")
+        return resp
+
+    async def run():
+        runner, api_base = await _start_upstream(handler)
+        monkeypatch.setenv("QW3_GUARD_API_BASE", api_base)
+        provider = qw3_guard.QW3GuardProvider()
+        try:
+            start = time.monotonic()
+            result = await provider.moderate("hi")
+            return result, time.monotonic() - start
+        finally:
+            await provider.close()
+            await runner.cleanup()
+
+    result, elapsed = asyncio.run(run())
+    assert result == (1.0, "Violent")
+    assert elapsed < 1.0
+    assert seen["payload"]["stream"] is True and seen["payload"]["max_tokens"] == 32
+
+
+def test_verdict_complete_needs_categories_only_when_unsafe():
+    assert qw3_guard._verdict_complete("Safety: Safe\n")
+    assert not qw3_guard._verdict_complete("Safety: Safe")
+    assert not qw3_guard._verdict_complete("Safety: Unsafe\nCategories: Viol")
+    assert qw3_guard._verdict_complete("Safety: Unsafe\nCategories: Violent\n")
+
+
+def _limiter(**kw):
+    args = dict(initial=10, min_limit=2, max_limit=50, max_queue=100, queue_timeout_s=1.0, tolerance=2.0, backoff=0.5)
+    args.update(kw)
+    return qw3_guard._AdaptiveLimiter(**args)
+
+
+def test_adaptive_limiter_backs_off_on_latency_and_errors_and_recovers():
+    limiter = _limiter()
+    limiter.inflight = 10
+    limiter.on_sample(0.1, True)  # sets the baseline
+    for _ in range(30):
+        limiter.on_sample(0.1, True)
+    grown = limiter.limit
+    assert grown > 10
+
+    limiter.on_sample(1.0, True)  # 10x the baseline
+    assert limiter.limit == pytest.approx(grown * 0.5)
+    limiter.on_sample(1.0, False)  # same congestion episode: no second cut
+    assert limiter.limit == pytest.approx(grown * 0.5)
+    for _ in range(100):
+        limiter._last_drop = 0.0
+        limiter.on_sample(0.1, False)
+    assert limiter.limit == 2
+
+
+def test_adaptive_limiter_queues_then_rejects_excess_work():
+    async def run():
+        limiter = _limiter(initial=2, max_queue=1, queue_timeout_s=0.1)
+        await limiter.acquire()
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 1
+        with pytest.raises(qw3_guard.LimiterRejected):
+            await limiter.acquire()  # queue full
+        limiter.release()
+        await waiter  # granted the released slot
+        with pytest.raises(qw3_guard.LimiterRejected):
+            await limiter.acquire()  # waits past queue_timeout_s
+        return limiter.stats()
+
+    stats = asyncio.run(run())
+    assert stats == {"limit": 2, "inflight": 2, "queued": 0, "rejected": 2, "baseline_latency_s": None}
+
+
+def test_attempt_span_is_propagated_upstream_as_traceparent(tmp_path, monkeypatch):
+    from sentinelshield.core import tracing
+
+    monkeypatch.setattr(tracing, "enabled", True)
+    monkeypatch.setattr(tracing, "_exporter", tracing.FileExporter(str(tmp_path / "traces.jsonl")))
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers.get("traceparent"))
+        return web.json_response(_completion("Safety: Safe\nCategories: None"))
+
+    async def run():
+        runner, api_base = await _start_upstream(handler)
+        monkeypatch.setenv("QW3_GUARD_API_BASE", api_base)
+        provider = qw3_guard.QW3GuardProvider()
+        try:
+            with tracing.span("request") as request_span:
+                await provider.moderate("hi")
+            return request_span.context
+        finally:
+            await provider.close()
+            await runner.cleanup()
+
+    request_ctx = asyncio.run(run())
+    (traceparent,) = seen
+    version, trace_id, span_id, _ = traceparent.split("-")
+    assert version == "00" and trace_id == request_ctx.trace_id
+    assert span_id != request_ctx.span_id  # the attempt's own CLIENT span